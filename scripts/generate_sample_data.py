@@ -2,34 +2,106 @@
 
 import sys
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta
-import random
+from typing import Dict, List, Tuple
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.data_collector import DataCollector
+from src.sensors.bulk_generator import BulkSensorGenerator
+from src.database.db_connection import DatabaseManager
+from src.database.connection_pool import close_all_pools
+from src.database.partitioning import PartitionManager
 
 
-def generate_sample_data(num_sessions: int = 10, duration_per_session: int = 30):
-    collector = DataCollector("TOTEM-001")
-    
-    for i in range(num_sessions):
-        print(f"Sessão {i+1}/{num_sessions}...")
-        stats = collector.collect_and_store(duration_seconds=duration_per_session)
-        print(f"  {stats['events_stored']} eventos")
-    
-    collector.db.close()
-    print("Concluído!")
+def _plan_tasks(totem_ids: List[str], num_sessions: int, workers: int) -> List[Tuple[List[str], int]]:
+    """
+    Divide o trabalho em tarefas (totens, sessões por totem)
+    Com muitos totens divide por totem; com poucos divide as sessões
+    """
+    n_tasks = max(workers * 4, 1)
+
+    if len(totem_ids) >= n_tasks:
+        size = -(-len(totem_ids) // n_tasks)
+        return [(totem_ids[i:i + size], num_sessions) for i in range(0, len(totem_ids), size)]
+
+    parts = min(n_tasks, num_sessions) or 1
+    base, extra = divmod(num_sessions, parts)
+    return [(totem_ids, base + (1 if i < extra else 0)) for i in range(parts) if base or i < extra]
+
+
+def _generate_task(totem_ids: List[str], num_sessions: int, duration: int,
+                   start: datetime, end: datetime, seed: int) -> Dict:
+    """Executa em um processo do pool, com conexão própria e gravação em lote"""
+    db = DatabaseManager()
+    generator = BulkSensorGenerator(seed)
+    events = 0
+    sessions = 0
+
+    try:
+        for batch in generator.iter_batches(totem_ids, num_sessions, start, end, duration):
+            events += BulkSensorGenerator.load_batch(batch, db)
+            sessions += len(batch['sessions']['session_id'])
+    finally:
+        db.close()
+
+    return {'sessions': sessions, 'events': events}
+
+
+def generate_sample_data(num_sessions: int = 10, duration_per_session: int = 30,
+                         totems: int = 1, workers: int = 1, days: int = 1, seed: int = None):
+    """
+    Gera num_sessions sessões por totem, distribuídas nos últimos `days` dias
+    """
+    totem_ids = [f"TOTEM-{i:03d}" for i in range(1, totems + 1)]
+    end = datetime.now()
+    start = end - timedelta(days=days)
+    base_seed = seed if seed is not None else int(time.time())
+
+    # Com sensor_events particionada, cria as partições do período antes da carga
+    db = DatabaseManager()
+    partitions = PartitionManager(db)
+    if partitions.is_partitioned():
+        partitions.ensure_partitions(start, end)
+    db.close()
+    # Os workers abrem os próprios pools; não herdam conexões do processo pai
+    close_all_pools()
+
+    tasks = _plan_tasks(totem_ids, num_sessions, workers)
+    print(f"{len(totem_ids)} totens x {num_sessions} sessões em {len(tasks)} tarefas ({workers} workers)...")
+
+    t0 = time.perf_counter()
+    total_sessions = 0
+    total_events = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_generate_task, task_totems, task_sessions,
+                            duration_per_session, start, end, base_seed + i)
+            for i, (task_totems, task_sessions) in enumerate(tasks)
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            stats = future.result()
+            total_sessions += stats['sessions']
+            total_events += stats['events']
+            print(f"Tarefa {done}/{len(tasks)}: {stats['sessions']} sessões, {stats['events']} eventos")
+
+    elapsed = time.perf_counter() - t0
+    print(f"Concluído! {total_sessions} sessões, {total_events} eventos em {elapsed:.1f}s")
 
 
 if __name__ == "__main__":
     import argparse
-    
+
     parser = argparse.ArgumentParser(description='Gera dados de exemplo')
-    parser.add_argument('--sessions', type=int, default=10, help='Número de sessões a gerar')
+    parser.add_argument('--sessions', type=int, default=10, help='Número de sessões a gerar (por totem)')
     parser.add_argument('--duration', type=int, default=30, help='Duração de cada sessão em segundos')
-    
+    parser.add_argument('--totems', type=int, default=1, help='Número de totens (TOTEM-001..N)')
+    parser.add_argument('--workers', type=int, default=1, help='Processos em paralelo (cada um com sua conexão)')
+    parser.add_argument('--days', type=int, default=1, help='Distribui as sessões nos últimos N dias')
+    parser.add_argument('--seed', type=int, default=None, help='Seed para reprodutibilidade')
+
     args = parser.parse_args()
-    
-    generate_sample_data(args.sessions, args.duration)
 
+    generate_sample_data(args.sessions, args.duration, args.totems, args.workers, args.days, args.seed)
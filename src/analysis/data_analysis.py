@@ -2,64 +2,167 @@
 
 import sys
 import os
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple
 import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from src.database.db_connection import DatabaseManager
+from src.database.rollups import RollupManager
+from src.database.archive import ParquetArchiveReader, compact_dtypes
+from src.analysis import report_engine
+from src.analysis.report_cache import DataVersionTracker, ReportCache
+from src.analysis.report_engine import REPORT_SECTIONS, ReportContext, ReportEngine
+from src.analysis.sql_report import SqlReportBackend
+
+# Colunas de sensor_events e da sessão que podem ser selecionadas
+EVENT_COLUMNS = ['id', 'session_id', 'totem_id', 'event_type', 'value', 'duration',
+                 'touch_type', 'timestamp', 'event_uid', 'created_at']
+SESSION_COLUMNS = {
+    'session_started': 's.started_at',
+    'session_duration': 's.duration_seconds',
+}
+
+# Colunas usadas pelo relatório completo e pelo dashboard
+REPORT_COLUMNS = ['session_id', 'totem_id', 'event_type', 'value', 'duration',
+                  'touch_type', 'timestamp', 'session_duration']
+
+
+def _concat_typed(chunks: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatena blocos tipados mantendo os categóricos
+    (cada bloco tem as próprias categorias; une antes para o concat não voltar a object)
+    """
+    if len(chunks) == 1:
+        return chunks[0]
+    
+    for column in chunks[0].columns:
+        if not isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            continue
+        categories = pd.api.types.union_categoricals(
+            [chunk[column] for chunk in chunks], ignore_order=True
+        ).categories
+        dtype = pd.CategoricalDtype(categories)
+        for chunk in chunks:
+            chunk[column] = chunk[column].astype(dtype)
+    
+    return pd.concat(chunks, ignore_index=True)
 
 
 class DataAnalyzer:
     
     def __init__(self):
         self.db = DatabaseManager()
+        self.rollups = RollupManager(self.db)
+        self.archive = ParquetArchiveReader()
+        # Janelas mais antigas que a retenção do banco são lidas do arquivo Parquet
+        self.hot_retention_days = int(os.getenv('HOT_RETENTION_DAYS', 90))
+        # Linhas por bloco lido do cursor server-side
+        self.itersize = int(os.getenv('ANALYSIS_ITERSIZE', 20000))
+        self.report_engine = ReportEngine()
+        self.sql_report = SqlReportBackend(self.db)
+        # auto | memory | pushdown
+        self.report_mode = os.getenv('REPORT_MODE', 'auto')
+        self.pushdown_min_rows = int(os.getenv('PUSHDOWN_MIN_ROWS', 2000000))
+        # Seções de relatório por (totem, janela, seção), invalidadas pela versão dos dados
+        self.cache = ReportCache()
+        self.data_versions = DataVersionTracker(self.db)
+    
+    def _build_event_query(self, totem_id: Optional[str], date_filter: datetime,
+                           columns: Optional[List[str]] = None, until: datetime = None):
+        """Monta a query de eventos com apenas as colunas pedidas (None = todas)"""
+        if columns:
+            unknown = [c for c in columns if c not in EVENT_COLUMNS and c not in SESSION_COLUMNS]
+            if unknown:
+                raise ValueError(f"Colunas desconhecidas: {', '.join(unknown)}")
+            select = ', '.join(
+                f"{SESSION_COLUMNS[c]} AS {c}" if c in SESSION_COLUMNS else f"se.{c}"
+                for c in columns
+            )
+        else:
+            select = "se.*, " + ', '.join(f"{expr} AS {name}" for name, expr in SESSION_COLUMNS.items())
+        
+        conditions = ["se.timestamp >= %s"]
+        params = [date_filter]
+        if until is not None:
+            conditions.append("se.timestamp < %s")
+            params.append(until)
+        if totem_id:
+            conditions.insert(0, "se.totem_id = %s")
+            params.insert(0, totem_id)
+        
+        query = f"""
+            SELECT {select}
+            FROM sensor_events se
+            JOIN sessions s ON se.session_id = s.session_id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY se.timestamp
+        """
+        return query, tuple(params)
+    
+    def iter_dataframe_chunks(self, totem_id: str = None, days: int = 30,
+                              columns: Optional[List[str]] = None,
+                              itersize: int = None,
+                              since: datetime = None,
+                              until: datetime = None,
+                              typed: bool = False) -> Iterator[pd.DataFrame]:
+        """
+        Lê os eventos do banco em blocos de até itersize linhas (cursor server-side)
+        Cada bloco já vem com timestamps convertidos; o resultado completo nunca fica em memória
+        since/until (opcionais) substituem a janela de `days`
+        typed converte cada bloco para tipos compactos (ver compact_dtypes)
+        """
+        date_filter = since or datetime.now() - timedelta(days=days)
+        query, params = self._build_event_query(totem_id, date_filter, columns, until)
+        
+        for names, rows in self.db.stream_query(query, params, itersize or self.itersize):
+            chunk = pd.DataFrame.from_records(rows, columns=names)
+            for column in ('timestamp', 'session_started', 'created_at'):
+                if column in chunk.columns:
+                    chunk[column] = pd.to_datetime(chunk[column])
+            yield compact_dtypes(chunk, float_dtype='float64') if typed else chunk
     
-    def load_data_to_dataframe(self, totem_id: str = None, days: int = 30) -> pd.DataFrame:
+    def load_data_to_dataframe(self, totem_id: str = None, days: int = 30,
+                               columns: Optional[List[str]] = None,
+                               itersize: int = None,
+                               typed: bool = False) -> pd.DataFrame:
+        """
+        Carrega os eventos do período em um DataFrame
+        columns restringe as colunas lidas (ex.: REPORT_COLUMNS); None mantém todas
+        typed=True devolve tipos compactos: categóricos para event_type, touch_type,
+        totem_id e session_id (códigos inteiros), int16 para value e float64 no lugar de Decimal
+        """
         try:
-            date_filter = datetime.now() - timedelta(days=days)
+            now = datetime.now()
+            date_filter = now - timedelta(days=days)
             
-            if totem_id:
-                query = """
-                    SELECT 
-                        se.*,
-                        s.started_at as session_started,
-                        s.duration_seconds as session_duration
-                    FROM sensor_events se
-                    JOIN sessions s ON se.session_id = s.session_id
-                    WHERE se.totem_id = %s
-                    AND se.timestamp >= %s
-                    ORDER BY se.timestamp
-                """
-                params = (totem_id, date_filter)
-            else:
-                query = """
-                    SELECT 
-                        se.*,
-                        s.started_at as session_started,
-                        s.duration_seconds as session_duration
-                    FROM sensor_events se
-                    JOIN sessions s ON se.session_id = s.session_id
-                    WHERE se.timestamp >= %s
-                    ORDER BY se.timestamp
-                """
-                params = (date_filter,)
+            archived_df = pd.DataFrame()
+            if days > self.hot_retention_days and self.archive.has_data():
+                hot_cutoff = now - timedelta(days=self.hot_retention_days)
+                archived_df = self.archive.read(date_filter, hot_cutoff, totem_id,
+                                                columns=list(columns) if columns else None)
+                date_filter = hot_cutoff
             
-            results = self.db.execute_query(query, params)
+            chunks = list(self.iter_dataframe_chunks(totem_id, columns=columns, itersize=itersize,
+                                                     since=date_filter, typed=typed))
             
-            if not results:
-                return pd.DataFrame()
+            if not chunks:
+                return archived_df
             
-            # Converte para DataFrame
-            df = pd.DataFrame(results)
+            if typed:
+                if not archived_df.empty:
+                    chunks.insert(0, archived_df)
+                return _concat_typed(chunks)
             
-            # Converte timestamps
-            if 'timestamp' in df.columns:
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
-            if 'session_started' in df.columns:
-                df['session_started'] = pd.to_datetime(df['session_started'])
+            df = chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+            del chunks
+            
+            if not archived_df.empty:
+                # Categóricos do arquivo viram object para combinar com o resultado do banco
+                category_columns = archived_df.select_dtypes('category').columns
+                archived_df = archived_df.astype({c: object for c in category_columns})
+                df = pd.concat([archived_df, df], ignore_index=True)
             
             return df
         except Exception as e:
@@ -68,157 +171,166 @@ class DataAnalyzer:
     
     def get_descriptive_stats(self, df: pd.DataFrame) -> Dict:
         """Calcula estatísticas descritivas"""
-        if df.empty:
-            return {}
-        
-        stats = {}
-        
-        # Estatísticas por tipo de evento
-        for event_type in df['event_type'].unique():
-            type_df = df[df['event_type'] == event_type]
-            
-            if event_type in ['touch', 'presence']:
-                # Para eventos binários
-                stats[event_type] = {
-                    'total_events': len(type_df),
-                    'active_count': int(type_df['value'].sum()),
-                    'inactive_count': int((type_df['value'] == 0).sum()),
-                    'activation_rate': round(type_df['value'].mean() * 100, 2)
-                }
-            elif event_type == 'ldr':
-                # Para LDR (valores contínuos)
-                stats[event_type] = {
-                    'total_events': len(type_df),
-                    'mean': round(type_df['value'].mean(), 2),
-                    'median': round(type_df['value'].median(), 2),
-                    'std': round(type_df['value'].std(), 2),
-                    'min': int(type_df['value'].min()),
-                    'max': int(type_df['value'].max()),
-                    'q25': round(type_df['value'].quantile(0.25), 2),
-                    'q75': round(type_df['value'].quantile(0.75), 2)
-                }
-        
-        # Estatísticas de sessões
-        if 'session_duration' in df.columns:
-            sessions_df = df.groupby('session_id').first()
-            stats['sessions'] = {
-                'total_sessions': len(sessions_df),
-                'avg_duration': round(sessions_df['session_duration'].mean(), 2) if 'session_duration' in sessions_df.columns else 0,
-                'total_duration': round(sessions_df['session_duration'].sum(), 2) if 'session_duration' in sessions_df.columns else 0
-            }
-        
-        return stats
+        return report_engine.descriptive_stats(ReportContext(df, temporal=False))
     
     def analyze_touch_patterns(self, df: pd.DataFrame) -> Dict:
         """Analisa padrões de toque"""
-        touch_df = df[df['event_type'] == 'touch'].copy()
-        
-        if touch_df.empty:
-            return {}
-        
-        # Filtra apenas toques ativos
-        active_touches = touch_df[touch_df['value'] == 1]
-        
-        if active_touches.empty:
-            return {'total_touches': 0}
-        
-        # Análise por tipo de toque
-        touch_types = active_touches['touch_type'].value_counts().to_dict()
-        
-        # Análise de duração
-        durations = active_touches['duration'].dropna()
-        
-        return {
-            'total_touches': len(active_touches),
-            'touch_types': touch_types,
-            'avg_duration': round(durations.mean(), 2) if not durations.empty else 0,
-            'median_duration': round(durations.median(), 2) if not durations.empty else 0,
-            'max_duration': round(durations.max(), 2) if not durations.empty else 0,
-            'min_duration': round(durations.min(), 2) if not durations.empty else 0
-        }
+        return report_engine.touch_patterns(ReportContext(df, temporal=False))
     
     def analyze_temporal_patterns(self, df: pd.DataFrame) -> Dict:
         """Analisa padrões temporais (horário do dia, dia da semana)"""
-        if df.empty or 'timestamp' not in df.columns:
-            return {}
-        
-        df['hour'] = df['timestamp'].dt.hour
-        df['day_of_week'] = df['timestamp'].dt.day_name()
-        
-        # Padrão por hora
-        hourly = df.groupby('hour').size().to_dict()
-        
-        # Padrão por dia da semana
-        daily = df.groupby('day_of_week').size().to_dict()
-        
-        # Hora de pico
-        peak_hour = max(hourly.items(), key=lambda x: x[1])[0] if hourly else None
+        return report_engine.temporal_patterns(ReportContext(df))
+    
+    def get_temporal_patterns_from_rollups(self, totem_id: str = None, days: int = 30) -> Optional[Dict]:
+        """
+        Padrões temporais lidos de sensor_events_hourly, mais os eventos ainda não agregados
+        Só lê: a atualização dos rollups fica com a limpeza ou o cron (python -m src.database.rollups)
+        Retorna None se os rollups não estiverem disponíveis
+        """
+        try:
+            if not self.rollups.is_available():
+                return None
+            return self.rollups.temporal_patterns(totem_id, days)
+        except Exception as e:
+            print(f"Erro ao ler rollups: {e}")
+            return None
+    
+    def get_session_engagement(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Métricas por sessão (touch_count, presence_time, avg_light)"""
+        return report_engine.session_engagement(df)
+    
+    def get_percentiles_from_sketches(self, totem_id: str = None, days: int = 30) -> Optional[Dict]:
+        """
+        Percentis de LDR (mediana, q25, q75) e mediana da duração dos toques
+        lidos dos sketches horários (erro relativo <= SKETCH_ALPHA, ver quantile_sketch.py)
+        Retorna None se os rollups não estiverem disponíveis
+        """
+        try:
+            if not self.rollups.is_available():
+                return None
+            ldr = self.rollups.quantile_sketch('ldr', totem_id, days)
+            durations = self.rollups.quantile_sketch('touch_duration', totem_id, days)
+        except Exception as e:
+            print(f"Erro ao ler sketches: {e}")
+            return None
         
-        return {
-            'hourly_distribution': hourly,
-            'daily_distribution': daily,
-            'peak_hour': peak_hour,
-            'peak_hour_count': hourly.get(peak_hour, 0) if peak_hour else 0
-        }
+        percentiles = {}
+        if ldr.count:
+            percentiles['ldr'] = {
+                'median': ldr.quantile(0.5),
+                'q25': ldr.quantile(0.25),
+                'q75': ldr.quantile(0.75)
+            }
+        if durations.count:
+            percentiles['touch_duration'] = {'median': durations.quantile(0.5)}
+        return percentiles
     
     def calculate_engagement_metrics(self, df: pd.DataFrame) -> Dict:
         """Calcula métricas de engajamento"""
-        if df.empty:
-            return {}
+        return report_engine.engagement_metrics(ReportContext(df, temporal=False))
+    
+    def choose_report_mode(self, totem_id: str = None, days: int = 30) -> str:
+        """
+        'pushdown' para períodos grandes (estimativa do planejador acima de
+        pushdown_min_rows), 'memory' caso contrário
+        Janelas que alcançam o arquivo Parquet sempre usam 'memory'
+        """
+        if days > self.hot_retention_days and self.archive.has_data():
+            return 'memory'
+        try:
+            since = datetime.now() - timedelta(days=days)
+            estimated = self.sql_report.estimate_rows(totem_id, since)
+        except Exception as e:
+            print(f"Erro ao estimar linhas: {e}")
+            return 'memory'
+        return 'pushdown' if estimated >= self.pushdown_min_rows else 'memory'
+    
+    def generate_full_report(self, totem_id: str = None, days: int = 30, use_rollups: bool = True,
+                             mode: str = None) -> Dict:
+        """
+        Gera relatório completo de análise
+        mode: 'memory' (ReportEngine sobre o DataFrame), 'pushdown' (agregações no
+        Postgres) ou 'auto' (escolhe pela estimativa de linhas)
+        Seções já calculadas para a mesma versão dos dados (e mesmo mode/use_rollups) vêm do cache
+        """
+        mode = mode or self.report_mode
+        # Modo pedido (antes de resolver 'auto') e rollups mudam o resultado: entram na chave
+        options = (mode, use_rollups)
         
-        # Agrupa por sessão
-        sessions = df.groupby('session_id')
+        version = self.data_version(totem_id)
+        precomputed = {}
+        if version is not None:
+            for section in REPORT_SECTIONS:
+                found, value = self.cache.get(self.cache.key(totem_id, days, section, options), version)
+                if found:
+                    precomputed[section] = value
+            if len(precomputed) == len(REPORT_SECTIONS):
+                return {section: precomputed[section] for section in REPORT_SECTIONS}
         
-        engagement_data = []
+        if mode == 'auto':
+            mode = self.choose_report_mode(totem_id, days)
         
-        for session_id, session_df in sessions:
-            touches = session_df[session_df['event_type'] == 'touch']
-            active_touches = touches[touches['value'] == 1]
+        if use_rollups and 'temporal_patterns' not in precomputed:
+            temporal_patterns = self.get_temporal_patterns_from_rollups(totem_id, days)
+            if temporal_patterns is not None:
+                precomputed['temporal_patterns'] = temporal_patterns
+        
+        if mode == 'pushdown':
+            # Percentis dos sketches evitam ordenar o período inteiro no Postgres
+            percentiles = self.get_percentiles_from_sketches(totem_id, days) if use_rollups else None
+            since = datetime.now() - timedelta(days=days)
+            report = self.sql_report.run(totem_id, since, precomputed=precomputed, percentiles=percentiles)
+        else:
+            # Todas as seções saem de uma única varredura do DataFrame (ReportEngine)
+            df = self.load_data_to_dataframe(totem_id, days, columns=REPORT_COLUMNS, typed=True)
             
-            presence = session_df[session_df['event_type'] == 'presence']
-            active_presence = presence[presence['value'] == 1]
+            if df.empty:
+                return {'error': 'Nenhum dado encontrado'}
             
-            engagement_data.append({
-                'session_id': session_id,
-                'touch_count': len(active_touches),
-                'presence_time': len(active_presence),
-                'avg_light': session_df[session_df['event_type'] == 'ldr']['value'].mean() if 'ldr' in session_df['event_type'].values else 0
-            })
-        
-        if not engagement_data:
-            return {}
-        
-        engagement_df = pd.DataFrame(engagement_data)
-        
-        return {
-            'avg_touches_per_session': round(engagement_df['touch_count'].mean(), 2),
-            'avg_presence_time': round(engagement_df['presence_time'].mean(), 2),
-            'high_engagement_sessions': int((engagement_df['touch_count'] >= 5).sum()),
-            'low_engagement_sessions': int((engagement_df['touch_count'] < 2).sum()),
-            'engagement_rate': round((engagement_df['touch_count'] > 0).mean() * 100, 2)
-        }
-    
-    def generate_full_report(self, totem_id: str = None) -> Dict:
-        """Gera relatório completo de análise"""
+            report = self.report_engine.run(df, precomputed=precomputed)
         
-        df = self.load_data_to_dataframe(totem_id)
-        
-        if df.empty:
-            return {'error': 'Nenhum dado encontrado'}
-        
-        report = {
-            'descriptive_stats': self.get_descriptive_stats(df),
-            'touch_patterns': self.analyze_touch_patterns(df),
-            'temporal_patterns': self.analyze_temporal_patterns(df),
-            'engagement_metrics': self.calculate_engagement_metrics(df),
-            'data_period': {
-                'start': df['timestamp'].min().isoformat() if 'timestamp' in df.columns else None,
-                'end': df['timestamp'].max().isoformat() if 'timestamp' in df.columns else None,
-                'total_records': len(df)
-            }
-        }
+        if version is not None and 'error' not in report:
+            for section, value in report.items():
+                self.cache.put(self.cache.key(totem_id, days, section, options), version, value)
         
         return report
+    
+    def data_version(self, totem_id: str = None) -> Optional[Tuple[int, int]]:
+        """Versão dos dados para o cache (None desativa o cache nesta chamada)"""
+        try:
+            return self.data_versions.current(totem_id)
+        except Exception as e:
+            print(f"Erro ao ler versão dos dados: {e}")
+            return None
+    
+    def day_versions(self, totem_id: str = None, since: datetime = None) -> Optional[Dict[date, Tuple]]:
+        """
+        Versão de cada dia desde `since`: (eventos, maior id, soma dos valores, soma dos segundos do dia)
+        Muda com inserções retroativas e com remoções, correções e mudanças de horário da limpeza
+        None se a consulta falhar
+        """
+        conditions = ["timestamp >= %s"]
+        params = [since]
+        if totem_id:
+            conditions.append("totem_id = %s")
+            params.append(totem_id)
+        try:
+            rows = self.db.execute_query(
+                f"""
+                SELECT timestamp::date AS day, COUNT(*) AS events, MAX(id) AS max_id,
+                       COALESCE(SUM(value), 0) AS value_sum,
+                       COALESCE(SUM(EXTRACT(EPOCH FROM timestamp - timestamp::date)), 0) AS seconds_sum
+                FROM sensor_events
+                WHERE {' AND '.join(conditions)}
+                GROUP BY 1
+                """,
+                tuple(params)
+            )
+        except Exception as e:
+            print(f"Erro ao ler versões por dia: {e}")
+            return None
+        return {r['day']: (int(r['events']), int(r['max_id']), int(r['value_sum']), r['seconds_sum'])
+                for r in rows}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,127 @@
+# Cache de resultados de relatório
+
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import pandas as pd
+
+from src.database.db_connection import DatabaseManager
+from src.database.rollups import CHANGES_STATE
+
+
+def _estimate_size(value: Any) -> int:
+    """Tamanho aproximado em bytes (DataFrames pelo uso de memória, o resto serializado)"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 1024
+
+
+class DataVersionTracker:
+    """
+    Versão dos dados por totem: (maior sensor_events.id, contador de alterações)
+    Eventos novos de um totem mudam só a versão dele (e a versão global, usada em "Todos");
+    limpeza, retenção e rebuild dos rollups mudam o contador e, com ele, todas as versões
+    """
+
+    def __init__(self, db: DatabaseManager = None):
+        self.db = db or DatabaseManager()
+
+    def current(self, totem_id: str = None) -> Tuple[int, int]:
+        totem_filter = "WHERE totem_id = %s" if totem_id else ""
+        result = self.db.execute_query(
+            f"""
+            SELECT
+                (SELECT COALESCE(MAX(id), 0) FROM sensor_events {totem_filter}) AS max_id,
+                (SELECT COALESCE(MAX(high_water_mark), 0) FROM rollup_state WHERE name = %s) AS changes
+            """,
+            (totem_id, CHANGES_STATE) if totem_id else (CHANGES_STATE,)
+        )
+        if not result:
+            return (0, 0)
+        return (int(result[0]['max_id']), int(result[0]['changes']))
+
+
+class ReportCache:
+    """
+    Cache LRU de seções de relatório, limitado por entradas e por bytes
+    Chave: (totem, janela, opções do relatório, seção); cada entrada guarda a versão dos dados do totem
+    e é descartada quando a versão muda
+    """
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None, window_resolution: int = None):
+        self.max_entries = max_entries or int(os.getenv('REPORT_CACHE_ENTRIES', 256))
+        self.max_bytes = max_bytes or int(os.getenv('REPORT_CACHE_MAX_MB', 64)) * 1024 * 1024
+        # A janela "últimos N dias" anda com o relógio: a chave muda a cada window_resolution segundos
+        self.window_resolution = window_resolution or int(os.getenv('REPORT_CACHE_WINDOW_SECONDS', 300))
+
+        self._entries: "OrderedDict[Tuple, Tuple[Hashable, Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, totem_id: Optional[str], days: int, section: Hashable, options: Tuple = ()) -> Tuple:
+        """options: parâmetros que mudam o resultado da seção (ex.: modo e uso de rollups)"""
+        return (totem_id, days, int(time.time() // self.window_resolution), options, section)
+
+    def get(self, key: Tuple, version: Hashable) -> Tuple[bool, Any]:
+        """(encontrado, valor); entradas de versão antiga são removidas"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def put(self, key: Tuple, version: Hashable, value: Any):
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (version, value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def get_or_compute(self, key: Tuple, version: Hashable, compute: Callable[[], Any]) -> Any:
+        found, value = self.get(key, version)
+        if not found:
+            value = compute()
+            self.put(key, version, value)
+        return value
+
+    def invalidate(self, totem_id: str = None):
+        """Remove as entradas do totem (e as agregadas de todos os totens); sem totem limpa tudo"""
+        with self._lock:
+            if totem_id is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            for key in [k for k in self._entries if k[0] in (totem_id, None)]:
+                self._remove(key)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def _remove(self, key: Tuple):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
@@ -0,0 +1,227 @@
+# Motor de relatórios com varredura compartilhada
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Seções na ordem em que aparecem no relatório
+REPORT_SECTIONS = ['descriptive_stats', 'touch_patterns', 'temporal_patterns',
+                   'engagement_metrics', 'data_period']
+
+
+class ReportContext:
+    """
+    Intermediários calculados uma única vez a partir do DataFrame de eventos
+    O DataFrame de entrada nunca é alterado
+    """
+
+    def __init__(self, df: pd.DataFrame, temporal: bool = True):
+        self.df = df
+
+        # Particiona por event_type em uma passada (ordem de primeira ocorrência)
+        self.by_type: Dict[str, pd.DataFrame] = {}
+        if not df.empty and 'event_type' in df.columns:
+            positions = df.groupby('event_type', sort=False, observed=True).indices
+            for event_type in df['event_type'].unique():
+                self.by_type[event_type] = df.iloc[positions[event_type]]
+
+        # Colunas derivadas ficam fora do DataFrame original
+        self.hour: Optional[pd.Series] = None
+        self.day_of_week: Optional[pd.Series] = None
+        if temporal and not df.empty and 'timestamp' in df.columns:
+            self.hour = df['timestamp'].dt.hour
+            self.day_of_week = df['timestamp'].dt.day_name()
+
+    def events(self, event_type: str) -> pd.DataFrame:
+        return self.by_type.get(event_type, self.df.iloc[0:0])
+
+
+def session_engagement(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Métricas por sessão em uma única agregação agrupada
+    Colunas: touch_count (toques ativos), presence_time (presenças ativas)
+    e avg_light (média do LDR, 0 sem leituras)
+    """
+    valid = df['session_id'].notna()
+    event_type = df['event_type']
+    active = df['value'] == 1
+
+    flags = pd.DataFrame({
+        'session_id': df['session_id'],
+        'touch_count': ((event_type == 'touch') & active).astype(np.int64),
+        'presence_time': ((event_type == 'presence') & active).astype(np.int64),
+        'avg_light': df['value'].where(event_type == 'ldr')
+    })[valid]
+
+    engagement_df = flags.groupby('session_id', observed=True).agg({
+        'touch_count': 'sum',
+        'presence_time': 'sum',
+        'avg_light': 'mean'
+    })
+    engagement_df['avg_light'] = engagement_df['avg_light'].fillna(0)
+    return engagement_df.reset_index()
+
+
+# Seções ---------------------------------------------------------------
+
+def descriptive_stats(ctx: ReportContext) -> Dict:
+    """Estatísticas descritivas por tipo de evento e de sessões"""
+    df = ctx.df
+    if df.empty:
+        return {}
+
+    stats = {}
+
+    for event_type, type_df in ctx.by_type.items():
+        if event_type in ['touch', 'presence']:
+            # Para eventos binários
+            stats[event_type] = {
+                'total_events': len(type_df),
+                'active_count': int(type_df['value'].sum()),
+                'inactive_count': int((type_df['value'] == 0).sum()),
+                'activation_rate': round(type_df['value'].mean() * 100, 2)
+            }
+        elif event_type == 'ldr':
+            # Para LDR (valores contínuos)
+            values = type_df['value']
+            stats[event_type] = {
+                'total_events': len(type_df),
+                'mean': round(values.mean(), 2),
+                'median': round(values.median(), 2),
+                'std': round(values.std(), 2),
+                'min': int(values.min()),
+                'max': int(values.max()),
+                'q25': round(values.quantile(0.25), 2),
+                'q75': round(values.quantile(0.75), 2)
+            }
+
+    # Estatísticas de sessões (primeira duração não nula de cada sessão)
+    if 'session_duration' in df.columns:
+        durations = df.groupby('session_id', observed=True)['session_duration'].first()
+        stats['sessions'] = {
+            'total_sessions': len(durations),
+            'avg_duration': round(durations.mean(), 2),
+            'total_duration': round(durations.sum(), 2)
+        }
+
+    return stats
+
+
+def touch_patterns(ctx: ReportContext) -> Dict:
+    """Padrões de toque (tipos e durações dos toques ativos)"""
+    touch_df = ctx.events('touch')
+
+    if touch_df.empty:
+        return {}
+
+    active_touches = touch_df[touch_df['value'] == 1]
+
+    if active_touches.empty:
+        return {'total_touches': 0}
+
+    # Em colunas categóricas value_counts também lista categorias sem ocorrência
+    touch_types = active_touches['touch_type'].value_counts()
+    touch_types = touch_types[touch_types > 0].to_dict()
+    durations = active_touches['duration'].dropna()
+
+    return {
+        'total_touches': len(active_touches),
+        'touch_types': touch_types,
+        'avg_duration': round(durations.mean(), 2) if not durations.empty else 0,
+        'median_duration': round(durations.median(), 2) if not durations.empty else 0,
+        'max_duration': round(durations.max(), 2) if not durations.empty else 0,
+        'min_duration': round(durations.min(), 2) if not durations.empty else 0
+    }
+
+
+def temporal_patterns(ctx: ReportContext) -> Dict:
+    """Distribuição por hora do dia e dia da semana"""
+    if ctx.hour is None:
+        return {}
+
+    hourly = ctx.hour.groupby(ctx.hour).size().to_dict()
+    daily = ctx.day_of_week.groupby(ctx.day_of_week).size().to_dict()
+
+    peak_hour = max(hourly.items(), key=lambda x: x[1])[0] if hourly else None
+
+    return {
+        'hourly_distribution': hourly,
+        'daily_distribution': daily,
+        'peak_hour': peak_hour,
+        'peak_hour_count': hourly.get(peak_hour, 0) if peak_hour else 0
+    }
+
+
+def engagement_metrics(ctx: ReportContext) -> Dict:
+    """Métricas de engajamento a partir das métricas por sessão"""
+    if ctx.df.empty:
+        return {}
+
+    engagement_df = session_engagement(ctx.df)
+
+    if engagement_df.empty:
+        return {}
+
+    return {
+        'avg_touches_per_session': round(engagement_df['touch_count'].mean(), 2),
+        'avg_presence_time': round(engagement_df['presence_time'].mean(), 2),
+        'high_engagement_sessions': int((engagement_df['touch_count'] >= 5).sum()),
+        'low_engagement_sessions': int((engagement_df['touch_count'] < 2).sum()),
+        'engagement_rate': round((engagement_df['touch_count'] > 0).mean() * 100, 2)
+    }
+
+
+def data_period(ctx: ReportContext) -> Dict:
+    df = ctx.df
+    has_timestamp = 'timestamp' in df.columns
+    return {
+        'start': df['timestamp'].min().isoformat() if has_timestamp else None,
+        'end': df['timestamp'].max().isoformat() if has_timestamp else None,
+        'total_records': len(df)
+    }
+
+
+SECTION_FUNCTIONS: Dict[str, Callable[[ReportContext], Dict]] = {
+    'descriptive_stats': descriptive_stats,
+    'touch_patterns': touch_patterns,
+    'temporal_patterns': temporal_patterns,
+    'engagement_metrics': engagement_metrics,
+    'data_period': data_period,
+}
+
+
+class ReportEngine:
+    """
+    Gera o relatório completo a partir de um único ReportContext
+    Com max_workers > 1 as seções independentes rodam em threads
+    """
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers if max_workers is not None else int(os.getenv('REPORT_THREADS', 1))
+
+    def run(self, df: pd.DataFrame, precomputed: Dict[str, Dict] = None,
+            sections: List[str] = None) -> Dict:
+        """
+        Calcula as seções pedidas (todas por padrão)
+        precomputed fornece seções já prontas (ex.: temporal_patterns dos rollups)
+        """
+        precomputed = precomputed or {}
+        sections = sections or REPORT_SECTIONS
+        pending = [name for name in sections if name not in precomputed]
+
+        ctx = ReportContext(df, temporal='temporal_patterns' in pending)
+
+        if self.max_workers > 1 and len(pending) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending))) as executor:
+                futures = {name: executor.submit(SECTION_FUNCTIONS[name], ctx) for name in pending}
+                results = {name: future.result() for name, future in futures.items()}
+        else:
+            results = {name: SECTION_FUNCTIONS[name](ctx) for name in pending}
+
+        return {
+            name: precomputed[name] if name in precomputed else results[name]
+            for name in sections
+        }
@@ -0,0 +1,464 @@
+# Janela deslizante incremental (agregados parciais por dia)
+
+import math
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+EVENT_TYPES = ['touch', 'presence', 'ldr']
+TOUCH, PRESENCE, LDR = range(len(EVENT_TYPES))
+MINUTES_PER_DAY = 24 * 60
+
+# Colunas lidas para montar um dia
+WINDOW_COLUMNS = ['session_id', 'event_type', 'value', 'duration', 'touch_type',
+                  'timestamp', 'session_duration']
+
+SESSION_FIELDS = ['touch_count', 'presence_time', 'session_duration', 'days']
+
+
+def _add_counts(a: pd.Series, b: pd.Series, sign: int = 1) -> pd.Series:
+    """Soma (ou subtrai) contagens por valor e remove os valores zerados"""
+    if b.empty:
+        return a
+    result = a.add(b * sign, fill_value=0) if not a.empty else b * sign
+    return result[result != 0].sort_index()
+
+
+def _quantile(counts: pd.Series, q: float) -> float:
+    """Quantil com interpolação linear (como pandas) a partir de contagens por valor"""
+    n = int(counts.sum())
+    position = q * (n - 1)
+    lower = math.floor(position)
+    cumulative = counts.to_numpy().cumsum()
+    values = counts.index.to_numpy()
+    v_lower = values[np.searchsorted(cumulative, lower, side='right')]
+    v_upper = values[np.searchsorted(cumulative, min(lower + 1, n - 1), side='right')]
+    return float(v_lower + (v_upper - v_lower) * (position - lower))
+
+
+class DayPartial:
+    """Agregados de um dia: tudo que o dashboard e o relatório precisam, sem as linhas"""
+
+    def __init__(self, day: date):
+        self.day = day
+        n = len(EVENT_TYPES)
+        self.total = 0
+        self.type_count = np.zeros(n, dtype=np.int64)
+        self.active_count = np.zeros(n, dtype=np.int64)
+        self.inactive_count = np.zeros(n, dtype=np.int64)
+        self.value_sum = np.zeros(n, dtype=np.int64)
+        self.value_sumsq = np.zeros(n, dtype=np.int64)
+        self.first_seen: List[Optional[pd.Timestamp]] = [None] * n
+        self.first_ts: Optional[pd.Timestamp] = None
+        self.last_ts: Optional[pd.Timestamp] = None
+
+        # Contagem por minuto do dia e tipo; soma do LDR por minuto
+        self.minute_counts = np.zeros((MINUTES_PER_DAY, n), dtype=np.int64)
+        self.ldr_minute_sum = np.zeros(MINUTES_PER_DAY, dtype=np.int64)
+
+        # Histogramas exatos (contagem por valor)
+        self.ldr_values = pd.Series(dtype=np.int64)
+        self.touch_durations = pd.Series(dtype=np.int64)
+        self.touch_types = pd.Series(dtype=np.int64)
+
+        self._session_chunks: List[pd.DataFrame] = []
+        self.sessions = pd.DataFrame(columns=SESSION_FIELDS)
+
+    def add(self, chunk: pd.DataFrame):
+        """Acumula um bloco de eventos do dia"""
+        if chunk.empty:
+            return
+
+        timestamps = pd.to_datetime(chunk['timestamp'])
+        values = chunk['value'].to_numpy(dtype=np.int64)
+        codes = pd.Categorical(chunk['event_type'], categories=EVENT_TYPES).codes
+        known = codes >= 0
+
+        self.total += len(chunk)
+        self.type_count += np.bincount(codes[known], minlength=len(EVENT_TYPES))
+        self.active_count += np.bincount(codes[known & (values == 1)], minlength=len(EVENT_TYPES))
+        self.inactive_count += np.bincount(codes[known & (values == 0)], minlength=len(EVENT_TYPES))
+        self.value_sum += np.bincount(codes[known], weights=values[known],
+                                      minlength=len(EVENT_TYPES)).astype(np.int64)
+        for i in range(len(EVENT_TYPES)):
+            type_values = values[codes == i]
+            self.value_sumsq[i] += int(np.dot(type_values, type_values))
+            if len(type_values):
+                first = timestamps[codes == i].min()
+                if self.first_seen[i] is None or first < self.first_seen[i]:
+                    self.first_seen[i] = first
+
+        chunk_first, chunk_last = timestamps.min(), timestamps.max()
+        self.first_ts = chunk_first if self.first_ts is None else min(self.first_ts, chunk_first)
+        self.last_ts = chunk_last if self.last_ts is None else max(self.last_ts, chunk_last)
+
+        minutes = (timestamps.dt.hour * 60 + timestamps.dt.minute).to_numpy()
+        np.add.at(self.minute_counts, (minutes[known], codes[known]), 1)
+        is_ldr = codes == LDR
+        self.ldr_minute_sum += np.bincount(minutes[is_ldr], weights=values[is_ldr],
+                                           minlength=MINUTES_PER_DAY).astype(np.int64)
+
+        self.ldr_values = _add_counts(self.ldr_values, pd.Series(values[is_ldr]).value_counts())
+
+        active_touch = (codes == TOUCH) & (values == 1)
+        touches = chunk[active_touch]
+        durations = pd.to_numeric(touches['duration'], errors='coerce').dropna().astype(float)
+        self.touch_durations = _add_counts(self.touch_durations, durations.value_counts())
+        self.touch_types = _add_counts(self.touch_types, touches['touch_type'].value_counts())
+
+        # Sessões indexadas por id (object) para mesclar dias com categorias diferentes
+        sessions = pd.DataFrame({
+            'session_id': chunk['session_id'].astype(object),
+            'touch_count': active_touch.astype(np.int64),
+            'presence_time': ((codes == PRESENCE) & (values == 1)).astype(np.int64),
+            'session_duration': pd.to_numeric(chunk['session_duration'], errors='coerce')
+        })
+        self._session_chunks.append(
+            sessions.groupby('session_id').agg({'touch_count': 'sum', 'presence_time': 'sum',
+                                                'session_duration': 'first'})
+        )
+
+    def finish(self) -> 'DayPartial':
+        """Consolida as sessões dos blocos lidos"""
+        if self._session_chunks:
+            combined = pd.concat(self._session_chunks)
+            self.sessions = combined.groupby(level=0).agg({
+                'touch_count': 'sum', 'presence_time': 'sum', 'session_duration': 'first'
+            })
+            self.sessions['days'] = 1
+        self._session_chunks = []
+        return self
+
+
+class WindowAggregate:
+    """
+    Soma de DayPartials da janela atual
+    Dias entram e saem com add/subtract, sem revisitar os demais
+    """
+
+    def __init__(self):
+        n = len(EVENT_TYPES)
+        self.partials: Dict[date, DayPartial] = {}
+        self.total = 0
+        self.type_count = np.zeros(n, dtype=np.int64)
+        self.active_count = np.zeros(n, dtype=np.int64)
+        self.inactive_count = np.zeros(n, dtype=np.int64)
+        self.value_sum = np.zeros(n, dtype=np.int64)
+        self.value_sumsq = np.zeros(n, dtype=np.int64)
+        self.hourly = np.zeros(24, dtype=np.int64)
+        self.weekday = np.zeros(7, dtype=np.int64)
+        self.ldr_values = pd.Series(dtype=np.int64)
+        self.touch_durations = pd.Series(dtype=np.int64)
+        self.touch_types = pd.Series(dtype=np.int64)
+        self.sessions = pd.DataFrame(columns=SESSION_FIELDS)
+
+    def _apply(self, partial: DayPartial, sign: int):
+        self.total += sign * partial.total
+        self.type_count += sign * partial.type_count
+        self.active_count += sign * partial.active_count
+        self.inactive_count += sign * partial.inactive_count
+        self.value_sum += sign * partial.value_sum
+        self.value_sumsq += sign * partial.value_sumsq
+        self.hourly += sign * partial.minute_counts.sum(axis=1).reshape(24, 60).sum(axis=1)
+        self.weekday[partial.day.weekday()] += sign * int(partial.minute_counts.sum())
+        self.ldr_values = _add_counts(self.ldr_values, partial.ldr_values, sign)
+        self.touch_durations = _add_counts(self.touch_durations, partial.touch_durations, sign)
+        self.touch_types = _add_counts(self.touch_types, partial.touch_types, sign)
+
+        if not partial.sessions.empty:
+            delta = partial.sessions.copy()
+            for column in ('touch_count', 'presence_time', 'days'):
+                delta[column] *= sign
+            # Sessões que cruzam a meia-noite somam as partes de cada dia
+            merged = pd.concat([self.sessions, delta]) if not self.sessions.empty else delta
+            merged = merged.groupby(level=0).agg({
+                'touch_count': 'sum', 'presence_time': 'sum', 'session_duration': 'first', 'days': 'sum'
+            })
+            self.sessions = merged[merged['days'] > 0]
+
+    def add(self, partial: DayPartial):
+        self.partials[partial.day] = partial
+        self._apply(partial, 1)
+
+    def subtract(self, day: date):
+        partial = self.partials.pop(day, None)
+        if partial is not None:
+            self._apply(partial, -1)
+
+    # Relatório ---------------------------------------------------------
+
+    def headline(self) -> Dict:
+        """Métricas principais do dashboard"""
+        ldr_count = int(self.type_count[LDR])
+        return {
+            'total_events': self.total,
+            'total_sessions': len(self.sessions),
+            'touch_events': int(self.active_count[TOUCH]),
+            'avg_light': int(self.value_sum[LDR]) / ldr_count if ldr_count else 0
+        }
+
+    def report(self) -> Dict:
+        """Mesmo formato de ReportEngine.run"""
+        if not self.total:
+            return {'error': 'Nenhum dado encontrado'}
+        return {
+            'descriptive_stats': self.descriptive_stats(),
+            'touch_patterns': self.touch_patterns(),
+            'temporal_patterns': self.temporal_patterns(),
+            'engagement_metrics': self.engagement_metrics(),
+            'data_period': self.data_period()
+        }
+
+    def _first_seen(self, index: int) -> pd.Timestamp:
+        seen = [p.first_seen[index] for p in self.partials.values() if p.first_seen[index] is not None]
+        return min(seen) if seen else pd.Timestamp.max
+
+    def descriptive_stats(self) -> Dict:
+        stats = {}
+        present = [i for i in range(len(EVENT_TYPES)) if self.type_count[i]]
+        for i in sorted(present, key=self._first_seen):
+            n = int(self.type_count[i])
+            if i in (TOUCH, PRESENCE):
+                stats[EVENT_TYPES[i]] = {
+                    'total_events': n,
+                    'active_count': int(self.value_sum[i]),
+                    'inactive_count': int(self.inactive_count[i]),
+                    'activation_rate': round(int(self.value_sum[i]) / n * 100, 2)
+                }
+            else:
+                total, total_sq = int(self.value_sum[i]), int(self.value_sumsq[i])
+                variance = (n * total_sq - total * total) / (n * (n - 1)) if n > 1 else float('nan')
+                stats[EVENT_TYPES[i]] = {
+                    'total_events': n,
+                    'mean': round(total / n, 2),
+                    'median': round(_quantile(self.ldr_values, 0.5), 2),
+                    'std': round(math.sqrt(variance), 2) if n > 1 else variance,
+                    'min': int(self.ldr_values.index.min()),
+                    'max': int(self.ldr_values.index.max()),
+                    'q25': round(_quantile(self.ldr_values, 0.25), 2),
+                    'q75': round(_quantile(self.ldr_values, 0.75), 2)
+                }
+
+        durations = self.sessions['session_duration'].astype(float)
+        stats['sessions'] = {
+            'total_sessions': len(self.sessions),
+            'avg_duration': round(durations.mean(), 2),
+            'total_duration': round(durations.sum(), 2)
+        }
+        return stats
+
+    def touch_patterns(self) -> Dict:
+        if not self.type_count[TOUCH]:
+            return {}
+        total_touches = int(self.active_count[TOUCH])
+        if not total_touches:
+            return {'total_touches': 0}
+
+        durations = self.touch_durations
+        has_durations = not durations.empty
+        mean = float((durations.index.to_numpy() * durations.to_numpy()).sum() / durations.sum()) if has_durations else 0
+        return {
+            'total_touches': total_touches,
+            'touch_types': {k: int(v) for k, v in self.touch_types.sort_values(ascending=False, kind='stable').items()},
+            'avg_duration': round(mean, 2),
+            'median_duration': round(_quantile(durations, 0.5), 2) if has_durations else 0,
+            'max_duration': round(float(durations.index.max()), 2) if has_durations else 0,
+            'min_duration': round(float(durations.index.min()), 2) if has_durations else 0
+        }
+
+    def temporal_patterns(self) -> Dict:
+        hourly = {hour: int(count) for hour, count in enumerate(self.hourly) if count}
+        weekday_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+        daily = {weekday_names[d]: int(c) for d, c in enumerate(self.weekday) if c}
+        peak_hour = max(hourly.items(), key=lambda x: x[1])[0] if hourly else None
+        return {
+            'hourly_distribution': hourly,
+            'daily_distribution': dict(sorted(daily.items())),
+            'peak_hour': peak_hour,
+            'peak_hour_count': hourly.get(peak_hour, 0) if peak_hour else 0
+        }
+
+    def engagement_metrics(self) -> Dict:
+        sessions = self.sessions
+        if sessions.empty:
+            return {}
+        touch_count = sessions['touch_count'].astype(np.int64)
+        return {
+            'avg_touches_per_session': round(touch_count.mean(), 2),
+            'avg_presence_time': round(sessions['presence_time'].astype(np.int64).mean(), 2),
+            'high_engagement_sessions': int((touch_count >= 5).sum()),
+            'low_engagement_sessions': int((touch_count < 2).sum()),
+            'engagement_rate': round((touch_count > 0).mean() * 100, 2)
+        }
+
+    def data_period(self) -> Dict:
+        firsts = [p.first_ts for p in self.partials.values() if p.first_ts is not None]
+        lasts = [p.last_ts for p in self.partials.values() if p.last_ts is not None]
+        return {
+            'start': min(firsts).isoformat() if firsts else None,
+            'end': max(lasts).isoformat() if lasts else None,
+            'total_records': self.total
+        }
+
+    # Séries para gráficos ---------------------------------------------
+
+    def _minute_frame(self) -> pd.DataFrame:
+        frames = []
+        for day in sorted(self.partials):
+            partial = self.partials[day]
+            if not partial.total:
+                continue
+            base = pd.Timestamp(day)
+            frame = pd.DataFrame(partial.minute_counts, columns=EVENT_TYPES)
+            frame['ldr_sum'] = partial.ldr_minute_sum
+            frame.index = base + pd.to_timedelta(np.arange(MINUTES_PER_DAY), unit='min')
+            frames.append(frame[frame[EVENT_TYPES].sum(axis=1) > 0])
+        return pd.concat(frames) if frames else pd.DataFrame(columns=EVENT_TYPES + ['ldr_sum'])
+
+    def _frequency(self) -> str:
+        period = self.data_period()
+        if period['start'] is None:
+            return 'min'
+        span = (pd.Timestamp(period['end']) - pd.Timestamp(period['start'])).total_seconds()
+        return 'H' if span > 3600 else 'min'
+
+    def event_series(self, event_types: List[str] = ('touch', 'presence')) -> pd.DataFrame:
+        """(timestamp, event_type, count) por hora, ou por minuto em janelas curtas"""
+        minutes = self._minute_frame()
+        if minutes.empty:
+            return pd.DataFrame(columns=['timestamp', 'event_type', 'count'])
+        grouped = minutes[list(event_types)].resample(self._frequency()).sum()
+        series = grouped.rename_axis('timestamp').reset_index().melt(
+            id_vars='timestamp', var_name='event_type', value_name='count'
+        )
+        return series[series['count'] > 0].sort_values(['timestamp', 'event_type']).reset_index(drop=True)
+
+    def ldr_series(self) -> pd.DataFrame:
+        """(timestamp, value) com a média do LDR por hora, ou por minuto em janelas curtas"""
+        minutes = self._minute_frame()
+        if minutes.empty:
+            return pd.DataFrame(columns=['timestamp', 'value'])
+        grouped = minutes[['ldr', 'ldr_sum']].resample(self._frequency()).sum()
+        grouped = grouped[grouped['ldr'] > 0]
+        return pd.DataFrame({
+            'timestamp': grouped.index,
+            'value': grouped['ldr_sum'] / grouped['ldr']
+        }).reset_index(drop=True)
+
+
+class SlidingWindowManager:
+    """
+    Mantém a janela "últimos N dias + hoje" de um totem (ou de todos)
+    Dias passados são lidos uma vez e reaproveitados; mudar N só lê/remove os dias da borda
+    Quando a versão dos dados muda (eventos novos ou qualquer escrita da limpeza,
+    ver DataVersionTracker), compara a versão de cada dia em memória
+    (DataAnalyzer.day_versions) e relê só os dias alterados: o corrente, inserções
+    retroativas e correções da limpeza. Dias vindos do arquivo Parquet não mudam
+    """
+
+    def __init__(self, analyzer, totem_id: str = None, max_days: int = None):
+        self.analyzer = analyzer
+        self.totem_id = totem_id
+        # Dias mantidos em memória fora da janela (para voltar a crescer sem reler)
+        self.max_days = max_days or int(os.getenv('WINDOW_MAX_DAYS', 90))
+        self.window = WindowAggregate()
+        self._cache: Dict[date, DayPartial] = {}
+        # Versão de cada dia do banco em _cache (ausente = dia sem eventos)
+        self._day_versions: Dict[date, Tuple] = {}
+        self._today: Optional[date] = None
+        self._version = None
+        self.days_loaded = 0
+
+    def _load_day(self, day: date) -> DayPartial:
+        start = datetime.combine(day, time.min)
+        end = start + timedelta(days=1)
+        partial = DayPartial(day)
+
+        archive = self.analyzer.archive
+        hot_cutoff = datetime.now() - timedelta(days=self.analyzer.hot_retention_days)
+        if start < hot_cutoff and archive.has_data():
+            partial.add(archive.read(start, min(end, hot_cutoff), self.totem_id, columns=list(WINDOW_COLUMNS)))
+            start = hot_cutoff
+        if start < end:
+            for chunk in self.analyzer.iter_dataframe_chunks(self.totem_id, columns=WINDOW_COLUMNS,
+                                                             since=start, until=end, typed=True):
+                partial.add(chunk)
+
+        self.days_loaded += 1
+        return partial.finish()
+
+    def _partial(self, day: date) -> DayPartial:
+        if day not in self._cache:
+            self._cache[day] = self._load_day(day)
+        return self._cache[day]
+
+    def _drop(self, day: date):
+        self.window.subtract(day)
+        self._cache.pop(day, None)
+        self._day_versions.pop(day, None)
+
+    def _hot_start(self) -> date:
+        """Primeiro dia lido (ao menos em parte) do banco; os anteriores vêm do arquivo"""
+        return (datetime.now() - timedelta(days=self.analyzer.hot_retention_days)).date()
+
+    def _refresh_changed_days(self, wanted: set):
+        """Descarta os dias cuja versão mudou; registra a versão dos dias que serão lidos"""
+        hot_start = self._hot_start()
+        checked = {d for d in set(self._cache) | wanted if d >= hot_start}
+        if not checked:
+            return
+        versions = self.analyzer.day_versions(self.totem_id, since=datetime.combine(min(checked), time.min))
+        if versions is None:
+            # Sem como comparar: descarta o que foi checado (relido abaixo se estiver na janela)
+            for day in checked:
+                self._drop(day)
+            return
+        for day in checked:
+            if day in self._cache and versions.get(day) != self._day_versions.get(day):
+                self._drop(day)
+            if day not in self._cache:
+                self._day_versions.pop(day, None)
+                if day in versions:
+                    self._day_versions[day] = versions[day]
+
+    def set_days(self, days: int) -> WindowAggregate:
+        """Ajusta a janela para os últimos `days` dias completos mais o dia corrente"""
+        today = date.today()
+        wanted = {today - timedelta(days=offset) for offset in range(days + 1)}
+
+        # Virada do dia: o antigo "hoje" estava incompleto
+        if self._today is not None and self._today != today:
+            self._drop(self._today)
+        self._today = today
+
+        # Versões por dia só são lidas quando a versão global mudou (inserção ou limpeza)
+        # ou há dias do banco a carregar
+        version = self.analyzer.data_version(self.totem_id)
+        hot_start = self._hot_start()
+        missing = any(d not in self._cache and d >= hot_start for d in wanted)
+        if version is None or version != self._version or missing:
+            self._refresh_changed_days(wanted)
+            self._version = version
+
+        for day in list(self.window.partials):
+            if day not in wanted:
+                self.window.subtract(day)
+        for day in sorted(wanted):
+            if day not in self.window.partials:
+                self.window.add(self._partial(day))
+
+        oldest_kept = today - timedelta(days=max(self.max_days, days))
+        for day in [d for d in self._cache if d < oldest_kept]:
+            del self._cache[day]
+            self._day_versions.pop(day, None)
+
+        return self.window
+
+    def clear(self):
+        self.window = WindowAggregate()
+        self._cache.clear()
+        self._day_versions.clear()
+        self._version = None
@@ -0,0 +1,282 @@
+# Relatório calculado no Postgres (push-down)
+
+import json
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from src.database.db_connection import DatabaseManager
+from src.analysis.report_engine import REPORT_SECTIONS
+
+# Mesmo recorte do DataAnalyzer: eventos com sessão existente, a partir de `since`
+_SCOPE = """
+    FROM sensor_events se
+    JOIN sessions s ON se.session_id = s.session_id
+    WHERE {where}
+"""
+
+
+def _number(value, default=0):
+    """NUMERIC/float do banco para float arredondado (None vira default)"""
+    return default if value is None else round(float(value), 2)
+
+
+class SqlReportBackend:
+    """
+    Calcula as seções do relatório com GROUP BY, FILTER e percentile_cont
+    Só os agregados trafegam pela rede; o formato é o mesmo do ReportEngine
+    """
+
+    def __init__(self, db: DatabaseManager = None):
+        self.db = db or DatabaseManager()
+
+    @staticmethod
+    def _scope(totem_id: Optional[str], since: datetime) -> Tuple[str, tuple]:
+        conditions = ["se.timestamp >= %s"]
+        params = [since]
+        if totem_id:
+            conditions.insert(0, "se.totem_id = %s")
+            params.insert(0, totem_id)
+        return _SCOPE.format(where=' AND '.join(conditions)), tuple(params)
+
+    def estimate_rows(self, totem_id: str = None, since: datetime = None) -> int:
+        """Linhas estimadas pelo planejador para o período (sem varrer a tabela)"""
+        scope, params = self._scope(totem_id, since)
+        result = self.db.execute_query(f"EXPLAIN (FORMAT JSON) SELECT 1 {scope}", params)
+        if not result:
+            return 0
+        plan = result[0]['QUERY PLAN']
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    # Seções ------------------------------------------------------------
+
+    @staticmethod
+    def _percentile_sql(fraction: float, column: str, skip: bool, extra_filter: str = '') -> str:
+        """percentile_cont exato, ou NULL quando o valor vem dos sketches"""
+        if skip:
+            return "NULL"
+        return f"percentile_cont({fraction}) WITHIN GROUP (ORDER BY {column}){extra_filter}"
+
+    def descriptive_stats(self, totem_id: str, since: datetime, percentiles: Dict = None) -> Dict:
+        """percentiles (opcional): {'ldr': {'median', 'q25', 'q75'}} vindos dos sketches"""
+        scope, params = self._scope(totem_id, since)
+        ldr_percentiles = (percentiles or {}).get('ldr')
+        skip = ldr_percentiles is not None
+        rows = self.db.execute_query(
+            f"""
+            SELECT
+                se.event_type,
+                COUNT(*) AS total_events,
+                SUM(se.value) AS value_sum,
+                COUNT(*) FILTER (WHERE se.value = 0) AS inactive_count,
+                AVG(se.value) AS mean,
+                {self._percentile_sql(0.5, 'se.value', skip)} AS median,
+                stddev_samp(se.value) AS std,
+                MIN(se.value) AS min,
+                MAX(se.value) AS max,
+                {self._percentile_sql(0.25, 'se.value', skip)} AS q25,
+                {self._percentile_sql(0.75, 'se.value', skip)} AS q75
+            {scope}
+            GROUP BY se.event_type
+            ORDER BY MIN(se.timestamp)
+            """,
+            params
+        )
+        if not rows:
+            return {}
+
+        stats = {}
+        for row in rows:
+            event_type = row['event_type']
+            if event_type in ['touch', 'presence']:
+                stats[event_type] = {
+                    'total_events': row['total_events'],
+                    'active_count': int(row['value_sum']),
+                    'inactive_count': row['inactive_count'],
+                    'activation_rate': round(float(row['mean']) * 100, 2)
+                }
+            elif event_type == 'ldr':
+                if skip:
+                    row.update(ldr_percentiles)
+                stats[event_type] = {
+                    'total_events': row['total_events'],
+                    'mean': _number(row['mean']),
+                    'median': _number(row['median']),
+                    'std': _number(row['std'], float('nan')),
+                    'min': int(row['min']),
+                    'max': int(row['max']),
+                    'q25': _number(row['q25']),
+                    'q75': _number(row['q75'])
+                }
+
+        sessions = self.db.execute_query(
+            f"""
+            SELECT
+                COUNT(*) AS total_sessions,
+                AVG(duration_seconds) AS avg_duration,
+                SUM(duration_seconds) AS total_duration
+            FROM sessions
+            WHERE session_id IN (SELECT DISTINCT se.session_id {scope})
+            """,
+            params
+        )[0]
+        stats['sessions'] = {
+            'total_sessions': sessions['total_sessions'],
+            'avg_duration': _number(sessions['avg_duration'], float('nan')),
+            'total_duration': _number(sessions['total_duration'])
+        }
+        return stats
+
+    def touch_patterns(self, totem_id: str, since: datetime, percentiles: Dict = None) -> Dict:
+        """percentiles (opcional): {'touch_duration': {'median'}} vindo dos sketches"""
+        scope, params = self._scope(totem_id, since)
+        duration_percentiles = (percentiles or {}).get('touch_duration')
+        skip = duration_percentiles is not None
+        row = self.db.execute_query(
+            f"""
+            SELECT
+                COUNT(*) AS touch_events,
+                COUNT(*) FILTER (WHERE se.value = 1) AS total_touches,
+                AVG(se.duration) FILTER (WHERE se.value = 1) AS avg_duration,
+                {self._percentile_sql(0.5, 'se.duration', skip, ' FILTER (WHERE se.value = 1)')} AS median_duration,
+                MAX(se.duration) FILTER (WHERE se.value = 1) AS max_duration,
+                MIN(se.duration) FILTER (WHERE se.value = 1) AS min_duration
+            {scope}
+            AND se.event_type = 'touch'
+            """,
+            params
+        )[0]
+
+        if not row['touch_events']:
+            return {}
+        if not row['total_touches']:
+            return {'total_touches': 0}
+        if skip:
+            row['median_duration'] = duration_percentiles['median']
+
+        touch_types = self.db.execute_query(
+            f"""
+            SELECT se.touch_type, COUNT(*) AS count
+            {scope}
+            AND se.event_type = 'touch' AND se.value = 1 AND se.touch_type IS NOT NULL
+            GROUP BY se.touch_type
+            ORDER BY count DESC
+            """,
+            params
+        )
+
+        return {
+            'total_touches': row['total_touches'],
+            'touch_types': {r['touch_type']: r['count'] for r in touch_types},
+            'avg_duration': _number(row['avg_duration']),
+            'median_duration': _number(row['median_duration']),
+            'max_duration': _number(row['max_duration']),
+            'min_duration': _number(row['min_duration'])
+        }
+
+    def temporal_patterns(self, totem_id: str, since: datetime) -> Dict:
+        scope, params = self._scope(totem_id, since)
+        hourly_rows = self.db.execute_query(
+            f"""
+            SELECT EXTRACT(HOUR FROM se.timestamp)::int AS hour, COUNT(*) AS count
+            {scope}
+            GROUP BY 1
+            ORDER BY 1
+            """,
+            params
+        )
+        daily_rows = self.db.execute_query(
+            f"""
+            SELECT to_char(se.timestamp, 'FMDay') AS day_of_week, COUNT(*) AS count
+            {scope}
+            GROUP BY 1
+            ORDER BY 1
+            """,
+            params
+        )
+        if not hourly_rows:
+            return {}
+
+        hourly = {r['hour']: r['count'] for r in hourly_rows}
+        peak_hour = max(hourly.items(), key=lambda x: x[1])[0]
+
+        return {
+            'hourly_distribution': hourly,
+            'daily_distribution': {r['day_of_week']: r['count'] for r in daily_rows},
+            'peak_hour': peak_hour,
+            'peak_hour_count': hourly.get(peak_hour, 0) if peak_hour else 0
+        }
+
+    def engagement_metrics(self, totem_id: str, since: datetime) -> Dict:
+        scope, params = self._scope(totem_id, since)
+        row = self.db.execute_query(
+            f"""
+            WITH per_session AS (
+                SELECT
+                    se.session_id,
+                    COUNT(*) FILTER (WHERE se.event_type = 'touch' AND se.value = 1) AS touch_count,
+                    COUNT(*) FILTER (WHERE se.event_type = 'presence' AND se.value = 1) AS presence_time
+                {scope}
+                GROUP BY se.session_id
+            )
+            SELECT
+                COUNT(*) AS sessions,
+                AVG(touch_count) AS avg_touches,
+                AVG(presence_time) AS avg_presence,
+                COUNT(*) FILTER (WHERE touch_count >= 5) AS high_engagement,
+                COUNT(*) FILTER (WHERE touch_count < 2) AS low_engagement,
+                AVG((touch_count > 0)::int) AS engaged_ratio
+            FROM per_session
+            """,
+            params
+        )[0]
+
+        if not row['sessions']:
+            return {}
+
+        return {
+            'avg_touches_per_session': _number(row['avg_touches']),
+            'avg_presence_time': _number(row['avg_presence']),
+            'high_engagement_sessions': row['high_engagement'],
+            'low_engagement_sessions': row['low_engagement'],
+            'engagement_rate': round(float(row['engaged_ratio']) * 100, 2)
+        }
+
+    def data_period(self, totem_id: str, since: datetime) -> Dict:
+        scope, params = self._scope(totem_id, since)
+        row = self.db.execute_query(
+            f"SELECT MIN(se.timestamp) AS first_ts, MAX(se.timestamp) AS last_ts, COUNT(*) AS total {scope}",
+            params
+        )[0]
+        return {
+            'start': row['first_ts'].isoformat() if row['first_ts'] else None,
+            'end': row['last_ts'].isoformat() if row['last_ts'] else None,
+            'total_records': row['total']
+        }
+
+    # Relatório ---------------------------------------------------------
+
+    def run(self, totem_id: str = None, since: datetime = None,
+            precomputed: Dict[str, Dict] = None, percentiles: Dict = None) -> Dict:
+        """
+        Relatório completo no mesmo formato de ReportEngine.run
+        percentiles (opcional) substitui os percentile_cont pelos valores dos sketches
+        """
+        precomputed = precomputed or {}
+
+        period = self.data_period(totem_id, since)
+        if not period['total_records']:
+            return {'error': 'Nenhum dado encontrado'}
+
+        report = {}
+        for name in REPORT_SECTIONS:
+            if name in precomputed:
+                report[name] = precomputed[name]
+            elif name == 'data_period':
+                report[name] = period
+            elif name in ('descriptive_stats', 'touch_patterns'):
+                report[name] = getattr(self, name)(totem_id, since, percentiles=percentiles)
+            else:
+                report[name] = getattr(self, name)(totem_id, since)
+        return report
@@ -9,13 +9,15 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from datetime import datetime
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from src.database.db_connection import DatabaseManager
 from src.analysis.data_analysis import DataAnalyzer
+from src.analysis.sliding_window import SlidingWindowManager
 from src.ml.touch_classifier import TouchClassifier
+from src.ml.model_server import ModelCache
 
 # Configuração da página
 st.set_page_config(
@@ -37,6 +39,11 @@ def init_db():
 def init_analyzer():
     return DataAnalyzer()
 
+# Modelo mantido quente entre cliques; recarrega sozinho quando o arquivo é regravado
+@st.cache_resource
+def init_model_cache():
+    return ModelCache('src/ml/models/touch_classifier.pkl')
+
 db = init_db()
 analyzer = init_analyzer()
 
@@ -50,19 +57,24 @@ totem_id = st.sidebar.selectbox(
 
 days = st.sidebar.slider("Período (dias)", 1, 90, 30)
 
+# Janela incremental por totem (agregados por dia; mover o slider só lê os dias da borda)
+def get_window_manager(totem_id):
+    managers = st.session_state.setdefault('window_managers', {})
+    if totem_id not in managers:
+        managers[totem_id] = SlidingWindowManager(analyzer, totem_id)
+    return managers[totem_id]
+
 # Botão para limpar cache
 if st.sidebar.button("🔄 Atualizar Dados"):
     st.cache_data.clear()
+    analyzer.cache.invalidate()
+    st.session_state.pop('window_managers', None)
     st.rerun()
 
 # Carrega dados
-@st.cache_data(ttl=60)
-def load_data(totem_id, days):
-    return analyzer.load_data_to_dataframe(totem_id, days)
+window = get_window_manager(totem_id).set_days(days)
 
-df = load_data(totem_id, days)
-
-if df.empty:
+if not window.total:
     st.warning("⚠️ Nenhum dado encontrado para o período selecionado.")
     st.info("💡 Execute o coletor de dados primeiro para gerar métricas.")
 else:
@@ -71,22 +83,19 @@ else:
     
     col1, col2, col3, col4 = st.columns(4)
     
-    total_events = len(df)
-    total_sessions = df['session_id'].nunique()
-    touch_events = len(df[(df['event_type'] == 'touch') & (df['value'] == 1)])
-    avg_light = df[df['event_type'] == 'ldr']['value'].mean() if 'ldr' in df['event_type'].values else 0
+    headline = window.headline()
     
     with col1:
-        st.metric("Total de Eventos", f"{total_events:,}")
+        st.metric("Total de Eventos", f"{headline['total_events']:,}")
     
     with col2:
-        st.metric("Sessões", f"{total_sessions:,}")
+        st.metric("Sessões", f"{headline['total_sessions']:,}")
     
     with col3:
-        st.metric("Toques Detectados", f"{touch_events:,}")
+        st.metric("Toques Detectados", f"{headline['touch_events']:,}")
     
     with col4:
-        st.metric("Luminosidade Média", f"{avg_light:.0f}")
+        st.metric("Luminosidade Média", f"{headline['avg_light']:.0f}")
     
     st.markdown("---")
     
@@ -96,53 +105,22 @@ else:
     # Gráfico 1: Eventos por tipo ao longo do tempo
     st.subheader("Eventos por Tipo ao Longo do Tempo")
     
-    if 'timestamp' in df.columns and not df.empty:
-        # Filtra eventos que não são LDR para melhor visualização
-        time_df = df[df['event_type'] != 'ldr'].copy()
-        
-        if not time_df.empty:
-            try:
-                # Garante que timestamp é datetime
-                if not pd.api.types.is_datetime64_any_dtype(time_df['timestamp']):
-                    time_df['timestamp'] = pd.to_datetime(time_df['timestamp'])
-                
-                # Calcula range de tempo dos dados
-                time_range = (time_df['timestamp'].max() - time_df['timestamp'].min()).total_seconds()
-                
-                # Escolhe frequência de agrupamento baseado no range
-                if time_range > 3600:  # Mais de 1 hora
-                    freq = 'H'
-                elif time_range > 60:  # Mais de 1 minuto
-                    freq = 'min'
-                else:  # Menos de 1 minuto - mostra todos os pontos
-                    freq = None
-                
-                if freq:
-                    time_grouped = time_df.groupby([pd.Grouper(key='timestamp', freq=freq), 'event_type']).size().reset_index(name='count')
-                else:
-                    # Sem agrupamento, mostra contagem por tipo
-                    time_grouped = time_df.groupby(['timestamp', 'event_type']).size().reset_index(name='count')
-                
-                if not time_grouped.empty:
-                    fig_time = px.line(
-                        time_grouped,
-                        x='timestamp',
-                        y='count',
-                        color='event_type',
-                        title='Distribuição Temporal de Eventos',
-                        labels={'count': 'Quantidade', 'timestamp': 'Data/Hora'},
-                        markers=True
-                    )
-                    st.plotly_chart(fig_time, use_container_width=True)
-                else:
-                    st.info("📊 Não há dados suficientes para exibir o gráfico temporal.")
-            except Exception as e:
-                st.warning(f"⚠️ Erro ao processar dados temporais: {e}")
-                st.error(str(e))
-        else:
-            st.info("📊 Não há eventos de toque ou presença para exibir.")
+    # LDR fica de fora para melhor visualização; agrupado por hora (ou minuto em janelas curtas)
+    time_grouped = window.event_series(['touch', 'presence'])
+    
+    if not time_grouped.empty:
+        fig_time = px.line(
+            time_grouped,
+            x='timestamp',
+            y='count',
+            color='event_type',
+            title='Distribuição Temporal de Eventos',
+            labels={'count': 'Quantidade', 'timestamp': 'Data/Hora'},
+            markers=True
+        )
+        st.plotly_chart(fig_time, use_container_width=True)
     else:
-        st.info("📊 Dados de timestamp não disponíveis.")
+        st.info("📊 Não há eventos de toque ou presença para exibir.")
     
     # Gráfico 2: Distribuição de toques
     st.subheader("Análise de Toques")
@@ -150,9 +128,8 @@ else:
     col1, col2 = st.columns(2)
     
     with col1:
-        touch_df = df[(df['event_type'] == 'touch') & (df['value'] == 1)]
-        if not touch_df.empty and 'touch_type' in touch_df.columns:
-            touch_types = touch_df['touch_type'].value_counts()
+        touch_types = window.touch_types
+        if not touch_types.empty:
             fig_pie = px.pie(
                 values=touch_types.values,
                 names=touch_types.index,
@@ -161,23 +138,25 @@ else:
             st.plotly_chart(fig_pie, use_container_width=True)
     
     with col2:
-        if not touch_df.empty and 'duration' in touch_df.columns:
-            durations = touch_df['duration'].dropna()
-            if not durations.empty:
-                fig_hist = px.histogram(
-                    x=durations,
-                    nbins=20,
-                    title='Distribuição de Duração de Toques',
-                    labels={'x': 'Duração (segundos)', 'y': 'Frequência'}
-                )
-                st.plotly_chart(fig_hist, use_container_width=True)
+        durations = window.touch_durations
+        if not durations.empty:
+            fig_hist = px.histogram(
+                x=durations.index,
+                y=durations.values,
+                histfunc='sum',
+                nbins=20,
+                title='Distribuição de Duração de Toques',
+                labels={'x': 'Duração (segundos)', 'y': 'Frequência'}
+            )
+            st.plotly_chart(fig_hist, use_container_width=True)
     
     # Gráfico 3: Padrão horário
     st.subheader("Padrão de Uso por Hora do Dia")
     
-    if 'timestamp' in df.columns:
-        df['hour'] = df['timestamp'].dt.hour
-        hourly = df.groupby('hour').size().reset_index(name='count')
+    hourly_distribution = window.temporal_patterns()['hourly_distribution']
+    
+    if hourly_distribution:
+        hourly = pd.DataFrame(list(hourly_distribution.items()), columns=['hour', 'count'])
         
         fig_hourly = px.bar(
             hourly,
@@ -191,53 +170,18 @@ else:
     # Gráfico 4: Luminosidade ao longo do tempo
     st.subheader("Níveis de Luminosidade (LDR)")
     
-    ldr_df = df[df['event_type'] == 'ldr'].copy()
-    if not ldr_df.empty and 'timestamp' in ldr_df.columns:
-        try:
-            # Garante que timestamp é datetime
-            if not pd.api.types.is_datetime64_any_dtype(ldr_df['timestamp']):
-                ldr_df['timestamp'] = pd.to_datetime(ldr_df['timestamp'])
-            
-            # Calcula range de tempo dos dados
-            time_range = (ldr_df['timestamp'].max() - ldr_df['timestamp'].min()).total_seconds()
-            
-            # Escolhe frequência de agrupamento baseado no range
-            if time_range > 3600:  # Mais de 1 hora
-                freq = 'H'
-            elif time_range > 60:  # Mais de 1 minuto
-                freq = 'min'
-            else:  # Menos de 1 minuto - mostra todos os pontos
-                freq = None
-            
-            if freq:
-                ldr_grouped = ldr_df.groupby(pd.Grouper(key='timestamp', freq=freq))['value'].mean().reset_index()
-            else:
-                # Sem agrupamento, mostra todos os pontos ordenados
-                ldr_grouped = ldr_df[['timestamp', 'value']].copy().sort_values('timestamp')
-            
-            if not ldr_grouped.empty:
-                fig_ldr = px.line(
-                    ldr_grouped,
-                    x='timestamp',
-                    y='value',
-                    title='Luminosidade ao Longo do Tempo',
-                    labels={'value': 'Luminosidade (0-1023)', 'timestamp': 'Data/Hora'},
-                    markers=True
-                )
-                fig_ldr.update_traces(mode='lines+markers')
-                st.plotly_chart(fig_ldr, use_container_width=True)
-            else:
-                st.info("📊 Não há dados de luminosidade suficientes para exibir o gráfico.")
-        except Exception as e:
-            st.warning(f"⚠️ Erro ao processar dados de luminosidade: {e}")
-            st.info(f"Total de registros LDR: {len(ldr_df)}")
-            # Fallback: tenta mostrar dados brutos
-            try:
-                ldr_simple = ldr_df[['timestamp', 'value']].head(100).copy()
-                if not ldr_simple.empty:
-                    st.dataframe(ldr_simple)
-            except:
-                pass
+    ldr_grouped = window.ldr_series()
+    if not ldr_grouped.empty:
+        fig_ldr = px.line(
+            ldr_grouped,
+            x='timestamp',
+            y='value',
+            title='Luminosidade ao Longo do Tempo',
+            labels={'value': 'Luminosidade (0-1023)', 'timestamp': 'Data/Hora'},
+            markers=True
+        )
+        fig_ldr.update_traces(mode='lines+markers')
+        st.plotly_chart(fig_ldr, use_container_width=True)
     else:
         st.info("📊 Não há dados de luminosidade (LDR) disponíveis.")
     
@@ -247,7 +191,7 @@ else:
     
     if st.button("Gerar Relatório Completo"):
         with st.spinner("Gerando relatório..."):
-            report = analyzer.generate_full_report(totem_id)
+            report = analyzer.generate_full_report(totem_id, days)
             
             st.subheader("Estatísticas Descritivas")
             st.json(report.get('descriptive_stats', {}))
@@ -288,8 +232,7 @@ else:
     
     if st.button("Predizer Tipo de Toque"):
         try:
-            classifier = TouchClassifier()
-            classifier.load_model('src/ml/models/touch_classifier.pkl')
+            classifier = init_model_cache().get().classifier
             
             prediction = classifier.predict(
                 duration=duration,
@@ -2,187 +2,541 @@
 
 import sys
 import os
-from datetime import datetime, timedelta
-from typing import List, Dict, Tuple
+from datetime import datetime, time
+from typing import List, Dict, Optional, Tuple
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from psycopg2.extras import RealDictCursor
+
 from src.database.db_connection import DatabaseManager
+from src.database.partitioning import PartitionManager
+from src.database.rollups import RollupManager, confirmed_mark, lock_state, record_change
+
+# Regras de validação: condição dos registros inválidos e correção aplicada
+VALIDATION_RULES = [
+    {
+        'type': 'invalid_value',
+        'condition': "event_type IN ('touch', 'presence') AND value NOT IN (0, 1)",
+        # Corrige para 0 (inativo)
+        'fix': "value = 0",
+        'message': "Evento {event_type} com valor inválido: {value}"
+    },
+    {
+        'type': 'invalid_ldr',
+        'condition': "event_type = 'ldr' AND (value < 0 OR value > 1023)",
+        # Corrige para valor médio (512)
+        'fix': "value = 512",
+        'message': "LDR com valor fora do range (0-1023): {value}"
+    },
+]
+
+# Marcas d'água em rollup_state: limpeza incremental e padronização de timestamps (independentes)
+CLEANING_STATE = 'data_cleaning'
+STANDARDIZE_STATE = 'timestamp_standardization'
+
+# Etapas por lote de ids (low, high]; cada uma devolve (linhas alteradas, menor timestamp alterado)
+_BATCH_DEDUPLICATE = """
+    WITH removed AS (
+        DELETE FROM sensor_events se
+        WHERE se.id > %s AND se.id <= %s
+        AND EXISTS (
+            SELECT 1 FROM sensor_events d
+            WHERE d.session_id IS NOT DISTINCT FROM se.session_id
+            AND d.event_type = se.event_type
+            AND d.timestamp = se.timestamp
+            AND d.id < se.id
+        )
+        RETURNING se.id, se.timestamp
+    ),
+    dropped_features AS (
+        DELETE FROM touch_features WHERE event_id IN (SELECT id FROM removed)
+    )
+    SELECT COUNT(*), MIN(timestamp) FROM removed
+"""
+
+_BATCH_FIX = """
+    WITH fixed AS (
+        UPDATE sensor_events SET {fix}
+        WHERE id > %s AND id <= %s AND {condition}
+        RETURNING timestamp
+    )
+    SELECT COUNT(*), MIN(timestamp) FROM fixed
+"""
+
+# Converte do fuso de origem para UTC; só reescreve linhas que a conversão altera
+# O menor timestamp alterado considera o valor antigo e o novo (os dois buckets mudam)
+_BATCH_STANDARDIZE = """
+    WITH normalized AS (
+        UPDATE sensor_events
+        SET timestamp = (timestamp AT TIME ZONE %(zone)s) AT TIME ZONE 'UTC'
+        WHERE id > %(low)s AND id <= %(high)s
+        AND timestamp IS DISTINCT FROM ((timestamp AT TIME ZONE %(zone)s) AT TIME ZONE 'UTC')
+        RETURNING id, timestamp, (timestamp AT TIME ZONE 'UTC') AT TIME ZONE %(zone)s AS original
+    ),
+    synced_features AS (
+        UPDATE touch_features tf SET timestamp = n.timestamp
+        FROM normalized n
+        WHERE tf.event_id = n.id
+    )
+    SELECT COUNT(*), LEAST(MIN(timestamp), MIN(original)) FROM normalized
+"""
 
 
 class DataCleaner:
     
     def __init__(self):
         self.db = DatabaseManager()
+        self.partitions = PartitionManager(self.db)
+        # Máximo de registros inválidos listados por regra no relatório
+        self.sample_size = int(os.getenv('CLEANING_SAMPLE_SIZE', 20))
+        self.rollups = RollupManager(self.db)
+        # Limpeza incremental: ids por lote
+        self.batch_size = int(os.getenv('CLEANING_BATCH_SIZE', 50000))
+        # Fuso em que os coletores gravam os timestamps (sem fuso) antes da padronização
+        self.source_timezone = os.getenv('CLEANING_SOURCE_TIMEZONE', 'UTC')
     
     def remove_duplicates(self) -> int:
         """
         Remove eventos duplicados baseado em session_id, event_type e timestamp
-        Mantém apenas o primeiro registro
+        Mantém apenas o primeiro registro; rollups dos dias afetados são recalculados
         """
         try:
             query = """
-                DELETE FROM sensor_events
-                WHERE id IN (
-                    SELECT id
-                    FROM (
-                        SELECT id,
-                               ROW_NUMBER() OVER (
-                                   PARTITION BY session_id, event_type, timestamp 
-                                   ORDER BY id
-                               ) as rn
-                        FROM sensor_events
-                    ) t
-                    WHERE t.rn > 1
+                WITH removed AS (
+                    DELETE FROM sensor_events
+                    WHERE id IN (
+                        SELECT id
+                        FROM (
+                            SELECT id,
+                                   ROW_NUMBER() OVER (
+                                       PARTITION BY session_id, event_type, timestamp 
+                                       ORDER BY id
+                                   ) as rn
+                            FROM sensor_events
+                        ) t
+                        WHERE t.rn > 1
+                    )
+                    RETURNING id, timestamp
+                ),
+                dropped_features AS (
+                    DELETE FROM touch_features WHERE event_id IN (SELECT id FROM removed)
                 )
+                SELECT COUNT(*), MIN(timestamp) FROM removed
             """
             
-            with self.db.conn.cursor() as cursor:
-                cursor.execute(query)
-                deleted_count = cursor.rowcount
-                self.db.conn.commit()
-                
+            with self.db.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(query)
+                    deleted_count, first_changed = cursor.fetchone()
+                    if deleted_count:
+                        record_change(cursor)
+                conn.commit()
+            
+            if first_changed is not None:
+                self._rebuild_rollups(first_changed)
             return deleted_count
         except Exception as e:
-            self.db.conn.rollback()
             print(f"Erro: {e}")
             return 0
     
-    def validate_sensor_values(self) -> Tuple[int, List[Dict]]:
+    def validate_sensor_values(self, dry_run: bool = False, sample_size: int = None) -> Tuple[int, List[Dict]]:
         """
         Valida valores dos sensores
         - Touch/Presence: deve ser 0 ou 1
         - LDR: deve estar entre 0 e 1023
-        Retorna número de registros inválidos e lista de erros
+        Retorna número de registros inválidos e uma amostra limitada dos erros
+        Com dry_run=True apenas conta, sem corrigir
         """
-        errors = []
+        results = self._fix_invalid_values(dry_run=dry_run, sample_size=sample_size)
+        
+        total = sum(result['count'] for result in results.values())
+        errors = [error for result in results.values() for error in result['sample']]
+        return total, errors
+    
+    def _fix_invalid_values(self, dry_run: bool = False, sample_size: int = None) -> Dict[str, Dict]:
+        """
+        Corrige valores inválidos com um UPDATE por regra (sem ida e volta por registro)
+        Retorna {regra: {'count': registros afetados, 'sample': até sample_size erros}}
+        Rollups dos dias corrigidos são recalculados
+        """
+        sample_size = sample_size if sample_size is not None else self.sample_size
+        results = {}
+        rebuild_since = None
         
         try:
-            # Valida eventos de toque e presença
-            query_touch = """
-                SELECT id, event_type, value, timestamp
-                FROM sensor_events
-                WHERE event_type IN ('touch', 'presence')
-                AND value NOT IN (0, 1)
-            """
-            invalid_touch = self.db.execute_query(query_touch)
-            
-            for record in invalid_touch:
-                errors.append({
-                    'id': record['id'],
-                    'type': 'invalid_value',
-                    'message': f"Evento {record['event_type']} com valor inválido: {record['value']}"
-                })
-            
-            # Valida eventos LDR
-            query_ldr = """
-                SELECT id, event_type, value, timestamp
-                FROM sensor_events
-                WHERE event_type = 'ldr'
-                AND (value < 0 OR value > 1023)
-            """
-            invalid_ldr = self.db.execute_query(query_ldr)
-            
-            for record in invalid_ldr:
-                errors.append({
-                    'id': record['id'],
-                    'type': 'invalid_ldr',
-                    'message': f"LDR com valor fora do range (0-1023): {record['value']}"
-                })
-            
-            # Corrige valores inválidos
-            if errors:
-                self._fix_invalid_values(errors)
-            
-            return len(errors), errors
-            
+            with self.db.connection() as conn:
+                for rule in VALIDATION_RULES:
+                    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                        cursor.execute(
+                            f"""
+                            SELECT id, event_type, value, timestamp
+                            FROM sensor_events
+                            WHERE {rule['condition']}
+                            ORDER BY id
+                            LIMIT %s
+                            """,
+                            (sample_size,)
+                        )
+                        sample = [
+                            {
+                                'id': record['id'],
+                                'type': rule['type'],
+                                'message': rule['message'].format(**record)
+                            }
+                            for record in cursor.fetchall()
+                        ]
+                        
+                        if dry_run:
+                            cursor.execute(
+                                f"SELECT COUNT(*) AS count FROM sensor_events WHERE {rule['condition']}"
+                            )
+                            count = cursor.fetchone()['count']
+                        else:
+                            cursor.execute(
+                                f"""
+                                WITH fixed AS (
+                                    UPDATE sensor_events SET {rule['fix']}
+                                    WHERE {rule['condition']}
+                                    RETURNING timestamp
+                                )
+                                SELECT COUNT(*) AS count, MIN(timestamp) AS first_changed FROM fixed
+                                """
+                            )
+                            row = cursor.fetchone()
+                            count = row['count']
+                            if count:
+                                record_change(cursor)
+                            if row['first_changed'] is not None:
+                                rebuild_since = (row['first_changed'] if rebuild_since is None
+                                                 else min(rebuild_since, row['first_changed']))
+                    
+                    results[rule['type']] = {'count': count, 'sample': sample}
+                
+                if dry_run:
+                    conn.rollback()
+                else:
+                    conn.commit()
         except Exception as e:
             print(f"Erro: {e}")
-            return 0, []
+            return {}
+        
+        if rebuild_since is not None:
+            self._rebuild_rollups(rebuild_since)
+        return results
     
-    def _fix_invalid_values(self, errors: List[Dict]):
-        """Corrige valores inválidos"""
+    def standardize_timestamps(self) -> int:
+        """
+        Padroniza timestamps para UTC (origem: CLEANING_SOURCE_TIMEZONE)
+        Tem marca d'água própria: nenhuma linha é convertida duas vezes; a limpeza
+        incremental só deduplica ids já padronizados. Rollups dos dias alterados são recalculados
+        """
+        updated_count, first_changed = self._standardize()
+        if first_changed is not None:
+            self._rebuild_rollups(first_changed)
+        return updated_count
+    
+    def _standardize(self) -> Tuple[int, Optional[datetime]]:
+        """
+        Converte os ids confirmados acima da marca, em lotes de até batch_size ids
+        (um commit por lote); retorna (linhas alteradas, menor timestamp alterado)
+        """
+        updated_count, first_changed = 0, None
+        limit = None
+        # Uma nova confirmação quando não há lote: confirma o que a primeira leu (rollups.confirmed_mark)
+        reconfirmed = False
         try:
-            for error in errors:
-                record_id = error['id']
+            while True:
+                with self.db.connection() as conn:
+                    with conn.cursor() as cursor:
+                        # Conversão independente do fuso configurado na conexão
+                        cursor.execute("SET LOCAL TIME ZONE 'UTC'")
+                        low = lock_state(cursor, STANDARDIZE_STATE)
+                        if limit is None or low >= limit:
+                            limit = confirmed_mark(cursor, STANDARDIZE_STATE, 'sensor_events', low)
+                        cursor.execute(
+                            """
+                            SELECT MAX(id)
+                            FROM (
+                                SELECT id FROM sensor_events
+                                WHERE id > %s AND id <= %s
+                                ORDER BY id
+                                LIMIT %s
+                            ) batch
+                            """,
+                            (low, limit, self.batch_size)
+                        )
+                        high = cursor.fetchone()[0]
+                        if high is None:
+                            conn.commit()
+                            if reconfirmed:
+                                break
+                            reconfirmed, limit = True, None
+                            continue
+                        
+                        cursor.execute(
+                            _BATCH_STANDARDIZE,
+                            {'zone': self.source_timezone, 'low': low, 'high': high}
+                        )
+                        count, changed = cursor.fetchone()
+                        cursor.execute(
+                            """
+                            UPDATE rollup_state
+                            SET high_water_mark = %s, updated_at = CURRENT_TIMESTAMP
+                            WHERE name = %s
+                            """,
+                            (high, STANDARDIZE_STATE)
+                        )
+                        if count:
+                            record_change(cursor)
+                    conn.commit()
                 
-                if error['type'] == 'invalid_value':
-                    # Corrige para 0 (inativo)
-                    query = "UPDATE sensor_events SET value = 0 WHERE id = %s"
-                elif error['type'] == 'invalid_ldr':
-                    # Corrige para valor médio (512)
-                    query = "UPDATE sensor_events SET value = 512 WHERE id = %s"
-                else:
-                    continue
-                
-                with self.db.conn.cursor() as cursor:
-                    cursor.execute(query, (record_id,))
-            
-            self.db.conn.commit()
+                updated_count += count
+                if changed is not None:
+                    first_changed = changed if first_changed is None else min(first_changed, changed)
         except Exception as e:
-            self.db.conn.rollback()
             print(f"Erro: {e}")
+        
+        return updated_count, first_changed
     
-    def standardize_timestamps(self):
-        """Padroniza timestamps para UTC"""
+    def _rebuild_rollups(self, since: datetime):
+        """Recalcula os rollups a partir do dia alterado (se já estiverem em uso)"""
         try:
-            query = """
-                UPDATE sensor_events
-                SET timestamp = timestamp AT TIME ZONE 'UTC'
-                WHERE timestamp IS NOT NULL
+            if self.rollups.is_available():
+                self.rollups.rebuild(since=since)
+        except Exception as e:
+            print(f"Erro ao recalcular rollups: {e}")
+    
+    def _refresh_rollups(self):
+        """Agrega nos rollups os eventos novos (os relatórios só leem os rollups)"""
+        try:
+            if self.rollups.is_available():
+                self.rollups.refresh()
+        except Exception as e:
+            print(f"Erro ao atualizar rollups: {e}")
+    
+    # Limpeza incremental ------------------------------------------------
+    
+    def _record_batch(self, cursor, low: int, high: int, stats: Dict):
+        cursor.execute(
             """
-            
-            with self.db.conn.cursor() as cursor:
-                cursor.execute(query)
-                updated_count = cursor.rowcount
-                self.db.conn.commit()
-            
-            return updated_count
+            INSERT INTO cleaning_batches
+                (id_from, id_to, duplicates_removed, invalid_fixed)
+            VALUES (%s, %s, %s, %s)
+            """,
+            (low, high, stats.get('duplicates_removed', 0), stats.get('invalid_records_fixed', 0))
+        )
+        cursor.execute(
+            """
+            UPDATE rollup_state
+            SET high_water_mark = %s, updated_at = CURRENT_TIMESTAMP
+            WHERE name = %s
+            """,
+            (high, CLEANING_STATE)
+        )
+    
+    def _clean_batch(self, cursor, low: int, high: int) -> Tuple[Dict, Optional[datetime]]:
+        """
+        Aplica deduplicação e regras de validação aos ids em (low, high]
+        Retorna as contagens e o menor timestamp alterado (None se nada mudou)
+        """
+        changed = []
+        
+        cursor.execute(_BATCH_DEDUPLICATE, (low, high))
+        duplicates, first_changed = cursor.fetchone()
+        changed.append(first_changed)
+        
+        fixed = 0
+        for rule in VALIDATION_RULES:
+            cursor.execute(
+                _BATCH_FIX.format(fix=rule['fix'], condition=rule['condition']),
+                (low, high)
+            )
+            count, first_changed = cursor.fetchone()
+            fixed += count
+            changed.append(first_changed)
+        
+        changed = [ts for ts in changed if ts is not None]
+        stats = {
+            'duplicates_removed': duplicates,
+            'invalid_records_fixed': fixed
+        }
+        return stats, min(changed) if changed else None
+    
+    def clean_incremental(self, batch_size: int = None, max_batches: int = None) -> Dict:
+        """
+        Limpa só os eventos novos, em lotes de até batch_size ids acima da marca d'água
+        Cada lote é limpo e registrado (cleaning_batches) na mesma transação que avança a marca
+        A marca não passa do último id confirmado (rollups.confirmed_mark): eventos
+        recém-gravados ficam para a execução seguinte
+        Os timestamps são padronizados antes (marca própria) e a deduplicação não passa
+        da marca da padronização, para comparar sempre horários já em UTC
+        Ao final recalcula os rollups dos dias alterados
+        """
+        batch_size = batch_size or self.batch_size
+        totals = {
+            'batches': 0,
+            'duplicates_removed': 0,
+            'invalid_records_fixed': 0,
+            'timestamps_standardized': 0,
+            'high_water_mark': None
+        }
+        limit = None
+        
+        totals['timestamps_standardized'], rebuild_since = self._standardize()
+        
+        try:
+            while max_batches is None or totals['batches'] < max_batches:
+                with self.db.connection() as conn:
+                    with conn.cursor() as cursor:
+                        low = lock_state(cursor, CLEANING_STATE)
+                        if limit is None or low >= limit:
+                            limit = confirmed_mark(cursor, CLEANING_STATE, 'sensor_events', low)
+                            cursor.execute(
+                                "SELECT high_water_mark FROM rollup_state WHERE name = %s",
+                                (STANDARDIZE_STATE,)
+                            )
+                            standardized = cursor.fetchone()
+                            limit = min(limit, standardized[0] if standardized else 0)
+                        cursor.execute(
+                            """
+                            SELECT MAX(id), MIN(timestamp)
+                            FROM (
+                                SELECT id, timestamp
+                                FROM sensor_events
+                                WHERE id > %s AND id <= %s
+                                ORDER BY id
+                                LIMIT %s
+                            ) batch
+                            """,
+                            (low, limit, batch_size)
+                        )
+                        high, batch_start = cursor.fetchone()
+                        if high is None:
+                            # Commit mesmo sem lote: guarda a marca candidata para a próxima execução
+                            conn.commit()
+                            break
+                        
+                        stats, first_changed = self._clean_batch(cursor, low, high)
+                        self._record_batch(cursor, low, high, stats)
+                        if any(stats.values()):
+                            record_change(cursor)
+                    conn.commit()
+                
+                totals['batches'] += 1
+                totals['high_water_mark'] = high
+                for key, value in stats.items():
+                    totals[key] += value
+                if first_changed is not None:
+                    since = min(first_changed, batch_start)
+                    rebuild_since = since if rebuild_since is None else min(rebuild_since, since)
         except Exception as e:
-            self.db.conn.rollback()
             print(f"Erro: {e}")
-            return 0
+        
+        if rebuild_since is not None:
+            self._rebuild_rollups(rebuild_since)
+        
+        return totals
     
-    def remove_old_data(self, days: int = 90):
-        """Remove dados antigos (padrão: 90 dias)"""
+    def remove_old_data(self, days: int = 90, archive: bool = False):
+        """
+        Remove dados antigos (padrão: 90 dias)
+        Com sensor_events particionada, partições inteiras são desanexadas e
+        removidas; o DELETE fica restrito à partição que contém o corte
+        O corte é alinhado ao dia (o mesmo do arquivo); com archive=True os dias
+        são antes exportados para Parquet e só os confirmados pelo arquivo são removidos
+        """
+        from src.database.archive import ParquetArchiver, retention_cutoff
+        
         try:
-            cutoff_date = datetime.now() - timedelta(days=days)
-            
-            # Remove eventos antigos
-            query_events = "DELETE FROM sensor_events WHERE timestamp < %s"
-            with self.db.conn.cursor() as cursor:
-                cursor.execute(query_events, (cutoff_date,))
-                deleted_events = cursor.rowcount
+            cutoff_day = retention_cutoff(days)
+            if archive:
+                cutoff_day = ParquetArchiver(self.db).archive_confirmed(cutoff_day)
+            cutoff_date = datetime.combine(cutoff_day, time.min)
+            deleted_events = 0
             
-            # Remove sessões antigas sem eventos
-            query_sessions = """
-                DELETE FROM sessions
-                WHERE started_at < %s
-                AND id NOT IN (
-                    SELECT DISTINCT session_id::text::int
-                    FROM sensor_events
-                )
-            """
-            with self.db.conn.cursor() as cursor:
-                cursor.execute(query_sessions, (cutoff_date,))
-                deleted_sessions = cursor.rowcount
+            if self.partitions.is_partitioned():
+                dropped = self.partitions.drop_partitions_before(cutoff_date)
+                deleted_events += sum(dropped.values())
             
-            self.db.conn.commit()
+            with self.db.connection() as conn:
+                # Remove eventos antigos
+                query_events = "DELETE FROM sensor_events WHERE timestamp < %s"
+                with conn.cursor() as cursor:
+                    cursor.execute(query_events, (cutoff_date,))
+                    deleted_events += cursor.rowcount
+                    cursor.execute("DELETE FROM touch_features WHERE timestamp < %s", (cutoff_date,))
+                
+                # Remove sessões antigas sem eventos (e suas agregações)
+                orphan_filter = """
+                    SELECT s.session_id
+                    FROM sessions s
+                    WHERE s.started_at < %s
+                    AND NOT EXISTS (
+                        SELECT 1 FROM sensor_events se
+                        WHERE se.session_id = s.session_id
+                    )
+                """
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        f"DELETE FROM session_aggregates WHERE session_id IN ({orphan_filter})",
+                        (cutoff_date,)
+                    )
+                    cursor.execute(
+                        f"DELETE FROM sessions WHERE session_id IN ({orphan_filter})",
+                        (cutoff_date,)
+                    )
+                    deleted_sessions = cursor.rowcount
+                    if deleted_events or deleted_sessions:
+                        record_change(cursor)
+                
+                conn.commit()
             
             return deleted_events + deleted_sessions
         except Exception as e:
-            self.db.conn.rollback()
             print(f"Erro: {e}")
             return 0
     
-    def clean_all(self):
+    def clean_all(self, dry_run: bool = False, incremental: bool = False):
+        """
+        Executa todas as etapas de limpeza
+        Com dry_run=True só valida e conta os registros inválidos (nada é alterado)
+        Com incremental=True limpa apenas os eventos novos desde a última execução
+        """
+        if incremental and not dry_run:
+            if self.partitions.is_partitioned():
+                self.partitions.ensure_partitions()
+            results = self.clean_incremental()
+            self._refresh_rollups()
+            results['invalid_records_found'] = results['invalid_records_fixed']
+            results['invalid_sample'] = []
+            return results
+        
+        if dry_run:
+            invalid_count, errors = self.validate_sensor_values(dry_run=True)
+            return {
+                'duplicates_removed': 0,
+                'invalid_records_fixed': 0,
+                'invalid_records_found': invalid_count,
+                'invalid_sample': errors,
+                'timestamps_standardized': 0
+            }
+        
+        # Manutenção: garante partições dos próximos períodos
+        if self.partitions.is_partitioned():
+            self.partitions.ensure_partitions()
+        
+        # Padroniza antes de deduplicar: duplicatas são comparadas já em UTC
+        timestamps_standardized = self.standardize_timestamps()
         duplicates_removed = self.remove_duplicates()
         invalid_count, errors = self.validate_sensor_values()
-        timestamps_standardized = self.standardize_timestamps()
+        self._refresh_rollups()
         
         return {
             'duplicates_removed': duplicates_removed,
             'invalid_records_fixed': invalid_count,
+            'invalid_records_found': invalid_count,
+            'invalid_sample': errors,
             'timestamps_standardized': timestamps_standardized
         }
     
@@ -231,16 +585,26 @@ class DataCleaner:
 
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Limpeza de dados dos sensores')
+    parser.add_argument('--dry-run', action='store_true', help='Só conta os registros inválidos, sem alterar nada')
+    parser.add_argument('--incremental', action='store_true', help='Limpa só os eventos novos desde a última execução')
+    args = parser.parse_args()
+    
     cleaner = DataCleaner()
     
     print("=== Limpeza de Dados ===\n")
     
     # Executa limpeza
-    results = cleaner.clean_all()
+    results = cleaner.clean_all(dry_run=args.dry_run, incremental=args.incremental)
     
     print(f"Duplicados removidos: {results['duplicates_removed']}")
+    print(f"Registros inválidos encontrados: {results['invalid_records_found']}")
     print(f"Registros inválidos corrigidos: {results['invalid_records_fixed']}")
     print(f"Timestamps padronizados: {results['timestamps_standardized']}")
+    for error in results['invalid_sample']:
+        print(f"  [{error['id']}] {error['message']}")
     
     # Gera relatório
     print("\n=== Relatório de Qualidade ===")
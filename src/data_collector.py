@@ -3,20 +3,36 @@
 import sys
 import os
 from datetime import datetime
-from typing import List, Dict
+from typing import Dict, Iterator, List
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.sensors.sensor_simulator import SensorSimulator
 from src.database.db_connection import DatabaseManager
+from src.event_spool import EventSpool, SpoolDrainer
+from src.session_aggregator import SessionAggregator
 
 
 class DataCollector:
-    def __init__(self, totem_id: str = "TOTEM-001"):
+    def __init__(self, totem_id: str = "TOTEM-001", spool_dir: str = None):
+        """
+        spool_dir (ou COLLECTOR_SPOOL_DIR) ativa o spool write-ahead:
+        a coleta grava em disco e uma thread drena para o banco em segundo plano
+        """
         self.simulator = SensorSimulator(totem_id)
         self.db = DatabaseManager()
         self.totem_id = totem_id
+        # Eventos por lote gravado (banco ou spool) durante a simulação
+        self.batch_size = int(os.getenv('COLLECTOR_BATCH_SIZE', 1000))
         self._ensure_totem_exists()
+        
+        spool_dir = spool_dir or os.getenv('COLLECTOR_SPOOL_DIR')
+        self.spool = None
+        self.drainer = None
+        if spool_dir:
+            self.spool = EventSpool(spool_dir)
+            self.drainer = SpoolDrainer(spool_dir, db=self.db)
+            self.drainer.start()
     
     def _ensure_totem_exists(self):
         try:
@@ -32,76 +48,118 @@ class DataCollector:
         except Exception as e:
             print(f"Erro ao verificar totem: {e}")
     
+    def _simulate_batches(self, duration_seconds: int, aggregator: SessionAggregator,
+                          untouched: SessionAggregator = None) -> Iterator[List[Dict]]:
+        """
+        Simula a sessão e entrega os eventos em lotes de até batch_size, à medida que são gerados
+        Cada evento atualiza o agregador (e `untouched`, se não for toque) antes de entrar no lote
+        """
+        batch = []
+        for event in self.simulator.iter_interaction_cycle(duration_seconds, fast_mode=True):
+            aggregator.update(event)
+            if untouched is not None and event.get('event_type') != 'touch':
+                untouched.update(event)
+            batch.append(event)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
     def collect_and_store(self, duration_seconds: int = 60) -> Dict:
+        if self.spool:
+            return self._collect_to_spool(duration_seconds)
+        
         session_id = self.simulator.start_session()
         started_at = datetime.now().isoformat()
         self.db.create_session(session_id, self.totem_id, started_at)
         
-        events = self.simulator.simulate_interaction_cycle(duration_seconds, fast_mode=True)
+        # Agregação atualizada evento a evento, durante a simulação
+        aggregator = SessionAggregator(session_id, self.totem_id)
+        # Toques contam apenas se foram armazenados: agregação sem eles, usada se a gravação falhar
+        untouched = SessionAggregator(session_id, self.totem_id)
+        batches = self._simulate_batches(duration_seconds, aggregator, untouched)
         
+        # Grava a sessão inteira em uma única transação, lote a lote enquanto a simulação corre
         stored_count = 0
-        touch_events = []
-        
-        for event in events:
-            if event.get('event_type') == 'session_end':
-                continue
-            
-            try:
-                self.db.insert_sensor_event(event)
-                stored_count += 1
-                
-                if event.get('event_type') == 'touch' and event.get('value') == 1:
-                    touch_events.append(event)
-            except Exception as e:
-                print(f"Erro ao armazenar evento: {e}")
+        try:
+            with self.db.connection() as conn:
+                for batch in batches:
+                    stored_count += self.db.insert_sensor_events_bulk(batch, conn=conn)
+                conn.commit()
+            touch_count = aggregator.total_touches
+        except Exception as e:
+            print(f"Erro ao armazenar eventos: {e}")
+            # Conclui a simulação sem gravar
+            for _ in batches:
+                pass
+            stored_count = 0
+            touch_count = 0
+            aggregator = untouched
         
         session_end = self.simulator.end_session()
         self.db.end_session(
             session_id,
             session_end['ended_at'],
             session_end['duration'],
-            len(touch_events)
+            touch_count
         )
         
-        aggregates = self._calculate_aggregates(session_id, events, touch_events)
-        self.db.insert_session_aggregate(aggregates)
+        self.db.insert_session_aggregate(aggregator.snapshot())
         
         return {
             'session_id': session_id,
             'events_stored': stored_count,
-            'touch_events': len(touch_events),
+            'touch_events': touch_count,
             'session_duration': session_end['duration']
         }
     
-    def _calculate_aggregates(self, session_id: str, events: List[Dict], touch_events: List[Dict]) -> Dict:
-        short_touches = sum(1 for e in touch_events if e.get('touch_type') == 'short')
-        long_touches = sum(1 for e in touch_events if e.get('touch_type') == 'long')
+    def _collect_to_spool(self, duration_seconds: int) -> Dict:
+        """
+        Mesmo fluxo de collect_and_store, mas tudo vai primeiro para o spool
+        A latência da coleta não depende do banco e quedas não perdem eventos
+        """
+        session_id = self.simulator.start_session()
+        started_at = datetime.now().isoformat()
+        self.spool.append('session_start', {
+            'session_id': session_id,
+            'totem_id': self.totem_id,
+            'started_at': started_at
+        })
         
-        presence_events = [e for e in events if e.get('event_type') == 'presence' and e.get('value') == 1]
-        avg_presence_time = len(presence_events)
+        aggregator = SessionAggregator(session_id, self.totem_id)
+        events_stored = 0
+        for batch in self._simulate_batches(duration_seconds, aggregator):
+            self.spool.append_many('event', batch)
+            events_stored += len(batch)
         
-        ldr_events = [e for e in events if e.get('event_type') == 'ldr']
-        avg_light = sum(e.get('value', 0) for e in ldr_events) / len(ldr_events) if ldr_events else 0
+        session_end = self.simulator.end_session()
+        self.spool.append('session_end', {
+            'session_id': session_id,
+            'ended_at': session_end['ended_at'],
+            'duration': session_end['duration'],
+            'total_interactions': aggregator.total_touches
+        })
         
-        session_duration = sum(e.get('duration', 0) for e in touch_events) if touch_events else 0
+        self.spool.append('aggregate', aggregator.snapshot())
         
-        base_score = min(len(touch_events) * 10, 50)
-        duration_score = min(session_duration * 5, 30)
-        type_score = long_touches * 5
-        interaction_score = min(base_score + duration_score + type_score, 100)
+        # Um fsync por sessão
+        self.spool.sync()
         
         return {
             'session_id': session_id,
-            'totem_id': self.totem_id,
-            'total_touches': len(touch_events),
-            'short_touches': short_touches,
-            'long_touches': long_touches,
-            'avg_presence_time': round(avg_presence_time, 2),
-            'avg_light_level': round(avg_light, 2),
-            'session_duration': round(session_duration, 2),
-            'interaction_score': round(interaction_score, 2)
+            'events_stored': events_stored,
+            'touch_events': aggregator.total_touches,
+            'session_duration': session_end['duration']
         }
-
+    
+    def close(self):
+        """Para o drenador (o que faltar continua no spool) e libera o banco"""
+        if self.drainer:
+            self.drainer.stop()
+        if self.spool:
+            self.spool.close()
+        self.db.close()
 
 if __name__ == "__main__":
     collector = DataCollector("TOTEM-001")
@@ -111,5 +169,5 @@ if __name__ == "__main__":
     print(f"Eventos: {stats['events_stored']}")
     print(f"Toques: {stats['touch_events']}")
     
-    collector.db.close()
+    collector.close()
 
@@ -0,0 +1,282 @@
+"""
+Arquivo Colunar (Parquet) do Histórico de Sensores
+Exporta sensor_events + metadados da sessão para Parquet particionado por totem e dia,
+e lê de volta janelas antigas para o DataAnalyzer
+"""
+
+import sys
+import os
+import io
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+import logging
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.database.db_connection import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = ['id', 'session_id', 'totem_id', 'event_type', 'value', 'duration',
+                   'touch_type', 'timestamp', 'created_at', 'session_started', 'session_duration']
+
+# Categorias fixas: os blocos lidos em momentos diferentes compartilham os códigos
+FIXED_CATEGORIES = {
+    'event_type': ['touch', 'presence', 'ldr'],
+    'touch_type': ['none', 'short', 'long'],
+}
+
+# Partições no estilo hive: <raiz>/totem_id=TOTEM-001/date=2024-01-31/events.parquet
+PARTITIONING = ds.partitioning(
+    pa.schema([('totem_id', pa.string()), ('date', pa.string())]),
+    flavor='hive'
+)
+
+
+def compact_dtypes(df: pd.DataFrame, float_dtype: str = 'float32') -> pd.DataFrame:
+    """
+    Converte colunas para tipos compactos
+    Categóricos para strings repetidas (event_type/touch_type com categorias fixas),
+    int16 para value (int32 se houver valores fora da faixa) e float_dtype para durações
+    """
+    if df.empty:
+        return df
+
+    df = df.copy()
+    for column, categories in FIXED_CATEGORIES.items():
+        if column in df.columns:
+            values = df[column].astype(object)
+            extra = sorted(set(values.dropna().unique()) - set(categories))
+            df[column] = pd.Categorical(values, categories=categories + extra)
+    for column in ('totem_id', 'session_id'):
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    if 'value' in df.columns:
+        values = pd.to_numeric(df['value'])
+        int16 = np.iinfo(np.int16)
+        fits = values.empty or (values.min() >= int16.min and values.max() <= int16.max)
+        df['value'] = values.astype('int16' if fits else 'int32')
+    for column in ('duration', 'session_duration'):
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype(float_dtype)
+    for column in ('timestamp', 'created_at', 'session_started'):
+        if column in df.columns:
+            # O CSV do Postgres omite a fração de segundo quando é zero (formatos misturados)
+            df[column] = pd.to_datetime(df[column], format='ISO8601')
+    return df
+
+
+def retention_cutoff(days: int) -> date:
+    """
+    Primeiro dia mantido no banco pela retenção de `days` dias
+    Arquivo e limpeza usam o mesmo corte, alinhado ao início do dia
+    """
+    return (datetime.now() - timedelta(days=days)).date()
+
+
+class ParquetArchiver:
+    """Exporta dias completos de sensor_events para Parquet"""
+
+    def __init__(self, db: DatabaseManager = None, root: str = None):
+        self.db = db or DatabaseManager()
+        self.root = root or os.getenv('ARCHIVE_DIR', 'archive')
+
+    def _day_path(self, totem_id: str, day: date) -> str:
+        return os.path.join(self.root, f"totem_id={totem_id}", f"date={day.isoformat()}")
+
+    def _fetch_day(self, day: date) -> pd.DataFrame:
+        """Exporta um dia via COPY ... TO STDOUT (CSV), sem criar um dict por linha"""
+        start = datetime(day.year, day.month, day.day)
+        query = """
+            SELECT
+                se.id, se.session_id, se.totem_id, se.event_type, se.value, se.duration,
+                se.touch_type, se.timestamp, se.created_at,
+                s.started_at AS session_started,
+                s.duration_seconds AS session_duration
+            FROM sensor_events se
+            LEFT JOIN sessions s ON se.session_id = s.session_id
+            WHERE se.timestamp >= %s AND se.timestamp < %s
+            ORDER BY se.timestamp
+        """
+        buffer = io.StringIO()
+        self.db.copy_query_csv(query, (start, start + timedelta(days=1)), buffer)
+        buffer.seek(0)
+
+        df = pd.read_csv(buffer, names=ARCHIVE_COLUMNS, header=None,
+                         dtype={'session_id': str, 'totem_id': str, 'event_type': str, 'touch_type': str})
+        return compact_dtypes(df)
+
+    def archive_day(self, day: date) -> int:
+        """Grava (ou regrava) todos os totens de um dia; retorna linhas arquivadas"""
+        df = self._fetch_day(day)
+        if df.empty:
+            return 0
+
+        for totem_id, totem_df in df.groupby('totem_id', observed=True):
+            path = self._day_path(totem_id, day)
+            os.makedirs(path, exist_ok=True)
+            table = pa.Table.from_pandas(
+                totem_df.drop(columns=['totem_id']).reset_index(drop=True),
+                preserve_index=False
+            )
+            # Escrita atômica: rearquivar um dia substitui o arquivo anterior
+            # (prefixo '.' faz o leitor ignorar temporários deixados por um crash)
+            tmp_file = os.path.join(path, '.events.parquet.tmp')
+            pq.write_table(table, tmp_file, compression='zstd')
+            os.replace(tmp_file, os.path.join(path, 'events.parquet'))
+
+        return len(df)
+
+    def archived_days(self) -> List[date]:
+        """Dias que já possuem arquivo para ao menos um totem"""
+        days = set()
+        if not os.path.isdir(self.root):
+            return []
+        for totem_dir in os.listdir(self.root):
+            totem_path = os.path.join(self.root, totem_dir)
+            if not os.path.isdir(totem_path):
+                continue
+            for day_dir in os.listdir(totem_path):
+                if day_dir.startswith('date='):
+                    days.add(date.fromisoformat(day_dir[len('date='):]))
+        return sorted(days)
+
+    def archive_range(self, start: date, end: date, skip_archived: bool = True) -> int:
+        """Arquiva os dias [start, end); retorna o total de linhas arquivadas"""
+        archived = set(self.archived_days()) if skip_archived else set()
+        total = 0
+        day = start
+        while day < end:
+            if day not in archived:
+                rows = self.archive_day(day)
+                if rows:
+                    logger.info(f"Arquivado {day.isoformat()}: {rows} eventos")
+                total += rows
+            day += timedelta(days=1)
+        return total
+
+    def archive_older_than(self, days: int) -> int:
+        """Arquiva todos os dias completos anteriores ao corte de retenção"""
+        oldest = self._oldest_day()
+        if oldest is None:
+            return 0
+        return self.archive_range(oldest, retention_cutoff(days))
+
+    def _oldest_day(self) -> Optional[date]:
+        oldest = self.db.execute_query("SELECT MIN(timestamp) AS oldest FROM sensor_events")
+        if not oldest or oldest[0]['oldest'] is None:
+            return None
+        return oldest[0]['oldest'].date()
+
+    def _db_rows(self, day: date) -> int:
+        start = datetime(day.year, day.month, day.day)
+        result = self.db.execute_query(
+            "SELECT COUNT(*) AS count FROM sensor_events WHERE timestamp >= %s AND timestamp < %s",
+            (start, start + timedelta(days=1))
+        )
+        return int(result[0]['count']) if result else 0
+
+    def archived_rows(self, day: date) -> int:
+        """Linhas já gravadas no arquivo para o dia (todos os totens)"""
+        total = 0
+        if not os.path.isdir(self.root):
+            return 0
+        for totem_dir in os.listdir(self.root):
+            path = os.path.join(self.root, totem_dir, f"date={day.isoformat()}", 'events.parquet')
+            if os.path.exists(path):
+                total += pq.ParquetFile(path).metadata.num_rows
+        return total
+
+    def archive_confirmed(self, cutoff: date) -> date:
+        """
+        Arquiva os dias anteriores a cutoff e retorna até onde o banco pode ser apagado:
+        cutoff, ou o primeiro dia que o arquivo não confirmou
+        Um dia está confirmado quando o arquivo tem tantas linhas quanto o banco;
+        dias incompletos (ou alterados depois de arquivados) são regravados
+        """
+        day = self._oldest_day()
+        if day is None:
+            return cutoff
+
+        while day < cutoff:
+            db_rows = self._db_rows(day)
+            if db_rows and self.archived_rows(day) != db_rows:
+                try:
+                    rows = self.archive_day(day)
+                    logger.info(f"Arquivado {day.isoformat()}: {rows} eventos")
+                except Exception as e:
+                    logger.error(f"Erro ao arquivar {day.isoformat()}: {e}")
+                    return day
+                # Eventos gravados durante a cópia: o dia fica para a próxima execução
+                if self.archived_rows(day) != self._db_rows(day):
+                    logger.warning(f"Arquivo de {day.isoformat()} não confere com o banco")
+                    return day
+            day += timedelta(days=1)
+        return cutoff
+
+
+class ParquetArchiveReader:
+    """Lê janelas do arquivo Parquet com o mesmo formato de load_data_to_dataframe"""
+
+    def __init__(self, root: str = None):
+        self.root = root or os.getenv('ARCHIVE_DIR', 'archive')
+
+    def has_data(self) -> bool:
+        return os.path.isdir(self.root) and any(
+            name.startswith('totem_id=') for name in os.listdir(self.root)
+        )
+
+    def read(self, start: datetime, end: datetime, totem_id: str = None,
+             columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Lê eventos com start <= timestamp < end
+        Só abre os arquivos dos totens/dias do intervalo (poda por partição)
+        """
+        if not self.has_data():
+            return pd.DataFrame()
+
+        dataset = ds.dataset(self.root, format='parquet', partitioning=PARTITIONING)
+
+        condition = (
+            (ds.field('date') >= start.date().isoformat())
+            & (ds.field('date') <= end.date().isoformat())
+            & (ds.field('timestamp') >= pa.scalar(start, type=pa.timestamp('ns')))
+            & (ds.field('timestamp') < pa.scalar(end, type=pa.timestamp('ns')))
+        )
+        if totem_id:
+            condition = condition & (ds.field('totem_id') == totem_id)
+
+        if columns:
+            columns = [c for c in columns if c != 'date']
+            if 'timestamp' not in columns:
+                columns.append('timestamp')
+        table = dataset.to_table(columns=columns, filter=condition)
+        if table.num_rows == 0:
+            return pd.DataFrame()
+
+        df = table.to_pandas()
+        df = df.drop(columns=['date'], errors='ignore')
+        return compact_dtypes(df).sort_values('timestamp').reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Arquiva sensor_events em Parquet')
+    parser.add_argument('--older-than', type=int, default=int(os.getenv('HOT_RETENTION_DAYS', 90)),
+                        help='Arquiva dias anteriores a N dias atrás')
+    args = parser.parse_args()
+
+    archiver = ParquetArchiver()
+    total = archiver.archive_older_than(args.older_than)
+    print(f"Eventos arquivados: {total}")
+
+    archiver.db.close()
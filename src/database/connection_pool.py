@@ -0,0 +1,203 @@
+# Pool de conexões com o banco de dados
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extensions import STATUS_READY
+from psycopg2.extras import RealDictCursor
+from contextlib import contextmanager
+import os
+import threading
+import time
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """
+    Pool de conexões thread-safe compartilhado pelo processo
+    Faz health check ao emprestar e descarta conexões derrubadas
+    """
+
+    def __init__(self,
+                 host: str = None,
+                 port: int = None,
+                 database: str = None,
+                 user: str = None,
+                 password: str = None,
+                 minconn: int = None,
+                 maxconn: int = None,
+                 health_check_interval: float = None,
+                 borrow_timeout: float = None):
+        """
+        Inicializa o pool
+        Usa variáveis de ambiente se não fornecidas (DB_* e DB_POOL_*)
+        """
+        self.host = host or os.getenv('DB_HOST', 'localhost')
+        self.port = port or int(os.getenv('DB_PORT', 5432))
+        self.database = database or os.getenv('DB_NAME', 'flexmedia_totem')
+        self.user = user or os.getenv('DB_USER', 'postgres')
+        self.password = password or os.getenv('DB_PASSWORD', 'postgres')
+
+        self.minconn = minconn if minconn is not None else int(os.getenv('DB_POOL_MIN', 1))
+        self.maxconn = maxconn if maxconn is not None else int(os.getenv('DB_POOL_MAX', 10))
+        # Conexões ociosas há mais tempo que isso são testadas com SELECT 1
+        self.health_check_interval = (health_check_interval if health_check_interval is not None
+                                      else float(os.getenv('DB_POOL_HEALTH_CHECK', 30)))
+        self.borrow_timeout = (borrow_timeout if borrow_timeout is not None
+                               else float(os.getenv('DB_POOL_TIMEOUT', 30)))
+
+        if self.maxconn < 1 or self.minconn > self.maxconn:
+            raise ValueError("Configuração de pool inválida: exige 0 <= min <= max e max >= 1")
+
+        # Limita empréstimos simultâneos: bloqueia em vez de levantar PoolError
+        self._slots = threading.BoundedSemaphore(self.maxconn)
+        self._last_used: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+        try:
+            self._pool = pg_pool.ThreadedConnectionPool(
+                self.minconn,
+                self.maxconn,
+                host=self.host,
+                port=self.port,
+                database=self.database,
+                user=self.user,
+                password=self.password
+            )
+        except psycopg2.Error as e:
+            print(f"Erro ao conectar: {e}")
+            raise
+
+    def _is_healthy(self, conn) -> bool:
+        """Verifica se a conexão emprestada ainda está utilizável"""
+        if conn.closed:
+            return False
+
+        with self._lock:
+            last_used = self._last_used.get(id(conn))
+
+        # Conexão recém-criada ou usada há pouco: dispensa o ping
+        if last_used is None or time.monotonic() - last_used < self.health_check_interval:
+            return True
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """Empresta uma conexão saudável do pool (reconecta se necessário)"""
+        if not self._slots.acquire(timeout=self.borrow_timeout):
+            raise pg_pool.PoolError("Tempo esgotado aguardando conexão livre no pool")
+
+        try:
+            # Se o banco reiniciou, várias conexões ociosas podem estar mortas
+            for _ in range(self.maxconn + 1):
+                conn = self._pool.getconn()
+                if self._is_healthy(conn):
+                    return conn
+                logger.warning("Conexão derrubada detectada. Reconectando...")
+                self._discard(conn)
+            raise pg_pool.PoolError("Não foi possível obter uma conexão saudável")
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close: bool = False):
+        """Devolve a conexão ao pool (descarta se estiver quebrada)"""
+        try:
+            if close or conn.closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        finally:
+            self._slots.release()
+
+    def _discard(self, conn):
+        with self._lock:
+            self._last_used.pop(id(conn), None)
+        try:
+            self._pool.putconn(conn, close=True)
+        except pg_pool.PoolError:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager de empréstimo/devolução
+        Faz rollback de qualquer transação deixada aberta (erro, ou gerador de
+        stream_query abandonado com GeneratorExit) e descarta conexões derrubadas
+        """
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if not broken and not conn.closed and conn.status != STATUS_READY:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            self.putconn(conn, close=broken)
+
+    @contextmanager
+    def cursor(self, cursor_factory=RealDictCursor):
+        """Empresta uma conexão e abre um cursor; faz commit ao final"""
+        with self.connection() as conn:
+            with conn.cursor(cursor_factory=cursor_factory) as cursor:
+                yield cursor
+            conn.commit()
+
+    def closeall(self):
+        """Fecha todas as conexões do pool"""
+        if not self._pool.closed:
+            self._pool.closeall()
+
+
+_pools: Dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(host: str = None,
+             port: int = None,
+             database: str = None,
+             user: str = None,
+             password: str = None,
+             **pool_kwargs) -> ConnectionPool:
+    """
+    Retorna o pool do processo para os parâmetros de conexão informados
+    Cria o pool na primeira chamada; as seguintes reaproveitam a mesma instância
+    """
+    key = (
+        host or os.getenv('DB_HOST', 'localhost'),
+        port or int(os.getenv('DB_PORT', 5432)),
+        database or os.getenv('DB_NAME', 'flexmedia_totem'),
+        user or os.getenv('DB_USER', 'postgres'),
+        password or os.getenv('DB_PASSWORD', 'postgres'),
+        os.getpid()
+    )
+
+    with _pools_lock:
+        existing: Optional[ConnectionPool] = _pools.get(key)
+        if existing is None or existing._pool.closed:
+            existing = ConnectionPool(*key[:5], **pool_kwargs)
+            _pools[key] = existing
+        return existing
+
+
+def close_all_pools():
+    """Fecha todos os pools do processo (chamar no encerramento)"""
+    with _pools_lock:
+        for connection_pool in _pools.values():
+            connection_pool.closeall()
+        _pools.clear()
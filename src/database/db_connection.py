@@ -1,27 +1,34 @@
 # Conexão com banco de dados
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from psycopg2 import sql
+from psycopg2.extras import RealDictCursor, execute_values
+from contextlib import contextmanager
 import os
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Tuple
+import uuid
 import logging
 
+from src.database.connection_pool import ConnectionPool, get_pool
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 class DatabaseManager:
-    """Gerencia conexões e operações no banco de dados"""
+    """
+    Gerencia operações no banco de dados
+    Fachada fina sobre o pool de conexões compartilhado pelo processo
+    """
     
     def __init__(self, 
                  host: str = None,
                  port: int = None,
                  database: str = None,
                  user: str = None,
-                 password: str = None):
+                 password: str = None,
+                 pool: ConnectionPool = None):
         """
-        Inicializa conexão com banco de dados
+        Inicializa o gerenciador sobre o pool do processo
         Usa variáveis de ambiente se não fornecidas
         """
         self.host = host or os.getenv('DB_HOST', 'localhost')
@@ -30,28 +37,60 @@ class DatabaseManager:
         self.user = user or os.getenv('DB_USER', 'postgres')
         self.password = password or os.getenv('DB_PASSWORD', 'postgres')
         
-        self.conn = None
-        self._connect()
+        self.pool = pool or get_pool(
+            self.host, self.port, self.database, self.user, self.password
+        )
+        # Conexão fixa, emprestada apenas se alguém acessar self.conn
+        self._pinned_conn = None
+    
+    @property
+    def conn(self):
+        """
+        Conexão dedicada para código legado que usa db.conn diretamente
+        Emprestada do pool no primeiro acesso e devolvida em close()
+        """
+        if self._pinned_conn is None or self._pinned_conn.closed:
+            if self._pinned_conn is not None:
+                self.pool.putconn(self._pinned_conn, close=True)
+            self._pinned_conn = self.pool.getconn()
+        return self._pinned_conn
+    
+    @contextmanager
+    def connection(self):
+        """Empresta uma conexão do pool e a devolve ao final do bloco"""
+        with self.pool.connection() as conn:
+            yield conn
     
-    def _connect(self):
-        """Estabelece conexão com o banco"""
+    def execute_query(self, query: str, params: tuple = None) -> List[Dict]:
         try:
-            self.conn = psycopg2.connect(
-                host=self.host,
-                port=self.port,
-                database=self.database,
-                user=self.user,
-                password=self.password
-            )
+            with self.connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute(query, params)
+                    results = cursor.fetchall()
+                conn.commit()
+                return results
         except psycopg2.Error as e:
-            print(f"Erro ao conectar: {e}")
+            print(f"Erro na query: {e}")
             raise
     
-    def execute_query(self, query: str, params: tuple = None) -> List[Dict]:
+    def stream_query(self, query: str, params: tuple = None,
+                     itersize: int = 10000) -> Iterator[Tuple[List[str], List[tuple]]]:
+        """
+        Executa a query com cursor nomeado (server-side) e entrega o resultado em blocos
+        Gera (nomes das colunas, lista de tuplas) com até itersize linhas por vez
+        A conexão fica emprestada até o gerador terminar ou ser fechado
+        """
         try:
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(query, params)
-                return cursor.fetchall()
+            with self.connection() as conn:
+                with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cursor:
+                    cursor.itersize = itersize
+                    cursor.execute(query, params)
+                    while True:
+                        rows = cursor.fetchmany(itersize)
+                        if not rows:
+                            break
+                        yield [column[0] for column in cursor.description], rows
+                conn.commit()
         except psycopg2.Error as e:
             print(f"Erro na query: {e}")
             raise
@@ -68,13 +107,13 @@ class DatabaseManager:
                 RETURNING id
             """
             
-            with self.conn.cursor() as cursor:
-                cursor.execute(query, values)
-                inserted_id = cursor.fetchone()[0]
-                self.conn.commit()
+            with self.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(query, values)
+                    inserted_id = cursor.fetchone()[0]
+                conn.commit()
                 return inserted_id
         except psycopg2.Error as e:
-            self.conn.rollback()
             print(f"Erro ao inserir: {e}")
             raise
     
@@ -90,6 +129,86 @@ class DatabaseManager:
         }
         return self.execute_insert('sensor_events', data)
     
+    def insert_sensor_events_bulk(self, events: List[Dict], page_size: int = 1000, conn=None) -> int:
+        """
+        Insere vários eventos de sensores em uma única transação
+        Usa INSERT com múltiplos VALUES (execute_values) e um único commit
+        Eventos com 'event_uid' já gravado são ignorados (reenvio idempotente)
+        Se conn for informado, usa a transação do chamador e não faz commit
+        Retorna o número de eventos enviados
+        """
+        rows = [
+            (
+                event.get('session_id'),
+                event.get('totem_id'),
+                event.get('event_type'),
+                event.get('value'),
+                event.get('duration'),
+                event.get('touch_type'),
+                event.get('timestamp'),
+                event.get('event_uid')
+            )
+            for event in events
+        ]
+        
+        if not rows:
+            return 0
+        
+        query = """
+            INSERT INTO sensor_events
+                (session_id, totem_id, event_type, value, duration, touch_type, timestamp, event_uid)
+            VALUES %s
+            ON CONFLICT (event_uid, timestamp) DO NOTHING
+        """
+        
+        if conn is not None:
+            with conn.cursor() as cursor:
+                execute_values(cursor, query, rows, page_size=page_size)
+            return len(rows)
+        
+        try:
+            with self.connection() as conn:
+                with conn.cursor() as cursor:
+                    execute_values(cursor, query, rows, page_size=page_size)
+                conn.commit()
+            return len(rows)
+        except psycopg2.Error as e:
+            print(f"Erro ao inserir eventos em lote: {e}")
+            raise
+    
+    def copy_csv(self, table: str, columns: List[str], buffer, conn=None):
+        """
+        Carrega um buffer CSV com COPY FROM STDIN
+        Se conn for informado, usa a transação do chamador e não faz commit
+        """
+        query = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+        
+        if conn is not None:
+            with conn.cursor() as cursor:
+                cursor.copy_expert(query, buffer)
+            return
+        
+        try:
+            with self.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.copy_expert(query, buffer)
+                conn.commit()
+        except psycopg2.Error as e:
+            print(f"Erro no COPY para {table}: {e}")
+            raise
+    
+    def copy_query_csv(self, query: str, params: tuple, buffer):
+        """Exporta o resultado de uma query em CSV (COPY ... TO STDOUT) para o buffer"""
+        try:
+            with self.connection() as conn:
+                with conn.cursor() as cursor:
+                    bound_query = cursor.mogrify(query, params).decode()
+                    cursor.copy_expert(f"COPY ({bound_query}) TO STDOUT WITH (FORMAT csv)", buffer)
+                conn.commit()
+        except psycopg2.Error as e:
+            print(f"Erro no COPY da query: {e}")
+            raise
+    
     def create_session(self, session_id: str, totem_id: str, started_at: str) -> int:
         data = {
             'session_id': session_id,
@@ -107,16 +226,37 @@ class DatabaseManager:
                     total_interactions = %s
                 WHERE session_id = %s
             """
-            with self.conn.cursor() as cursor:
-                cursor.execute(query, (ended_at, duration, total_interactions, session_id))
-                self.conn.commit()
+            with self.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(query, (ended_at, duration, total_interactions, session_id))
+                conn.commit()
         except psycopg2.Error as e:
-            self.conn.rollback()
             print(f"Erro ao finalizar sessão: {e}")
             raise
     
     def insert_session_aggregate(self, aggregate: Dict) -> int:
-        return self.execute_insert('session_aggregates', aggregate)
+        """Grava o agregado e, na mesma transação, as features dos toques da sessão"""
+        from src.database.feature_store import materialize_session
+        
+        try:
+            columns = list(aggregate.keys())
+            with self.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        f"""
+                        INSERT INTO session_aggregates ({', '.join(columns)})
+                        VALUES ({', '.join(['%s'] * len(columns))})
+                        RETURNING id
+                        """,
+                        [aggregate[c] for c in columns]
+                    )
+                    inserted_id = cursor.fetchone()[0]
+                    materialize_session(cursor, aggregate['session_id'])
+                conn.commit()
+                return inserted_id
+        except psycopg2.Error as e:
+            print(f"Erro ao inserir: {e}")
+            raise
     
     def get_totem_stats(self, totem_id: str = None) -> List[Dict]:
         if totem_id:
@@ -146,9 +286,10 @@ class DatabaseManager:
             return self.execute_query(query)
     
     def close(self):
-        """Fecha conexão com o banco"""
-        if self.conn:
-            self.conn.close()
+        """Devolve a conexão fixa ao pool (o pool continua aberto para o processo)"""
+        if self._pinned_conn is not None:
+            self.pool.putconn(self._pinned_conn)
+            self._pinned_conn = None
     
     def __enter__(self):
         return self
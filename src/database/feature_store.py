@@ -0,0 +1,169 @@
+"""
+Feature Store dos Toques
+Mantém touch_features: uma linha por toque ativo (sensor_events.id) com as features
+de classificação já calculadas. As linhas são gravadas quando a sessão é agregada
+(coletor e spool, na mesma transação do agregado) e refresh() recupera o que faltar
+a partir da marca d'água em session_aggregates.id
+
+Treino e predição leem as mesmas features daqui, sem refazer o join com os dados brutos
+"""
+
+import sys
+import os
+from typing import Dict, Iterable, List
+import logging
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.database.db_connection import DatabaseManager
+from src.database.rollups import confirmed_mark, lock_state
+
+logger = logging.getLogger(__name__)
+
+FEATURE_STORE_NAME = 'touch_features'
+
+FEATURE_TABLE_COLUMNS = ['duration', 'session_duration', 'total_touches',
+                         'avg_light_level', 'time_in_session']
+
+_MATERIALIZE_TEMPLATE = """
+    INSERT INTO touch_features
+        (event_id, aggregate_id, session_id, totem_id, timestamp, touch_type, duration,
+         session_duration, total_touches, avg_light_level, time_in_session)
+    SELECT
+        se.id,
+        sa.id,
+        se.session_id,
+        se.totem_id,
+        se.timestamp,
+        se.touch_type,
+        se.duration,
+        s.duration_seconds,
+        sa.total_touches,
+        sa.avg_light_level,
+        EXTRACT(EPOCH FROM (se.timestamp - s.started_at))
+    FROM session_aggregates sa
+    JOIN sessions s ON s.session_id = sa.session_id
+    JOIN sensor_events se ON se.session_id = sa.session_id
+    WHERE se.event_type = 'touch'
+    AND se.value = 1
+    AND se.duration IS NOT NULL
+    AND {where}
+    ON CONFLICT (event_id) DO NOTHING
+"""
+
+
+def materialize_session(cursor, session_id: str) -> int:
+    """
+    Grava as features dos toques de uma sessão recém-agregada
+    Roda no cursor de quem gravou o agregado (mesma transação)
+    """
+    cursor.execute(_MATERIALIZE_TEMPLATE.format(where="sa.session_id = %s"), (str(session_id),))
+    return cursor.rowcount
+
+
+class TouchFeatureStore:
+    """
+    Atualiza e consulta touch_features
+    Cada refresh materializa só as sessões agregadas acima da marca d'água,
+    até o último id confirmado (rollups.confirmed_mark)
+    """
+
+    def __init__(self, db: DatabaseManager = None):
+        self.db = db or DatabaseManager()
+
+    # Manutenção -------------------------------------------------------
+
+    def refresh(self) -> int:
+        """
+        Materializa as sessões agregadas desde a última execução
+        Retorna a nova marca d'água (último session_aggregates.id materializado):
+        todo agregado com id até ela já está em touch_features
+        """
+        # A segunda passagem confirma o que a primeira acabou de ler (se nada mais estiver em gravação)
+        self._refresh_once()
+        return self._refresh_once()
+
+    def _refresh_once(self) -> int:
+        with self.db.connection() as conn:
+            with conn.cursor() as cursor:
+                high_water_mark = lock_state(cursor, FEATURE_STORE_NAME)
+                new_mark = confirmed_mark(cursor, FEATURE_STORE_NAME, 'session_aggregates', high_water_mark)
+
+                if new_mark > high_water_mark:
+                    cursor.execute(
+                        _MATERIALIZE_TEMPLATE.format(where="sa.id > %s AND sa.id <= %s"),
+                        (high_water_mark, new_mark)
+                    )
+                    cursor.execute(
+                        """
+                        UPDATE rollup_state
+                        SET high_water_mark = %s, updated_at = CURRENT_TIMESTAMP
+                        WHERE name = %s
+                        """,
+                        (new_mark, FEATURE_STORE_NAME)
+                    )
+            conn.commit()
+
+        return new_mark
+
+    def rebuild(self) -> int:
+        """Recalcula a tabela inteira (ex.: depois de mudar a definição das features)"""
+        with self.db.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("TRUNCATE touch_features")
+                cursor.execute(
+                    "UPDATE rollup_state SET high_water_mark = 0 WHERE name = %s",
+                    (FEATURE_STORE_NAME,)
+                )
+            conn.commit()
+
+        return self.refresh()
+
+    # Consultas --------------------------------------------------------
+
+    def training_data(self, after_aggregate_id: int = None, upto_aggregate_id: int = None) -> List[Dict]:
+        """
+        Toques rotulados (short/long) com features completas
+        Com after_aggregate_id, só os de sessões agregadas depois dele; upto_aggregate_id
+        (normalmente a marca retornada por refresh) ignora agregados ainda não confirmados,
+        que transações abertas podem completar com ids menores
+        """
+        conditions = ["touch_type IN ('short', 'long')"]
+        params = []
+        if after_aggregate_id is not None:
+            conditions.append("aggregate_id > %s")
+            params.append(after_aggregate_id)
+        if upto_aggregate_id is not None:
+            conditions.append("aggregate_id <= %s")
+            params.append(upto_aggregate_id)
+
+        return self.db.execute_query(
+            f"""
+            SELECT aggregate_id, touch_type, {', '.join(FEATURE_TABLE_COLUMNS)}
+            FROM touch_features
+            WHERE {' AND '.join(conditions)}
+            AND session_duration IS NOT NULL
+            AND total_touches IS NOT NULL
+            AND avg_light_level IS NOT NULL
+            """,
+            tuple(params)
+        )
+
+    def features_for_events(self, event_ids: Iterable[int]) -> pd.DataFrame:
+        """Features dos toques informados, indexadas por event_id (toques sem linha ficam de fora)"""
+        event_ids = [int(event_id) for event_id in event_ids]
+        if not event_ids:
+            return pd.DataFrame(columns=FEATURE_TABLE_COLUMNS)
+
+        rows = self.db.execute_query(
+            f"""
+            SELECT event_id, {', '.join(FEATURE_TABLE_COLUMNS)}
+            FROM touch_features
+            WHERE event_id = ANY(%s)
+            """,
+            (event_ids,)
+        )
+        df = pd.DataFrame(rows, columns=['event_id', *FEATURE_TABLE_COLUMNS]).set_index('event_id')
+        return df.astype('float64')
@@ -60,6 +60,16 @@ def init_database():
     cursor.close()
     conn.close()
     
+    # Particionamento opcional de sensor_events (SENSOR_EVENTS_PARTITION=day|month)
+    if os.getenv('SENSOR_EVENTS_PARTITION'):
+        sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        from src.database.partitioning import PartitionManager
+        
+        manager = PartitionManager()
+        manager.migrate_to_partitioned()
+        manager.ensure_partitions()
+        print(f"sensor_events particionada por {manager.granularity}")
+    
     print("✅ Banco de dados inicializado!")
 
 
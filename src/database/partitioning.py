@@ -0,0 +1,302 @@
+"""
+Particionamento de sensor_events por intervalo de tempo
+Converte a tabela para particionamento declarativo (por dia ou mês),
+cria partições futuras e aplica retenção removendo partições inteiras
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.database.db_connection import DatabaseManager
+from src.database.rollups import record_change
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = 'sensor_events'
+DEFAULT_PARTITION = 'sensor_events_default'
+
+# Índices do particionado (a chave de partição entra em PK e índices únicos)
+PARTITIONED_INDEXES = [
+    "ALTER TABLE sensor_events ADD PRIMARY KEY (id, timestamp)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_sensor_events_event_uid ON sensor_events(event_uid, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_sensor_events_session ON sensor_events(session_id)",
+    "CREATE INDEX IF NOT EXISTS idx_sensor_events_totem ON sensor_events(totem_id)",
+    "CREATE INDEX IF NOT EXISTS idx_sensor_events_timestamp ON sensor_events(timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_sensor_events_type ON sensor_events(event_type)",
+]
+
+
+class PartitionManager:
+    """Gerencia as partições de sensor_events"""
+
+    def __init__(self, db: DatabaseManager = None, granularity: str = None):
+        self.db = db or DatabaseManager()
+        self.granularity = granularity or os.getenv('SENSOR_EVENTS_PARTITION', 'month')
+
+        if self.granularity not in ('day', 'month'):
+            raise ValueError(f"Granularidade inválida: {self.granularity} (use 'day' ou 'month')")
+
+    # Intervalos -------------------------------------------------------
+
+    def period_start(self, moment: datetime) -> datetime:
+        """Início do período (dia ou mês) que contém o instante"""
+        day = datetime(moment.year, moment.month, moment.day)
+        return day if self.granularity == 'day' else day.replace(day=1)
+
+    def next_period(self, start: datetime) -> datetime:
+        if self.granularity == 'day':
+            return start + timedelta(days=1)
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    def partition_name(self, start: datetime) -> str:
+        fmt = '%Y%m%d' if self.granularity == 'day' else '%Y%m'
+        return f"{PARENT_TABLE}_p{start.strftime(fmt)}"
+
+    def periods_between(self, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        """Períodos [início, fim) que cobrem o intervalo informado"""
+        periods = []
+        current = self.period_start(start)
+        while current <= end:
+            upper = self.next_period(current)
+            periods.append((current, upper))
+            current = upper
+        return periods
+
+    # Consultas de catálogo --------------------------------------------
+
+    def is_partitioned(self) -> bool:
+        result = self.db.execute_query(
+            """
+            SELECT c.relkind = 'p' AS partitioned
+            FROM pg_class c
+            WHERE c.oid = to_regclass(%s)
+            """,
+            (PARENT_TABLE,)
+        )
+        return bool(result and result[0]['partitioned'])
+
+    def list_partitions(self) -> List[Dict]:
+        """Partições (inclusive a DEFAULT) com seus limites e estimativa de linhas"""
+        return self.db.execute_query(
+            """
+            SELECT
+                child.relname AS name,
+                pg_get_expr(child.relpartbound, child.oid) AS bound,
+                child.reltuples::bigint AS estimated_rows
+            FROM pg_inherits i
+            JOIN pg_class parent ON parent.oid = i.inhparent
+            JOIN pg_class child ON child.oid = i.inhrelid
+            WHERE parent.relname = %s
+            ORDER BY child.relname
+            """,
+            (PARENT_TABLE,)
+        )
+
+    # Migração ----------------------------------------------------------
+
+    def migrate_to_partitioned(self):
+        """
+        Converte sensor_events (tabela comum) em tabela particionada
+        Cria partições para todo o histórico existente e copia os dados
+        Executa em uma única transação
+        """
+        if self.is_partitioned():
+            logger.info("sensor_events já é particionada")
+            return
+
+        with self.db.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT MIN(timestamp), MAX(timestamp) FROM sensor_events")
+                oldest, newest = cursor.fetchone()
+
+                cursor.execute("ALTER TABLE sensor_events RENAME TO sensor_events_legacy")
+                cursor.execute("ALTER SEQUENCE sensor_events_id_seq OWNED BY NONE")
+                cursor.execute(
+                    """
+                    CREATE TABLE sensor_events (
+                        id INTEGER NOT NULL DEFAULT nextval('sensor_events_id_seq'),
+                        session_id UUID,
+                        totem_id VARCHAR(50) NOT NULL,
+                        event_type VARCHAR(20) NOT NULL,
+                        value INTEGER NOT NULL,
+                        duration DECIMAL(10, 2),
+                        touch_type VARCHAR(10),
+                        timestamp TIMESTAMP NOT NULL,
+                        event_uid UUID,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (session_id) REFERENCES sessions(session_id),
+                        FOREIGN KEY (totem_id) REFERENCES totems(totem_id)
+                    ) PARTITION BY RANGE (timestamp)
+                    """
+                )
+                cursor.execute(
+                    f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF sensor_events DEFAULT"
+                )
+
+                now = datetime.now()
+                for start, end in self.periods_between(oldest or now, max(newest or now, now)):
+                    cursor.execute(
+                        f"""
+                        CREATE TABLE {self.partition_name(start)}
+                        PARTITION OF sensor_events FOR VALUES FROM (%s) TO (%s)
+                        """,
+                        (start, end)
+                    )
+
+                cursor.execute(
+                    """
+                    INSERT INTO sensor_events
+                        (id, session_id, totem_id, event_type, value, duration,
+                         touch_type, timestamp, event_uid, created_at)
+                    SELECT id, session_id, totem_id, event_type, value, duration,
+                           touch_type, timestamp, event_uid, created_at
+                    FROM sensor_events_legacy
+                    """
+                )
+                cursor.execute("DROP TABLE sensor_events_legacy")
+
+                for statement in PARTITIONED_INDEXES:
+                    cursor.execute(statement)
+                cursor.execute("ALTER SEQUENCE sensor_events_id_seq OWNED BY sensor_events.id")
+            conn.commit()
+
+        logger.info("sensor_events convertida para particionamento por %s", self.granularity)
+
+    # Criação de partições --------------------------------------------
+
+    def ensure_partitions(self, start: datetime = None, end: datetime = None, ahead: int = 3) -> List[str]:
+        """
+        Garante partições de start até end + `ahead` períodos futuros
+        Linhas que caíram na partição DEFAULT são movidas para a nova partição
+        Retorna os nomes das partições criadas
+        """
+        now = datetime.now()
+        start = start or now
+        end = end or now
+        for _ in range(ahead):
+            end = self.next_period(self.period_start(end))
+
+        existing = {p['name'] for p in self.list_partitions()}
+        created = []
+
+        with self.db.connection() as conn:
+            with conn.cursor() as cursor:
+                for lower, upper in self.periods_between(start, end):
+                    name = self.partition_name(lower)
+                    if name in existing:
+                        continue
+                    self._create_partition(cursor, name, lower, upper)
+                    created.append(name)
+            conn.commit()
+
+        if created:
+            logger.info("Partições criadas: %s", ', '.join(created))
+        return created
+
+    def _create_partition(self, cursor, name: str, lower: datetime, upper: datetime):
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE timestamp >= %s AND timestamp < %s)",
+            (lower, upper)
+        )
+        has_default_rows = cursor.fetchone()[0]
+
+        if not has_default_rows:
+            cursor.execute(
+                f"CREATE TABLE {name} PARTITION OF sensor_events FOR VALUES FROM (%s) TO (%s)",
+                (lower, upper)
+            )
+            return
+
+        # A DEFAULT não pode conter linhas do novo intervalo: move antes de anexar
+        cursor.execute(f"ALTER TABLE sensor_events DETACH PARTITION {DEFAULT_PARTITION}")
+        cursor.execute(
+            f"CREATE TABLE {name} PARTITION OF sensor_events FOR VALUES FROM (%s) TO (%s)",
+            (lower, upper)
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO sensor_events
+            SELECT * FROM {DEFAULT_PARTITION} WHERE timestamp >= %s AND timestamp < %s
+            """,
+            (lower, upper)
+        )
+        cursor.execute(
+            f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= %s AND timestamp < %s",
+            (lower, upper)
+        )
+        cursor.execute(f"ALTER TABLE sensor_events ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+
+    # Retenção ----------------------------------------------------------
+
+    def drop_partitions_before(self, cutoff: datetime) -> Dict[str, int]:
+        """
+        Desanexa e remove partições inteiramente anteriores ao corte
+        Retorna {partição: linhas estimadas} das partições removidas
+        """
+        dropped = {}
+
+        with self.db.connection() as conn:
+            with conn.cursor() as cursor:
+                for partition in self.list_partitions():
+                    name = partition['name']
+                    if name == DEFAULT_PARTITION:
+                        continue
+
+                    _, upper = self._partition_range(name)
+                    if upper > cutoff:
+                        continue
+
+                    cursor.execute(f"ALTER TABLE sensor_events DETACH PARTITION {name}")
+                    cursor.execute(f"DROP TABLE {name}")
+                    dropped[name] = max(int(partition['estimated_rows']), 0)
+                if dropped:
+                    record_change(cursor)
+            conn.commit()
+
+        if dropped:
+            logger.info("Partições removidas: %s", ', '.join(dropped))
+        return dropped
+
+    @staticmethod
+    def _partition_range(name: str) -> Tuple[datetime, datetime]:
+        """Limites [início, fim) a partir do nome (vale para partições diárias e mensais)"""
+        suffix = name.rsplit('_p', 1)[1]
+        if len(suffix) == 8:
+            lower = datetime.strptime(suffix, '%Y%m%d')
+            return lower, lower + timedelta(days=1)
+        lower = datetime.strptime(suffix, '%Y%m')
+        return lower, (lower.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Gerencia partições de sensor_events')
+    parser.add_argument('--granularity', choices=['day', 'month'], default=None)
+    parser.add_argument('--migrate', action='store_true', help='Converte a tabela para particionada')
+    parser.add_argument('--ahead', type=int, default=3, help='Períodos futuros a criar')
+    parser.add_argument('--retention-days', type=int, default=None, help='Remove partições mais antigas')
+    args = parser.parse_args()
+
+    manager = PartitionManager(granularity=args.granularity)
+
+    if args.migrate:
+        manager.migrate_to_partitioned()
+
+    if manager.is_partitioned():
+        manager.ensure_partitions(ahead=args.ahead)
+        if args.retention_days:
+            manager.drop_partitions_before(datetime.now() - timedelta(days=args.retention_days))
+        for partition in manager.list_partitions():
+            print(f"{partition['name']}: {partition['bound']} (~{partition['estimated_rows']} linhas)")
+    else:
+        print("sensor_events não é particionada. Use --migrate.")
+
+    manager.db.close()
@@ -0,0 +1,398 @@
+"""
+Rollups Pré-Agregados de sensor_events
+Mantém sensor_events_hourly (totem x hora x tipo) e sensor_events_daily (totem x dia x tipo)
+de forma incremental, a partir da marca d'água do último id agregado
+
+A marca só avança até ids confirmados (confirmed_mark): um id lido num snapshot
+passa a valer quando todas as transações abertas naquele momento terminaram,
+então linhas de transações longas (ex.: COPY) com ids menores nunca ficam para trás
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.database.db_connection import DatabaseManager
+from src.database.quantile_sketch import LogBucketSketch, bin_sql
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_NAME = 'sensor_events_rollups'
+# Contador de alterações em linhas já gravadas (limpeza, retenção, rebuild);
+# junto com MAX(id) forma a versão dos dados usada pelos caches de relatório
+CHANGES_STATE = 'sensor_events_changes'
+
+ROLLUP_TABLES = {
+    'sensor_events_hourly': "date_trunc('hour', timestamp)",
+    'sensor_events_daily': "timestamp::date",
+}
+
+_UPSERT_TEMPLATE = """
+    INSERT INTO {table} AS r
+        (totem_id, bucket, event_type, event_count, active_count, short_touches,
+         long_touches, touch_duration_sum, value_sum, value_min, value_max)
+    SELECT
+        totem_id,
+        {bucket},
+        event_type,
+        COUNT(*),
+        COUNT(*) FILTER (WHERE value = 1 AND event_type IN ('touch', 'presence')),
+        COUNT(*) FILTER (WHERE event_type = 'touch' AND value = 1 AND touch_type = 'short'),
+        COUNT(*) FILTER (WHERE event_type = 'touch' AND value = 1 AND touch_type = 'long'),
+        COALESCE(SUM(duration) FILTER (WHERE event_type = 'touch' AND value = 1), 0),
+        SUM(value),
+        MIN(value),
+        MAX(value)
+    FROM sensor_events
+    WHERE session_id IS NOT NULL AND {where}
+    GROUP BY 1, 2, 3
+    ON CONFLICT (totem_id, bucket, event_type) DO UPDATE SET
+        event_count = r.event_count + EXCLUDED.event_count,
+        active_count = r.active_count + EXCLUDED.active_count,
+        short_touches = r.short_touches + EXCLUDED.short_touches,
+        long_touches = r.long_touches + EXCLUDED.long_touches,
+        touch_duration_sum = r.touch_duration_sum + EXCLUDED.touch_duration_sum,
+        value_sum = r.value_sum + EXCLUDED.value_sum,
+        value_min = LEAST(r.value_min, EXCLUDED.value_min),
+        value_max = GREATEST(r.value_max, EXCLUDED.value_max)
+"""
+
+QUANTILE_TABLE = 'sensor_events_hourly_quantiles'
+
+# Métrica do sketch -> (coluna, filtro dos eventos)
+QUANTILE_METRICS = {
+    'ldr': ('value', "event_type = 'ldr'"),
+    'touch_duration': ('duration', "event_type = 'touch' AND value = 1 AND duration IS NOT NULL"),
+}
+
+_QUANTILE_UPSERT_TEMPLATE = """
+    INSERT INTO sensor_events_hourly_quantiles AS r (totem_id, bucket, metric, bin, count)
+    SELECT totem_id, date_trunc('hour', timestamp), %s, {bin}, COUNT(*)
+    FROM sensor_events
+    WHERE session_id IS NOT NULL AND {metric_filter} AND {where}
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (totem_id, bucket, metric, bin) DO UPDATE SET
+        count = r.count + EXCLUDED.count
+"""
+
+
+def _quantile_upserts(where: str):
+    """(sql, métrica) de cada sketch para o recorte de eventos informado"""
+    for metric, (column, metric_filter) in QUANTILE_METRICS.items():
+        yield _QUANTILE_UPSERT_TEMPLATE.format(bin=bin_sql(column), metric_filter=metric_filter,
+                                               where=where), metric
+
+
+def lock_state(cursor, name: str) -> int:
+    """Cria (se preciso) e trava a linha de estado; retorna a marca d'água atual"""
+    cursor.execute(
+        "INSERT INTO rollup_state (name) VALUES (%s) ON CONFLICT (name) DO NOTHING",
+        (name,)
+    )
+    # Trava a linha de estado: execuções concorrentes não processam em dobro
+    cursor.execute(
+        "SELECT high_water_mark FROM rollup_state WHERE name = %s FOR UPDATE",
+        (name,)
+    )
+    return cursor.fetchone()[0]
+
+
+def confirmed_mark(cursor, name: str, table: str, high_water_mark: int) -> int:
+    """
+    Maior id de `table` até o qual não pode mais surgir linha nova
+    Ids de sequência são reservados no início do INSERT/COPY mas só ficam visíveis
+    no commit; por isso cada chamada guarda MAX(id) junto com o xmax do snapshot
+    (pending_mark/pending_xid) e a marca só é liberada numa chamada seguinte,
+    quando o xmin atual mostra que todas as transações daquele snapshot terminaram
+    Uma marca já confirmada e ainda não alcançada (lotes limitados) fica guardada
+    sem xid, para não esperar outra vez
+    Precisa da linha de estado travada (lock_state)
+    """
+    cursor.execute(
+        """
+        SELECT pending_mark, pending_xid, pg_snapshot_xmin(pg_current_snapshot())::text::bigint
+        FROM rollup_state
+        WHERE name = %s
+        """,
+        (name,)
+    )
+    pending_mark, pending_xid, oldest_running = cursor.fetchone()
+
+    if pending_xid is not None and oldest_running < pending_xid:
+        # Transações daquele snapshot ainda abertas: mantém a marca candidata
+        return high_water_mark
+
+    confirmed = max(pending_mark or 0, high_water_mark)
+    # MAX(id) e xmax no mesmo comando (mesmo snapshot)
+    cursor.execute(
+        f"""
+        SELECT MAX(id), pg_snapshot_xmax(pg_current_snapshot())::text::bigint
+        FROM {table}
+        WHERE id > %s
+        """,
+        (confirmed,)
+    )
+    candidate, snapshot_xmax = cursor.fetchone()
+    if candidate is None:
+        candidate, snapshot_xmax = (confirmed, None) if confirmed > high_water_mark else (None, None)
+    cursor.execute(
+        "UPDATE rollup_state SET pending_mark = %s, pending_xid = %s WHERE name = %s",
+        (candidate, snapshot_xmax, name)
+    )
+    return confirmed
+
+
+def record_change(cursor):
+    """Incrementa o contador de alterações, na mesma transação da escrita"""
+    cursor.execute(
+        """
+        INSERT INTO rollup_state (name, high_water_mark) VALUES (%s, 1)
+        ON CONFLICT (name) DO UPDATE SET
+            high_water_mark = rollup_state.high_water_mark + 1,
+            updated_at = CURRENT_TIMESTAMP
+        """,
+        (CHANGES_STATE,)
+    )
+
+
+class RollupManager:
+    """
+    Atualiza e consulta os rollups horários e diários
+    Cada refresh agrega apenas os eventos com id acima da marca d'água
+    e até o último id confirmado (eventos recém-gravados entram no refresh seguinte)
+    """
+
+    def __init__(self, db: DatabaseManager = None):
+        self.db = db or DatabaseManager()
+
+    # Manutenção -------------------------------------------------------
+
+    def refresh(self) -> int:
+        """
+        Agrega os eventos novos desde a última execução
+        Retorna a nova marca d'água (último id agregado)
+        """
+        # A segunda passagem confirma o que a primeira acabou de ler (se nada mais estiver em gravação)
+        self._refresh_once()
+        return self._refresh_once()
+
+    def _refresh_once(self) -> int:
+        with self.db.connection() as conn:
+            with conn.cursor() as cursor:
+                high_water_mark = lock_state(cursor, ROLLUP_NAME)
+                new_mark = confirmed_mark(cursor, ROLLUP_NAME, 'sensor_events', high_water_mark)
+
+                if new_mark > high_water_mark:
+                    for table, bucket in ROLLUP_TABLES.items():
+                        cursor.execute(
+                            _UPSERT_TEMPLATE.format(table=table, bucket=bucket, where="id > %s AND id <= %s"),
+                            (high_water_mark, new_mark)
+                        )
+                    for statement, metric in _quantile_upserts("id > %s AND id <= %s"):
+                        cursor.execute(statement, (metric, high_water_mark, new_mark))
+                    cursor.execute(
+                        """
+                        UPDATE rollup_state
+                        SET high_water_mark = %s, updated_at = CURRENT_TIMESTAMP
+                        WHERE name = %s
+                        """,
+                        (new_mark, ROLLUP_NAME)
+                    )
+            conn.commit()
+
+        return new_mark
+
+    def rebuild(self, since: datetime = None) -> int:
+        """
+        Recalcula os rollups a partir dos dados brutos
+        Use após limpezas que alteram ou removem eventos já agregados
+        Sem `since` recalcula tudo; com `since` apenas os buckets a partir da data
+        """
+        with self.db.connection() as conn:
+            with conn.cursor() as cursor:
+                high_water_mark = lock_state(cursor, ROLLUP_NAME)
+
+                if since is None:
+                    for table in [*ROLLUP_TABLES, QUANTILE_TABLE]:
+                        cursor.execute(f"TRUNCATE {table}")
+                    cursor.execute(
+                        "UPDATE rollup_state SET high_water_mark = 0 WHERE name = %s",
+                        (ROLLUP_NAME,)
+                    )
+                else:
+                    # O corte é alinhado ao dia para que os buckets diários fiquem completos
+                    day = datetime(since.year, since.month, since.day)
+                    for table in [*ROLLUP_TABLES, QUANTILE_TABLE]:
+                        cursor.execute(f"DELETE FROM {table} WHERE bucket >= %s", (day,))
+                    for table, bucket in ROLLUP_TABLES.items():
+                        cursor.execute(
+                            _UPSERT_TEMPLATE.format(table=table, bucket=bucket,
+                                                    where="timestamp >= %s AND id <= %s"),
+                            (day, high_water_mark)
+                        )
+                    for statement, metric in _quantile_upserts("timestamp >= %s AND id <= %s"):
+                        cursor.execute(statement, (metric, day, high_water_mark))
+                record_change(cursor)
+            conn.commit()
+
+        return self.refresh()
+
+    # Consultas --------------------------------------------------------
+
+    def is_available(self) -> bool:
+        """True se os rollups já foram populados ao menos uma vez"""
+        result = self.db.execute_query(
+            "SELECT high_water_mark FROM rollup_state WHERE name = %s",
+            (ROLLUP_NAME,)
+        )
+        return bool(result and result[0]['high_water_mark'] > 0)
+
+    @staticmethod
+    def _window(totem_id: Optional[str], days: int, event_types: List[str] = None):
+        """
+        Recorte do período, no mesmo escopo do relatório em memória (eventos com sessão,
+        a partir de agora - days): horas completas vêm dos rollups (ids até a marca
+        d'água); a hora parcial do início e os eventos ainda não agregados vêm de sensor_events
+        Retorna (filtro dos rollups, parâmetros, filtro de sensor_events, parâmetros)
+        """
+        since = datetime.now() - timedelta(days=days)
+        first_bucket = since.replace(minute=0, second=0, microsecond=0)
+        if first_bucket < since:
+            first_bucket += timedelta(hours=1)
+
+        rollup, rollup_params = ["bucket >= %s"], [first_bucket]
+        raw = [
+            "session_id IS NOT NULL",
+            "timestamp >= %s",
+            "(timestamp < %s OR id > (SELECT high_water_mark FROM rollup_state WHERE name = %s))",
+        ]
+        raw_params = [since, first_bucket, ROLLUP_NAME]
+        if totem_id:
+            for conditions, params in ((rollup, rollup_params), (raw, raw_params)):
+                conditions.append("totem_id = %s")
+                params.append(totem_id)
+        if event_types:
+            for conditions, params in ((rollup, rollup_params), (raw, raw_params)):
+                conditions.append("event_type = ANY(%s)")
+                params.append(list(event_types))
+        return ' AND '.join(rollup), rollup_params, ' AND '.join(raw), raw_params
+
+    def _hourly_counts(self, totem_id: Optional[str], days: int, event_types: List[str] = None):
+        """
+        SQL de (bucket, event_type, count) do período e seus parâmetros
+        Rollups e eventos brutos são lidos no mesmo comando (mesmo snapshot da marca d'água)
+        """
+        rollup_where, rollup_params, raw_where, raw_params = self._window(totem_id, days, event_types)
+        query = f"""
+            SELECT bucket, event_type, event_count AS count
+            FROM sensor_events_hourly
+            WHERE {rollup_where}
+            UNION ALL
+            SELECT date_trunc('hour', timestamp), event_type, COUNT(*)
+            FROM sensor_events
+            WHERE {raw_where}
+            GROUP BY 1, 2
+        """
+        return query, tuple(rollup_params + raw_params)
+
+    def hourly_distribution(self, totem_id: str = None, days: int = 30) -> Dict[int, int]:
+        """Eventos por hora do dia (0-23) no período"""
+        counts, params = self._hourly_counts(totem_id, days)
+        rows = self.db.execute_query(
+            f"""
+            SELECT EXTRACT(HOUR FROM bucket)::int AS hour, SUM(count)::bigint AS count
+            FROM ({counts}) hourly
+            GROUP BY 1
+            ORDER BY 1
+            """,
+            params
+        )
+        return {r['hour']: r['count'] for r in rows}
+
+    def daily_distribution(self, totem_id: str = None, days: int = 30) -> Dict[str, int]:
+        """Eventos por dia da semana (nomes em inglês, como pandas day_name())"""
+        counts, params = self._hourly_counts(totem_id, days)
+        rows = self.db.execute_query(
+            f"""
+            SELECT to_char(bucket, 'FMDay') AS day_of_week, SUM(count)::bigint AS count
+            FROM ({counts}) hourly
+            GROUP BY 1
+            ORDER BY 1
+            """,
+            params
+        )
+        return {r['day_of_week']: r['count'] for r in rows}
+
+    def hourly_series(self, totem_id: str = None, days: int = 30,
+                      event_types: List[str] = None) -> List[Dict]:
+        """Série (bucket horário, event_type, count) para gráficos temporais"""
+        counts, params = self._hourly_counts(totem_id, days, event_types)
+        return self.db.execute_query(
+            f"""
+            SELECT bucket AS timestamp, event_type, SUM(count)::bigint AS count
+            FROM ({counts}) hourly
+            GROUP BY 1, 2
+            ORDER BY 1
+            """,
+            params
+        )
+
+    def quantile_sketch(self, metric: str, totem_id: str = None, days: int = 30) -> LogBucketSketch:
+        """
+        Sketch da métrica ('ldr' ou 'touch_duration') mesclado no Postgres
+        para o totem (ou todos) e o período; trafega um par (bin, count) por bin
+        """
+        column, metric_filter = QUANTILE_METRICS[metric]
+        rollup_where, rollup_params, raw_where, raw_params = self._window(totem_id, days)
+        rows = self.db.execute_query(
+            f"""
+            SELECT bin, SUM(count)::bigint AS count
+            FROM (
+                SELECT bin, count
+                FROM {QUANTILE_TABLE}
+                WHERE {rollup_where} AND metric = %s
+                UNION ALL
+                SELECT {bin_sql(column)}, COUNT(*)
+                FROM sensor_events
+                WHERE {metric_filter} AND {raw_where}
+                GROUP BY 1
+            ) bins
+            GROUP BY bin
+            """,
+            tuple(rollup_params) + (metric,) + tuple(raw_params)
+        )
+        return LogBucketSketch.from_bins((r['bin'], r['count']) for r in rows)
+
+    def temporal_patterns(self, totem_id: str = None, days: int = 30) -> Dict:
+        """Mesmo formato de DataAnalyzer.analyze_temporal_patterns, lido dos rollups"""
+        hourly = self.hourly_distribution(totem_id, days)
+        daily = self.daily_distribution(totem_id, days)
+
+        peak_hour = max(hourly.items(), key=lambda x: x[1])[0] if hourly else None
+
+        return {
+            'hourly_distribution': hourly,
+            'daily_distribution': daily,
+            'peak_hour': peak_hour,
+            'peak_hour_count': hourly.get(peak_hour, 0) if peak_hour else 0
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Atualiza os rollups de sensor_events')
+    parser.add_argument('--rebuild', action='store_true', help='Recalcula tudo a partir dos dados brutos')
+    args = parser.parse_args()
+
+    manager = RollupManager()
+    mark = manager.rebuild() if args.rebuild else manager.refresh()
+    print(f"Rollups atualizados até o evento id={mark}")
+
+    manager.db.close()
@@ -31,11 +31,17 @@ CREATE TABLE IF NOT EXISTS sensor_events (
     duration DECIMAL(10, 2), -- Duração do toque em segundos
     touch_type VARCHAR(10), -- 'short', 'long', 'none'
     timestamp TIMESTAMP NOT NULL,
+    event_uid UUID, -- Chave idempotente (reenvio do spool do coletor)
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (session_id) REFERENCES sessions(session_id),
     FOREIGN KEY (totem_id) REFERENCES totems(totem_id)
 );
 
+-- Migração de bancos criados antes da coluna event_uid (índice único garante a idempotência)
+-- O índice inclui timestamp para valer também com sensor_events particionada (partitioning.py)
+ALTER TABLE sensor_events ADD COLUMN IF NOT EXISTS event_uid UUID;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_sensor_events_event_uid ON sensor_events(event_uid, timestamp);
+
 -- Tabela de Agregações por Sessão (para análise)
 CREATE TABLE IF NOT EXISTS session_aggregates (
     id SERIAL PRIMARY KEY,
@@ -61,6 +67,79 @@ CREATE INDEX IF NOT EXISTS idx_sensor_events_type ON sensor_events(event_type);
 CREATE INDEX IF NOT EXISTS idx_sessions_totem ON sessions(totem_id);
 CREATE INDEX IF NOT EXISTS idx_sessions_started_at ON sessions(started_at);
 
+-- Rollups pré-agregados (mantidos por src/database/rollups.py)
+-- Uma linha por totem x hora x tipo de evento
+CREATE TABLE IF NOT EXISTS sensor_events_hourly (
+    totem_id VARCHAR(50) NOT NULL,
+    bucket TIMESTAMP NOT NULL, -- date_trunc('hour', timestamp)
+    event_type VARCHAR(20) NOT NULL,
+    event_count BIGINT NOT NULL DEFAULT 0,
+    active_count BIGINT NOT NULL DEFAULT 0, -- value = 1 (touch/presence)
+    short_touches BIGINT NOT NULL DEFAULT 0,
+    long_touches BIGINT NOT NULL DEFAULT 0,
+    touch_duration_sum DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    value_sum BIGINT NOT NULL DEFAULT 0, -- soma de LDR
+    value_min INTEGER,
+    value_max INTEGER,
+    PRIMARY KEY (totem_id, bucket, event_type)
+);
+
+-- Uma linha por totem x dia x tipo de evento
+CREATE TABLE IF NOT EXISTS sensor_events_daily (
+    totem_id VARCHAR(50) NOT NULL,
+    bucket DATE NOT NULL,
+    event_type VARCHAR(20) NOT NULL,
+    event_count BIGINT NOT NULL DEFAULT 0,
+    active_count BIGINT NOT NULL DEFAULT 0,
+    short_touches BIGINT NOT NULL DEFAULT 0,
+    long_touches BIGINT NOT NULL DEFAULT 0,
+    touch_duration_sum DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    value_sum BIGINT NOT NULL DEFAULT 0,
+    value_min INTEGER,
+    value_max INTEGER,
+    PRIMARY KEY (totem_id, bucket, event_type)
+);
+
+CREATE INDEX IF NOT EXISTS idx_sensor_events_hourly_bucket ON sensor_events_hourly(bucket);
+CREATE INDEX IF NOT EXISTS idx_sensor_events_daily_bucket ON sensor_events_daily(bucket);
+
+-- Sketches de quantis (LogBucketSketch, src/database/quantile_sketch.py)
+-- Uma linha por totem x hora x métrica x bin; somar count por bin mescla totens e janelas
+CREATE TABLE IF NOT EXISTS sensor_events_hourly_quantiles (
+    totem_id VARCHAR(50) NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    metric VARCHAR(20) NOT NULL, -- 'ldr' (value) ou 'touch_duration' (duration dos toques ativos)
+    bin INTEGER NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (totem_id, bucket, metric, bin)
+);
+
+CREATE INDEX IF NOT EXISTS idx_sensor_events_hourly_quantiles_bucket ON sensor_events_hourly_quantiles(bucket, metric);
+
+-- Marca d'água (último sensor_events.id agregado) de cada processo incremental
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name VARCHAR(50) PRIMARY KEY,
+    high_water_mark BIGINT NOT NULL DEFAULT 0,
+    -- Próxima marca candidata e o xmax do snapshot em que foi lida (rollups.confirmed_mark)
+    pending_mark BIGINT,
+    pending_xid BIGINT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE rollup_state ADD COLUMN IF NOT EXISTS pending_mark BIGINT;
+ALTER TABLE rollup_state ADD COLUMN IF NOT EXISTS pending_xid BIGINT;
+
+-- Lotes já limpos pela limpeza incremental (src/data_cleaning.py)
+-- Cada lote cobre sensor_events.id em (id_from, id_to] e nunca é reprocessado
+CREATE TABLE IF NOT EXISTS cleaning_batches (
+    id SERIAL PRIMARY KEY,
+    id_from BIGINT NOT NULL,
+    id_to BIGINT NOT NULL,
+    duplicates_removed INTEGER NOT NULL DEFAULT 0,
+    invalid_fixed INTEGER NOT NULL DEFAULT 0,
+    processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- View para análise de interações
 CREATE OR REPLACE VIEW interaction_analysis AS
 SELECT 
@@ -82,3 +161,23 @@ FROM sessions s
 LEFT JOIN session_aggregates sa ON s.session_id = sa.session_id
 WHERE s.ended_at IS NOT NULL;
 
+
+-- Features de classificação de toques (src/database/feature_store.py)
+-- Uma linha por toque ativo, gravada quando a sessão é agregada; treino e predição leem daqui
+CREATE TABLE IF NOT EXISTS touch_features (
+    event_id BIGINT PRIMARY KEY, -- sensor_events.id
+    aggregate_id INTEGER NOT NULL, -- session_aggregates.id (marca d'água do treino incremental)
+    session_id UUID NOT NULL,
+    totem_id VARCHAR(50) NOT NULL,
+    timestamp TIMESTAMP NOT NULL,
+    touch_type VARCHAR(10),
+    duration DECIMAL(10, 2) NOT NULL,
+    session_duration DECIMAL(10, 2),
+    total_touches INTEGER,
+    avg_light_level DECIMAL(10, 2),
+    time_in_session DECIMAL(12, 3),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_touch_features_aggregate ON touch_features(aggregate_id);
+CREATE INDEX IF NOT EXISTS idx_touch_features_timestamp ON touch_features(timestamp);
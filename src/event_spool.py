@@ -0,0 +1,344 @@
+# Spool de eventos (write-ahead) para o coletor
+
+import sys
+import os
+import json
+import time
+import uuid
+import threading
+from itertools import groupby
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import psycopg2
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database.db_connection import DatabaseManager
+from src.database.feature_store import materialize_session
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+CHECKPOINT_FILE = 'checkpoint.json'
+DEAD_LETTER_FILE = 'dead_letter.jsonl'
+
+# Erros do próprio registro: repetir não resolve, o registro vai para o dead-letter
+# (banco fora do ar/conexão caída continuam sendo repetidos por run())
+DATA_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError, KeyError, TypeError, ValueError)
+
+
+def _segment_name(number: int) -> str:
+    return f"{SEGMENT_PREFIX}{number:08d}{SEGMENT_SUFFIX}"
+
+
+def _segment_number(name: str) -> int:
+    return int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+def list_segments(directory: str) -> List[str]:
+    """Lista os segmentos do spool em ordem de escrita"""
+    names = [
+        n for n in os.listdir(directory)
+        if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX)
+    ]
+    return sorted(names, key=_segment_number)
+
+
+class EventSpool:
+    """
+    Log append-only em disco, dividido em segmentos
+    Cada registro é uma linha JSON: {"kind", "key", "data"}
+    O fsync é feito em lote (a cada N registros, T segundos ou em sync())
+    """
+
+    def __init__(self,
+                 directory: str = None,
+                 segment_max_bytes: int = 16 * 1024 * 1024,
+                 fsync_every: int = 500,
+                 fsync_interval: float = 1.0):
+        self.directory = directory or os.getenv('COLLECTOR_SPOOL_DIR', 'spool')
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+        # Sempre começa um segmento novo: o último pode ter sido cortado num crash
+        existing = list_segments(self.directory)
+        next_number = _segment_number(existing[-1]) + 1 if existing else 1
+        self._open_segment(next_number)
+
+    def _open_segment(self, number: int):
+        self.active_segment = _segment_name(number)
+        self._segment_number = number
+        self._file = open(os.path.join(self.directory, self.active_segment), 'ab')
+
+    def _sync_locked(self):
+        if self._pending:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def append(self, kind: str, data: Dict, key: str = None) -> str:
+        """Acrescenta um registro ao spool e retorna sua chave idempotente"""
+        return self.append_many(kind, [data], [key] if key else None)[0]
+
+    def append_many(self, kind: str, items: List[Dict], keys: List[str] = None) -> List[str]:
+        """Acrescenta vários registros do mesmo tipo com uma única escrita"""
+        keys = keys or [str(uuid.uuid4()) for _ in items]
+        payload = b''.join(
+            json.dumps({'kind': kind, 'key': key, 'data': data}, default=str).encode('utf-8') + b'\n'
+            for key, data in zip(keys, items)
+        )
+
+        with self._lock:
+            self._file.write(payload)
+            self._pending += len(items)
+
+            if (self._pending >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync_locked()
+
+            if self._file.tell() >= self.segment_max_bytes:
+                self._sync_locked()
+                self._file.close()
+                self._open_segment(self._segment_number + 1)
+
+        return keys
+
+    def sync(self):
+        """Força o fsync dos registros pendentes"""
+        with self._lock:
+            self._sync_locked()
+
+    def close(self):
+        with self._lock:
+            self._sync_locked()
+            self._file.close()
+
+
+class SpoolDrainer(threading.Thread):
+    """
+    Thread que reenvia o spool ao banco, em ordem, a partir do checkpoint
+    Cada lote é aplicado em uma transação com chaves idempotentes,
+    então reprocessar um lote após falha ou crash não duplica dados
+    """
+
+    def __init__(self,
+                 directory: str = None,
+                 db: DatabaseManager = None,
+                 batch_size: int = 1000,
+                 poll_interval: float = 0.5,
+                 max_backoff: float = 30.0):
+        super().__init__(daemon=True, name='spool-drainer')
+        self.directory = directory or os.getenv('COLLECTOR_SPOOL_DIR', 'spool')
+        self.db = db or DatabaseManager()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+
+        self._stop_event = threading.Event()
+        self.checkpoint_path = os.path.join(self.directory, CHECKPOINT_FILE)
+        self.dead_letter_path = os.path.join(self.directory, DEAD_LETTER_FILE)
+        self.dead_lettered = 0
+
+    # Checkpoint --------------------------------------------------------
+
+    def _load_checkpoint(self) -> Tuple[Optional[str], int]:
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                checkpoint = json.load(f)
+            return checkpoint.get('segment'), checkpoint.get('offset', 0)
+        except (FileNotFoundError, ValueError):
+            return None, 0
+
+    def _save_checkpoint(self, segment: str, offset: int):
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'segment': segment, 'offset': offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    # Leitura -----------------------------------------------------------
+
+    def _read_batch(self, segment: str, offset: int) -> Tuple[List[Dict], int]:
+        """Lê até batch_size registros completos a partir do offset"""
+        records = []
+        with open(os.path.join(self.directory, segment), 'rb') as f:
+            f.seek(offset)
+            while len(records) < self.batch_size:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    # Linha incompleta (ainda em escrita ou cortada num crash)
+                    break
+                offset += len(line)
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    logger.error(f"Registro corrompido ignorado em {segment}")
+        return records, offset
+
+    def drain_once(self) -> int:
+        """
+        Drena o que estiver disponível no spool
+        Retorna o número de registros aplicados ao banco
+        """
+        applied = 0
+        segment, offset = self._load_checkpoint()
+
+        segments = list_segments(self.directory)
+        if segment not in segments:
+            segment, offset = (segments[0], 0) if segments else (None, 0)
+
+        while segment is not None and not self._stop_event.is_set():
+            records, new_offset = self._read_batch(segment, offset)
+
+            if records:
+                self._apply_isolating(records)
+                applied += len(records)
+                offset = new_offset
+                self._save_checkpoint(segment, offset)
+                continue
+
+            # Fim do segmento: só avança se já existir um segmento mais novo
+            segments = list_segments(self.directory)
+            newer = [s for s in segments if _segment_number(s) > _segment_number(segment)]
+            if not newer:
+                break
+
+            os.remove(os.path.join(self.directory, segment))
+            segment, offset = newer[0], 0
+            self._save_checkpoint(segment, offset)
+
+        return applied
+
+    # Aplicação ---------------------------------------------------------
+
+    def _apply_isolating(self, records: List[Dict]):
+        """
+        Aplica o lote; se o banco recusar algum registro, reaplica um a um
+        e desvia os recusados para o dead-letter, para o checkpoint poder avançar
+        """
+        try:
+            self._apply(records)
+            return
+        except DATA_ERRORS as e:
+            logger.warning(f"Lote do spool recusado, aplicando registro a registro: {e}")
+
+        for record in records:
+            try:
+                self._apply([record])
+            except DATA_ERRORS as e:
+                logger.error(f"Registro {record.get('key')} enviado ao dead-letter: {e}")
+                self._dead_letter(record, str(e))
+
+    def _dead_letter(self, record: Dict, error: str):
+        line = json.dumps({'record': record, 'error': error, 'failed_at': time.time()}, default=str)
+        with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.dead_lettered += 1
+
+    def _apply(self, records: List[Dict]):
+        """Aplica um lote de registros em uma única transação, preservando a ordem"""
+        with self.db.connection() as conn:
+            with conn.cursor() as cursor:
+                for kind, group in groupby(records, key=lambda r: r['kind']):
+                    group = list(group)
+
+                    if kind == 'event':
+                        events = [dict(r['data'], event_uid=r['key']) for r in group]
+                        self.db.insert_sensor_events_bulk(events, conn=conn)
+                    elif kind == 'session_start':
+                        for r in group:
+                            self._apply_session_start(cursor, r['data'])
+                    elif kind == 'session_end':
+                        for r in group:
+                            data = r['data']
+                            cursor.execute(
+                                """
+                                UPDATE sessions
+                                SET ended_at = %s,
+                                    duration_seconds = %s,
+                                    total_interactions = %s
+                                WHERE session_id = %s
+                                """,
+                                (data['ended_at'], data['duration'],
+                                 data['total_interactions'], data['session_id'])
+                            )
+                    elif kind == 'aggregate':
+                        for r in group:
+                            self._apply_aggregate(cursor, r['data'])
+                    else:
+                        logger.error(f"Tipo de registro desconhecido no spool: {kind}")
+            conn.commit()
+
+    @staticmethod
+    def _apply_session_start(cursor, data: Dict):
+        cursor.execute(
+            """
+            INSERT INTO totems (totem_id, location, status)
+            VALUES (%s, 'FIAP - Campus', 'active')
+            ON CONFLICT (totem_id) DO NOTHING
+            """,
+            (data['totem_id'],)
+        )
+        cursor.execute(
+            """
+            INSERT INTO sessions (session_id, totem_id, started_at)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (session_id) DO NOTHING
+            """,
+            (data['session_id'], data['totem_id'], data['started_at'])
+        )
+
+    @staticmethod
+    def _apply_aggregate(cursor, data: Dict):
+        columns = list(data.keys())
+        cursor.execute(
+            f"""
+            INSERT INTO session_aggregates ({', '.join(columns)})
+            VALUES ({', '.join(['%s'] * len(columns))})
+            ON CONFLICT (session_id) DO NOTHING
+            """,
+            [data[c] for c in columns]
+        )
+        # Sessão completa: grava as features dos toques na mesma transação
+        materialize_session(cursor, data['session_id'])
+
+    # Thread ------------------------------------------------------------
+
+    def run(self):
+        backoff = self.poll_interval
+        while not self._stop_event.is_set():
+            try:
+                applied = self.drain_once()
+                backoff = self.poll_interval
+                if not applied:
+                    self._stop_event.wait(self.poll_interval)
+            except Exception as e:
+                # Banco fora do ar (OperationalError etc.): os dados continuam no spool, tenta de novo depois
+                logger.warning(f"Falha ao drenar spool (nova tentativa em {backoff:.1f}s): {e}")
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def stop(self, timeout: float = 10.0):
+        self._stop_event.set()
+        self.join(timeout)
+
+
+if __name__ == "__main__":
+    # Drena manualmente um spool existente (ex.: após uma queda do banco)
+    drainer = SpoolDrainer()
+    print(f"Registros aplicados: {drainer.drain_once()}")
+    drainer.db.close()
@@ -0,0 +1,416 @@
+"""
+Servidor de Ingestão Assíncrono
+Recebe lotes de eventos de vários totens via HTTP e grava em micro-lotes no banco
+"""
+
+import sys
+import os
+import asyncio
+import json
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+import logging
+
+import asyncpg
+from aiohttp import web
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+VALID_EVENT_TYPES = ('touch', 'presence', 'ldr')
+VALID_TOUCH_TYPES = ('short', 'long', 'none')
+
+EVENT_COLUMNS = ['session_id', 'totem_id', 'event_type', 'value',
+                 'duration', 'touch_type', 'timestamp']
+
+# Falhas passageiras (banco fora, conexão caída, sobrecarga): o lote é regravado com backoff
+# Qualquer outro erro é do próprio lote e não some repetindo
+TRANSIENT_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.exceptions.OperatorInterventionError,
+    asyncpg.exceptions.InsufficientResourcesError,
+    asyncpg.exceptions.TransactionRollbackError,
+)
+
+
+class LruSet:
+    """Conjunto limitado: acima de maxsize descarta os itens menos usados"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[Hashable, None]" = OrderedDict()
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def update(self, items: Iterable[Hashable]):
+        for item in items:
+            self._items[item] = None
+            self._items.move_to_end(item)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+
+def validate_event(event: Dict) -> Tuple[Optional[tuple], Optional[str]]:
+    """
+    Valida um evento no formato emitido pelo SensorSimulator
+    Retorna (registro pronto para o banco, None) ou (None, mensagem de erro)
+    """
+    if not isinstance(event, dict):
+        return None, "Evento deve ser um objeto JSON"
+
+    event_type = event.get('event_type')
+    if event_type not in VALID_EVENT_TYPES:
+        return None, f"event_type inválido: {event_type}"
+
+    totem_id = event.get('totem_id')
+    if not totem_id or not isinstance(totem_id, str) or len(totem_id) > 50:
+        return None, "totem_id ausente ou inválido"
+
+    value = event.get('value')
+    if isinstance(value, bool) or not isinstance(value, int):
+        return None, f"value deve ser inteiro: {value}"
+    if event_type in ('touch', 'presence') and value not in (0, 1):
+        return None, f"Evento {event_type} com valor inválido: {value}"
+    if event_type == 'ldr' and not 0 <= value <= 1023:
+        return None, f"LDR com valor fora do range (0-1023): {value}"
+
+    try:
+        timestamp = datetime.fromisoformat(event.get('timestamp'))
+    except (TypeError, ValueError):
+        return None, f"timestamp inválido: {event.get('timestamp')}"
+    if timestamp.tzinfo is not None:
+        # Coluna é TIMESTAMP sem fuso: normaliza para UTC
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+    session_id = event.get('session_id')
+    if session_id is not None:
+        try:
+            session_id = uuid.UUID(str(session_id))
+        except ValueError:
+            return None, f"session_id inválido: {session_id}"
+
+    duration = event.get('duration')
+    if duration is not None:
+        try:
+            duration = Decimal(str(round(float(duration), 2)))
+        except (TypeError, ValueError):
+            return None, f"duration inválida: {duration}"
+
+    touch_type = event.get('touch_type')
+    if touch_type is not None and touch_type not in VALID_TOUCH_TYPES:
+        return None, f"touch_type inválido: {touch_type}"
+
+    record = (session_id, totem_id, event_type, value, duration, touch_type, timestamp)
+    return record, None
+
+
+class IngestServer:
+    """
+    Servidor de ingestão com fila em memória e backpressure
+    Um único processo atende centenas de totens sem uma thread por dispositivo
+    """
+
+    def __init__(self,
+                 dsn: str = None,
+                 queue_size: int = None,
+                 flush_size: int = None,
+                 flush_interval: float = None,
+                 enqueue_timeout: float = None,
+                 max_batch_events: int = 5000,
+                 stop_timeout: float = None,
+                 dead_letter_path: str = None,
+                 known_cache_size: int = None):
+        """
+        Inicializa o servidor
+        Usa variáveis de ambiente se não fornecidas (DB_* e INGEST_*)
+        """
+        self.dsn = dsn or "postgresql://{user}:{password}@{host}:{port}/{database}".format(
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'postgres'),
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=int(os.getenv('DB_PORT', 5432)),
+            database=os.getenv('DB_NAME', 'flexmedia_totem')
+        )
+        self.queue_size = queue_size or int(os.getenv('INGEST_QUEUE_SIZE', 100000))
+        self.flush_size = flush_size or int(os.getenv('INGEST_FLUSH_SIZE', 2000))
+        self.flush_interval = flush_interval or float(os.getenv('INGEST_FLUSH_INTERVAL', 0.5))
+        self.enqueue_timeout = enqueue_timeout or float(os.getenv('INGEST_ENQUEUE_TIMEOUT', 2.0))
+        self.max_batch_events = max_batch_events
+        # Tempo máximo para gravar o que restou na fila ao parar; o resto vai para o dead-letter
+        self.stop_timeout = stop_timeout or float(os.getenv('INGEST_STOP_TIMEOUT', 30))
+        # Registros que o banco recusa (dados inválidos) ficam aqui, um JSON por linha
+        self.dead_letter_path = dead_letter_path or os.getenv(
+            'INGEST_DEAD_LETTER_FILE', 'spool/ingest_dead_letter.jsonl'
+        )
+        known_cache_size = known_cache_size or int(os.getenv('INGEST_KNOWN_CACHE_SIZE', 100000))
+
+        self.queue: Optional[asyncio.Queue] = None
+        self.pool: Optional[asyncpg.Pool] = None
+        self._flusher: Optional[asyncio.Task] = None
+        # Registros retirados da fila e ainda não gravados (por identidade); sub-lotes
+        # saem ao serem gravados, então stop() não regrava o que já foi commitado
+        self._inflight: Dict[int, tuple] = {}
+        self._known_sessions = LruSet(known_cache_size)
+        self._known_totems = LruSet(known_cache_size)
+
+        self.stats = {
+            'accepted': 0,
+            'rejected': 0,
+            'throttled_batches': 0,
+            'flushed': 0,
+            'flush_errors': 0,
+            'dead_lettered': 0
+        }
+
+    async def start(self, app: web.Application = None):
+        """Abre o pool assíncrono e inicia a tarefa de flush"""
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=4)
+        self._flusher = asyncio.create_task(self._flush_loop())
+        logger.info("Servidor de ingestão iniciado")
+
+    async def stop(self, app: web.Application = None):
+        """Grava o que restou na fila e fecha o pool"""
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+
+        remaining = list(self._inflight.values())
+        while not self.queue.empty():
+            remaining.append(self.queue.get_nowait())
+
+        # Com o banco fora o retry não terminaria: grava até o prazo e desvia o resto
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.stop_timeout
+        for start in range(0, len(remaining), self.flush_size):
+            chunk = remaining[start:start + self.flush_size]
+            try:
+                await asyncio.wait_for(self._write_with_retry(chunk), max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                pending = remaining[start:]
+                logger.error(f"Prazo de parada esgotado: {len(pending)} eventos enviados ao dead-letter")
+                self._dead_letter(pending, "prazo de parada esgotado")
+                break
+
+        await self.pool.close()
+        logger.info("Servidor de ingestão finalizado")
+
+    async def enqueue(self, records: List[tuple]) -> bool:
+        """
+        Enfileira registros validados
+        Retorna False se a fila continuar cheia após enqueue_timeout (backpressure)
+        """
+        if self.queue.maxsize - self.queue.qsize() < len(records):
+            deadline = asyncio.get_running_loop().time() + self.enqueue_timeout
+            while self.queue.maxsize - self.queue.qsize() < len(records):
+                if asyncio.get_running_loop().time() >= deadline:
+                    return False
+                await asyncio.sleep(0.05)
+
+        for record in records:
+            self.queue.put_nowait(record)
+        return True
+
+    async def _flush_loop(self):
+        """Agrupa registros da fila em micro-lotes por tamanho ou tempo"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self.queue.get()]
+            self._track(batch[0])
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.flush_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+                self._track(batch[-1])
+
+            await self._write_with_retry(batch)
+
+    def _track(self, record: tuple):
+        self._inflight[id(record)] = record
+
+    def _settle(self, records: List[tuple]):
+        """Tira de _inflight registros já gravados ou desviados ao dead-letter"""
+        for record in records:
+            self._inflight.pop(id(record), None)
+
+    async def _write_with_retry(self, batch: List[tuple]):
+        """
+        Grava o micro-lote, tentando novamente com backoff em falhas passageiras
+        Enquanto o banco não responde a fila enche e os clientes recebem 503
+        Erros de dados/integridade dividem o lote ao meio até isolar os registros
+        ruins, que vão para o dead-letter; o restante é gravado normalmente
+        """
+        delay = 0.5
+        while True:
+            try:
+                await self._write_batch(batch)
+                self.stats['flushed'] += len(batch)
+                return
+            except TRANSIENT_ERRORS as e:
+                self.stats['flush_errors'] += 1
+                logger.error(f"Erro ao gravar micro-lote ({len(batch)} eventos): {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+            except Exception as e:
+                self.stats['flush_errors'] += 1
+                if len(batch) == 1:
+                    logger.error(f"Evento recusado pelo banco, enviado ao dead-letter: {e}")
+                    self._dead_letter(batch, str(e))
+                    self._settle(batch)
+                    return
+                middle = len(batch) // 2
+                await self._write_with_retry(batch[:middle])
+                await self._write_with_retry(batch[middle:])
+                return
+
+    def _dead_letter(self, records: List[tuple], error: str):
+        """Anexa os registros ao arquivo de dead-letter (para inspeção e reenvio manual)"""
+        directory = os.path.dirname(self.dead_letter_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        failed_at = datetime.now(timezone.utc).isoformat()
+        with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+            for record in records:
+                event = dict(zip(EVENT_COLUMNS, record))
+                f.write(json.dumps({'event': event, 'error': error, 'failed_at': failed_at},
+                                   default=str) + '\n')
+        self.stats['dead_lettered'] += len(records)
+
+    async def _write_batch(self, batch: List[tuple]):
+        """Garante totens/sessões e grava o lote com COPY em uma transação"""
+        new_totems = {r[1] for r in batch if r[1] not in self._known_totems}
+
+        session_starts: Dict[uuid.UUID, Tuple[str, datetime]] = {}
+        for record in batch:
+            session_id = record[0]
+            if session_id is None or session_id in self._known_sessions:
+                continue
+            known = session_starts.get(session_id)
+            if known is None or record[6] < known[1]:
+                session_starts[session_id] = (record[1], record[6])
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                if new_totems:
+                    await conn.executemany(
+                        """
+                        INSERT INTO totems (totem_id, location, status)
+                        VALUES ($1, 'FIAP - Campus', 'active')
+                        ON CONFLICT (totem_id) DO NOTHING
+                        """,
+                        [(totem_id,) for totem_id in new_totems]
+                    )
+                if session_starts:
+                    await conn.executemany(
+                        """
+                        INSERT INTO sessions (session_id, totem_id, started_at)
+                        VALUES ($1, $2, $3)
+                        ON CONFLICT (session_id) DO NOTHING
+                        """,
+                        [(sid, totem_id, started) for sid, (totem_id, started) in session_starts.items()]
+                    )
+                await conn.copy_records_to_table(
+                    'sensor_events', records=batch, columns=EVENT_COLUMNS
+                )
+            # Logo após o commit, antes de devolver a conexão (onde um cancelamento ainda pode chegar)
+            self._settle(batch)
+
+        self._known_totems.update(new_totems)
+        self._known_sessions.update(session_starts)
+
+    async def handle_events(self, request: web.Request) -> web.Response:
+        """
+        POST /events
+        Aceita uma lista de eventos ou {"events": [...]}
+        """
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.json_response({'error': 'JSON inválido'}, status=400)
+
+        events = payload.get('events') if isinstance(payload, dict) else payload
+        if not isinstance(events, list) or not events:
+            return web.json_response({'error': 'Lote de eventos vazio ou inválido'}, status=400)
+        if len(events) > self.max_batch_events:
+            return web.json_response(
+                {'error': f'Lote excede {self.max_batch_events} eventos'}, status=413
+            )
+
+        records = []
+        errors = []
+        for index, event in enumerate(events):
+            # session_end é marcador de fim de ciclo, não é gravado em sensor_events
+            if isinstance(event, dict) and event.get('event_type') == 'session_end':
+                continue
+            record, error = validate_event(event)
+            if error:
+                errors.append({'index': index, 'message': error})
+            else:
+                records.append(record)
+
+        self.stats['rejected'] += len(errors)
+
+        if records and not await self.enqueue(records):
+            self.stats['throttled_batches'] += 1
+            return web.json_response(
+                {'error': 'Fila de ingestão cheia, tente novamente'},
+                status=503,
+                headers={'Retry-After': '1'}
+            )
+
+        self.stats['accepted'] += len(records)
+        return web.json_response(
+            {'accepted': len(records), 'rejected': len(errors), 'errors': errors[:100]},
+            status=202
+        )
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        """GET /health"""
+        return web.json_response({
+            'status': 'ok',
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            **self.stats
+        })
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post('/events', self.handle_events)
+        app.router.add_get('/health', self.handle_health)
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        return app
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    server = IngestServer()
+    web.run_app(
+        server.create_app(),
+        host=os.getenv('INGEST_HOST', '0.0.0.0'),
+        port=int(os.getenv('INGEST_PORT', 8000))
+    )
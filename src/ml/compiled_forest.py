@@ -0,0 +1,228 @@
+"""
+Floresta Compilada (inferência só com NumPy)
+Exporta o scaler e as árvores do TouchClassifier para arrays planos (.npz)
+e avalia todas as árvores em lote, sem importar o scikit-learn
+
+Layout dos nós (todas as árvores concatenadas):
+feature, threshold, left, right (índices absolutos; -1 nas folhas)
+e value (probabilidade de cada classe nas folhas); roots guarda o primeiro nó de cada árvore
+
+As predições são idênticas às do modelo original: as comparações usam float32
+como o scikit-learn e as probabilidades das árvores são somadas na mesma ordem
+"""
+
+import sys
+import os
+from typing import Dict
+
+import numpy as np
+
+# Campos gravados no .npz
+_ARRAYS = ['mean', 'scale', 'feature', 'threshold', 'left', 'right', 'value',
+           'roots', 'classes', 'feature_names', 'defaults', 'max_depth', 'version']
+
+TOUCH_LABELS = np.array(['short', 'long'])
+
+# Até este tamanho de lote as árvores são percorridas juntas (menos passos em Python)
+LEVEL_BATCH_SIZE = 256
+
+
+def compile_forest(model, scaler, feature_names, defaults: Dict = None, version: str = None) -> 'CompiledForest':
+    """
+    Converte RandomForestClassifier + StandardScaler treinados em CompiledForest
+    defaults: valor usado para features nulas (NaN); a primeira feature é obrigatória
+    """
+    defaults = defaults or {}
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        is_leaf = tree.children_left == -1
+        roots.append(offset)
+        feature.append(np.where(is_leaf, -1, tree.feature))
+        threshold.append(tree.threshold)
+        left.append(np.where(is_leaf, -1, tree.children_left + offset))
+        right.append(np.where(is_leaf, -1, tree.children_right + offset))
+        # Mesma normalização de DecisionTreeClassifier.predict_proba
+        counts = tree.value[:, 0, :]
+        totals = counts.sum(axis=1, keepdims=True)
+        totals[totals == 0] = 1
+        value.append(counts / totals)
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    n_features = len(feature_names)
+    mean = scaler.mean_ if getattr(scaler, 'mean_', None) is not None else np.zeros(n_features)
+    scale = scaler.scale_ if getattr(scaler, 'scale_', None) is not None else np.ones(n_features)
+
+    return CompiledForest(
+        mean=np.asarray(mean, dtype=np.float64),
+        scale=np.asarray(scale, dtype=np.float64),
+        feature=np.concatenate(feature).astype(np.int32),
+        threshold=np.concatenate(threshold).astype(np.float64),
+        left=np.concatenate(left).astype(np.int32),
+        right=np.concatenate(right).astype(np.int32),
+        value=np.concatenate(value).astype(np.float64),
+        roots=np.asarray(roots, dtype=np.int32),
+        classes=np.asarray(model.classes_),
+        feature_names=np.asarray(feature_names),
+        defaults=np.array([defaults.get(name, np.nan) for name in feature_names], dtype=np.float64),
+        max_depth=np.int32(max_depth),
+        version=np.asarray(version or '')
+    )
+
+
+class CompiledForest:
+    """Scaler + floresta em arrays planos; avaliação vetorizada por nível de profundidade"""
+
+    def __init__(self, **arrays):
+        missing = [name for name in _ARRAYS if name not in arrays]
+        if missing:
+            raise ValueError(f"Campos ausentes no modelo compilado: {missing}")
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self.version = str(self.version)
+        self.max_depth = int(self.max_depth)
+
+        # Arrays de avaliação: folhas apontam para si mesmas (feature 0, limiar +inf),
+        # assim cada nível é um passo sem máscaras e as folhas ficam paradas
+        is_leaf = self.feature < 0
+        node_ids = np.arange(len(self.feature), dtype=np.intp)
+        self._feature = np.where(is_leaf, 0, self.feature).astype(np.intp)
+        self._threshold = np.where(is_leaf, np.inf, self.threshold)
+        self._left = np.where(is_leaf, node_ids, self.left)
+        self._right = np.where(is_leaf, node_ids, self.right)
+
+        # Profundidade de cada árvore (filhos sempre vêm depois do pai)
+        node_depth = np.zeros(len(self.feature), dtype=np.int32)
+        for node in np.flatnonzero(~is_leaf):
+            node_depth[self.left[node]] = node_depth[self.right[node]] = node_depth[node] + 1
+        self._tree_depths = np.maximum.reduceat(node_depth, self.roots) if len(self.roots) else node_depth[:0]
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def save(self, filepath: str):
+        """Grava o .npz de uma vez (arquivo temporário + troca)"""
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        tmp_path = f"{filepath}.tmp.npz"
+        np.savez(tmp_path, **{name: getattr(self, name) for name in _ARRAYS})
+        os.replace(tmp_path, filepath)
+
+    @classmethod
+    def load(cls, filepath: str) -> 'CompiledForest':
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(f"Modelo compilado não encontrado: {filepath}")
+        with np.load(filepath, allow_pickle=False) as data:
+            return cls(**{name: data[name] for name in _ARRAYS})
+
+    def _prepare(self, features: np.ndarray) -> np.ndarray:
+        """Preenche nulos com os padrões e normaliza como o StandardScaler"""
+        X = np.array(features, dtype=np.float64, ndmin=2)
+        if X.shape[1] != len(self.feature_names):
+            raise ValueError(f"Array deve ter formato (n, {len(self.feature_names)})")
+        missing = np.isnan(X)
+        if missing.any():
+            X = np.where(missing, self.defaults, X)
+            if np.isnan(X).any():
+                raise ValueError(f"Feature obrigatória ausente: {self.feature_names[0]}")
+        X -= self.mean
+        X /= self.scale
+        return X
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        """Probabilidades (n x classes) para um array (n, features) na ordem de feature_names"""
+        # As árvores do scikit-learn comparam em float32
+        X = self._prepare(features).astype(np.float32)
+        n_samples = len(X)
+        # Coluna f da amostra i fica em f * n_samples + i
+        X_flat = X.T.ravel()
+        offsets = np.arange(n_samples, dtype=np.intp)
+
+        def descend(node, levels):
+            for _ in range(levels):
+                x = X_flat.take(self._feature.take(node) * n_samples + offsets)
+                node = np.where(x <= self._threshold.take(node), self._left.take(node), self._right.take(node))
+            return node
+
+        # Soma árvore a árvore, na mesma ordem do RandomForestClassifier
+        if n_samples <= LEVEL_BATCH_SIZE:
+            # Poucas amostras: todas as árvores juntas, um passo por nível
+            node = descend(np.repeat(self.roots[:, None], n_samples, axis=1), self.max_depth)
+            proba = np.cumsum(self.value[node], axis=0)[-1]
+        else:
+            # Lotes grandes: árvore por árvore, só até a profundidade de cada uma
+            proba = np.zeros((n_samples, self.value.shape[1]))
+            for root, depth in zip(self.roots, self._tree_depths):
+                node = descend(np.full(n_samples, root, dtype=np.intp), depth)
+                proba += self.value.take(node, axis=0)
+
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """Rótulos ('short'/'long'); empate fica com a primeira classe, como em model.predict"""
+        proba = self.predict_proba(features)
+        return TOUCH_LABELS[self.classes[np.argmax(proba, axis=1)]]
+
+
+def check_equivalence(classifier, compiled: CompiledForest, features: np.ndarray) -> Dict:
+    """
+    Compara o modelo compilado com o original (scaler + predict/predict_proba do scikit-learn)
+    Retorna o número de rótulos divergentes e a maior diferença de probabilidade
+    """
+    import pandas as pd
+
+    X = pd.DataFrame(np.asarray(features, dtype=np.float64), columns=list(compiled.feature_names))
+    X_scaled = classifier.scaler.transform(X)
+    expected_labels = classifier.model.predict(X_scaled)
+    expected_proba = classifier.model.predict_proba(X_scaled)
+
+    proba = compiled.predict_proba(features)
+    labels = compiled.classes[np.argmax(proba, axis=1)]
+
+    return {
+        'samples': len(X),
+        'label_mismatches': int((labels != expected_labels).sum()),
+        'max_proba_diff': float(np.abs(proba - expected_proba).max()) if len(X) else 0.0
+    }
+
+
+if __name__ == "__main__":
+    import time
+
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    from src.ml.touch_classifier import TouchClassifier
+
+    model_path = sys.argv[1] if len(sys.argv) > 1 else 'src/ml/models/touch_classifier.pkl'
+    output_path = os.path.splitext(model_path)[0] + '.npz'
+
+    classifier = TouchClassifier()
+    classifier.load_model(model_path)
+    compiled = classifier.export_compiled(output_path)
+    print(f"Modelo compilado salvo em {output_path} ({compiled.n_trees} árvores, {len(compiled.feature)} nós)")
+
+    # Verificação de equivalência em toques aleatórios nas faixas do coletor
+    rng = np.random.default_rng(42)
+    n = 100000
+    features = np.column_stack([
+        rng.uniform(0.0, 3.0, n),
+        rng.uniform(0.0, 300.0, n),
+        rng.integers(1, 20, n),
+        rng.uniform(0.0, 1023.0, n),
+        rng.uniform(0.0, 300.0, n)
+    ])
+
+    result = check_equivalence(classifier, compiled, features)
+    print(f"Amostras: {result['samples']}")
+    print(f"Rótulos divergentes: {result['label_mismatches']}")
+    print(f"Maior diferença de probabilidade: {result['max_proba_diff']:.2e}")
+
+    start = time.time()
+    compiled.predict_proba(features)
+    print(f"Tempo (compilado): {time.time() - start:.3f}s")
+
+    sys.exit(0 if result['label_mismatches'] == 0 and result['max_proba_diff'] < 1e-12 else 1)
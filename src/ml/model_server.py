@@ -0,0 +1,334 @@
+"""
+Servidor de Modelo em Processo
+Mantém o classificador de toques carregado em memória e atende predições via HTTP
+(TCP local ou Unix socket), agrupando requisições simultâneas em micro-lotes
+"""
+
+import sys
+import os
+import asyncio
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import logging
+
+import numpy as np
+from aiohttp import web
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.ml.touch_classifier import (TouchClassifier, FEATURE_COLUMNS, FEATURE_DEFAULTS, DEFAULT_MODEL_PATH,
+                                     resolve_features)
+from src.ml.compiled_forest import CompiledForest, compile_forest, TOUCH_LABELS
+from src.database.feature_store import TouchFeatureStore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class LoadedModel(NamedTuple):
+    classifier: TouchClassifier
+    compiled: CompiledForest
+    file_key: Tuple[int, int]
+    version: str
+    loaded_at: float
+
+
+class ModelCache:
+    """
+    Classificador carregado uma única vez e mantido quente
+    A cada get() compara mtime/tamanho do arquivo (um stat); se mudou, carrega o novo
+    modelo por fora e troca a referência de uma vez. Se o arquivo novo não puder
+    ser lido, continua servindo o modelo anterior
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv('MODEL_PATH', DEFAULT_MODEL_PATH)
+        self._current: Optional[LoadedModel] = None
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _file_key(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self) -> LoadedModel:
+        """Modelo atual (recarregado se o arquivo mudou)"""
+        current = self._current
+        file_key = self._file_key()
+        if current is not None and (file_key is None or file_key == current.file_key):
+            return current
+
+        with self._lock:
+            current = self._current
+            if current is not None and file_key == current.file_key:
+                return current
+            if file_key is None:
+                raise FileNotFoundError(f"Modelo não encontrado: {self.path}")
+            try:
+                return self._load(file_key)
+            except Exception as e:
+                if current is None:
+                    raise
+                logger.error(f"Erro ao recarregar modelo, mantendo versão {current.version}: {e}")
+                return current
+
+    def _load(self, file_key: Tuple[int, int]) -> LoadedModel:
+        classifier = TouchClassifier()
+        classifier.load_model(self.path)
+        # Predições usam a floresta compilada (mesmos resultados, sem o custo fixo do scikit-learn)
+        compiled = compile_forest(classifier.model, classifier.scaler, FEATURE_COLUMNS,
+                                  defaults=FEATURE_DEFAULTS, version=classifier.version)
+
+        previous = self._current
+        self._current = LoadedModel(classifier, compiled, file_key, classifier.version, time.time())
+        if previous is not None:
+            self.reloads += 1
+            logger.info(f"Modelo recarregado: {previous.version} -> {classifier.version}")
+        return self._current
+
+
+def parse_touch(touch: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Valida as features de um toque
+    Retorna (features, None) ou (None, mensagem de erro); valores padrão
+    pela mesma regra de TouchClassifier.predict (resolve_features)
+    """
+    if not isinstance(touch, dict):
+        return None, "Toque deve ser um objeto JSON"
+
+    for column in FEATURE_COLUMNS:
+        value = touch.get(column)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            return None, f"{column} deve ser numérico: {value}"
+    try:
+        return resolve_features(touch), None
+    except ValueError as e:
+        return None, str(e)
+
+
+def _format_predictions(proba: np.ndarray, classes: np.ndarray, version: str) -> List[Dict]:
+    labels = TOUCH_LABELS[classes[np.argmax(proba, axis=1)]]
+    short = proba[:, int(np.flatnonzero(classes == 0)[0])]
+    long = proba[:, int(np.flatnonzero(classes == 1)[0])]
+    confidence = proba.max(axis=1)
+    return [
+        {
+            'predicted_type': str(labels[i]),
+            'probability_short': round(float(short[i]), 3),
+            'probability_long': round(float(long[i]), 3),
+            'confidence': round(float(confidence[i]), 3),
+            'model_version': version
+        }
+        for i in range(len(proba))
+    ]
+
+
+class ModelServer:
+    """
+    Servidor de predição com micro-lotes
+    Requisições que chegam enquanto um lote é avaliado formam o próximo lote:
+    uma única avaliação da floresta compilada atende todas
+    """
+
+    def __init__(self,
+                 model_path: str = None,
+                 max_batch: int = None,
+                 batch_wait: float = None,
+                 max_request_touches: int = 100000):
+        """
+        Inicializa o servidor
+        Usa variáveis de ambiente se não fornecidas (MODEL_*)
+        """
+        self.cache = ModelCache(model_path)
+        self.max_batch = max_batch or int(os.getenv('MODEL_MAX_BATCH', 256))
+        # Espera extra por requisições antes de avaliar um lote (0 = só as que já estão na fila)
+        self.batch_wait = batch_wait if batch_wait is not None else float(os.getenv('MODEL_BATCH_WAIT', 0.0))
+        self.max_request_touches = max_request_touches
+
+        self.queue: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Task] = None
+        # Aberto só na primeira predição por event_id
+        self._features: Optional[TouchFeatureStore] = None
+
+        self.stats = {
+            'requests': 0,
+            'predictions': 0,
+            'batches': 0,
+            'errors': 0
+        }
+
+    async def start(self, app: web.Application = None):
+        """Carrega o modelo antes de aceitar requisições e inicia a tarefa de micro-lotes"""
+        model = self.cache.get()
+        self.queue = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._batch_loop())
+        logger.info(f"Servidor de modelo iniciado (versão {model.version})")
+
+    async def stop(self, app: web.Application = None):
+        if self._batcher:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+        logger.info("Servidor de modelo finalizado")
+
+    async def _batch_loop(self):
+        """Agrupa as requisições pendentes e avalia cada grupo com uma chamada ao modelo"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            if self.batch_wait > 0:
+                deadline = loop.time() + self.batch_wait
+                while len(batch) < self.max_batch:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+            features = [item[0] for item in batch]
+            try:
+                results = await loop.run_in_executor(None, self._predict, features)
+            except Exception as e:
+                self.stats['errors'] += 1
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.stats['batches'] += 1
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _predict(self, features: List[Dict]) -> List[Dict]:
+        """Avalia um lote inteiro com a mesma versão do modelo"""
+        model = self.cache.get()
+        X = np.array([[touch[column] for column in FEATURE_COLUMNS] for touch in features], dtype=np.float64)
+        proba = model.compiled.predict_proba(X)
+        self.stats['predictions'] += len(features)
+        return _format_predictions(proba, model.compiled.classes, model.version)
+
+    def _predict_events(self, event_ids: List[int]) -> List[Dict]:
+        """Predição de toques gravados com as features do feature store (as mesmas do treino)"""
+        if self._features is None:
+            self._features = TouchFeatureStore()
+        features = self._features.features_for_events(event_ids)
+        model = self.cache.get()
+        proba = model.compiled.predict_proba(features[FEATURE_COLUMNS].to_numpy())
+        self.stats['predictions'] += len(features)
+        results = _format_predictions(proba, model.compiled.classes, model.version)
+        for event_id, result in zip(features.index, results):
+            result['event_id'] = int(event_id)
+        return results
+
+    async def predict(self, features: Dict) -> Dict:
+        """Enfileira um toque para o próximo micro-lote e aguarda o resultado"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((features, future))
+        return await future
+
+    async def handle_predict(self, request: web.Request) -> web.Response:
+        """
+        POST /predict
+        Aceita um toque ({"duration": 1.2, ...}), {"touches": [...]}
+        ou {"event_ids": [...]} (toques gravados, features do feature store)
+        """
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.json_response({'error': 'JSON inválido'}, status=400)
+
+        self.stats['requests'] += 1
+        touches = payload.get('touches') if isinstance(payload, dict) and 'touches' in payload else None
+
+        try:
+            if isinstance(payload, dict) and 'event_ids' in payload:
+                event_ids = payload['event_ids']
+                if (not isinstance(event_ids, list) or not event_ids
+                        or any(isinstance(i, bool) or not isinstance(i, int) for i in event_ids)):
+                    return web.json_response({'error': 'event_ids deve ser uma lista de inteiros'}, status=400)
+                if len(event_ids) > self.max_request_touches:
+                    return web.json_response(
+                        {'error': f'Requisição excede {self.max_request_touches} toques'}, status=413
+                    )
+                results = await asyncio.get_running_loop().run_in_executor(None, self._predict_events, event_ids)
+                return web.json_response({'predictions': results})
+
+            if touches is None:
+                features, error = parse_touch(payload)
+                if error:
+                    return web.json_response({'error': error}, status=400)
+                return web.json_response(await self.predict(features))
+
+            if not isinstance(touches, list) or not touches:
+                return web.json_response({'error': 'Lista de toques vazia ou inválida'}, status=400)
+            if len(touches) > self.max_request_touches:
+                return web.json_response(
+                    {'error': f'Requisição excede {self.max_request_touches} toques'}, status=413
+                )
+
+            rows = []
+            for index, touch in enumerate(touches):
+                features, error = parse_touch(touch)
+                if error:
+                    return web.json_response({'error': error, 'index': index}, status=400)
+                rows.append(features)
+
+            # Lotes já grandes vão direto ao modelo, sem passar pela fila
+            results = await asyncio.get_running_loop().run_in_executor(None, self._predict, rows)
+            return web.json_response({'predictions': results})
+        except Exception as e:
+            logger.error(f"Erro na predição: {e}")
+            return web.json_response({'error': f'Erro na predição: {e}'}, status=500)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        """GET /health"""
+        try:
+            model = self.cache.get()
+        except Exception as e:
+            return web.json_response({'status': 'error', 'error': str(e)}, status=503)
+        return web.json_response({
+            'status': 'ok',
+            'model_path': self.cache.path,
+            'model_version': model.version,
+            'loaded_at': model.loaded_at,
+            'reloads': self.cache.reloads,
+            'queue_depth': self.queue.qsize() if self.queue else 0,
+            **self.stats
+        })
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/predict', self.handle_predict)
+        app.router.add_get('/health', self.handle_health)
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        return app
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    server = ModelServer()
+    socket_path = os.getenv('MODEL_SERVER_SOCKET')
+    if socket_path:
+        web.run_app(server.create_app(), path=socket_path)
+    else:
+        web.run_app(
+            server.create_app(),
+            host=os.getenv('MODEL_SERVER_HOST', '127.0.0.1'),
+            port=int(os.getenv('MODEL_SERVER_PORT', 8001))
+        )
@@ -7,56 +7,152 @@ import sys
 import os
 import pandas as pd
 import numpy as np
-from typing import Dict
+from typing import Dict, Union
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 from sklearn.preprocessing import StandardScaler
+import argparse
 import joblib
 import json
+from datetime import datetime
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from src.database.db_connection import DatabaseManager
+from src.database.feature_store import TouchFeatureStore
+from src.ml.compiled_forest import CompiledForest, compile_forest
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Features na ordem usada pelo scaler e pelo modelo
+FEATURE_COLUMNS = ['duration', 'session_duration', 'total_touches',
+                   'avg_light_level', 'time_in_session']
+
+# Valores usados quando a feature não é informada
+FEATURE_DEFAULTS = {
+    'session_duration': 60.0,
+    'total_touches': 1,
+    'avg_light_level': 512.0,
+    'time_in_session': 0.0
+}
+
+TOUCH_LABELS = ['short', 'long']
+
+DEFAULT_MODEL_PATH = 'src/ml/models/touch_classifier.pkl'
+
+
+def resolve_features(touch: Dict) -> Dict[str, float]:
+    """
+    Regra única de valores padrão (predict, predict_batch e servidor de modelo):
+    feature ausente, None ou NaN recebe FEATURE_DEFAULTS; valores informados,
+    inclusive 0, são mantidos. duration é obrigatória
+    """
+    features = {}
+    for column in FEATURE_COLUMNS:
+        value = touch.get(column)
+        if value is None or value != value:
+            if column not in FEATURE_DEFAULTS:
+                raise ValueError(f"{column} é obrigatória")
+            value = FEATURE_DEFAULTS[column]
+        features[column] = float(value)
+    return features
+
+
+class TouchReservoir:
+    """
+    Amostra uniforme e limitada dos toques já usados no treino (algoritmo R)
+    Mantém o histórico representado no treino incremental sem reler a tabela inteira
+    """
+    
+    def __init__(self, capacity: int = None, seed: int = None):
+        self.capacity = capacity or int(os.getenv('TRAIN_RESERVOIR_SIZE', 50000))
+        self.X = np.empty((0, len(FEATURE_COLUMNS)), dtype=np.float64)
+        self.y = np.empty(0, dtype=np.int8)
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+    
+    def __len__(self) -> int:
+        return len(self.y)
+    
+    def add(self, X: np.ndarray, y: np.ndarray):
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.int8)
+        
+        # Enche até a capacidade
+        fill = min(self.capacity - len(self.y), len(y))
+        if fill > 0:
+            self.X = np.vstack([self.X, X[:fill]])
+            self.y = np.concatenate([self.y, y[:fill]])
+        
+        # Depois, o i-ésimo toque visto substitui uma posição com probabilidade capacity / i
+        rest = len(y) - fill
+        if rest > 0:
+            positions = self.seen + fill + np.arange(1, rest + 1)
+            slots = self._rng.integers(0, positions)
+            accepted = slots < self.capacity
+            self.X[slots[accepted]] = X[fill:][accepted]
+            self.y[slots[accepted]] = y[fill:][accepted]
+        
+        self.seen += len(y)
+    
+    def save(self, filepath: str):
+        tmp_path = f"{filepath}.tmp.npz"
+        np.savez(tmp_path, X=self.X, y=self.y, seen=self.seen, capacity=self.capacity)
+        os.replace(tmp_path, filepath)
+    
+    @classmethod
+    def load(cls, filepath: str) -> 'TouchReservoir':
+        with np.load(filepath) as data:
+            reservoir = cls(int(data['capacity']))
+            reservoir.X = data['X']
+            reservoir.y = data['y']
+            reservoir.seen = int(data['seen'])
+        return reservoir
+
 
 class TouchClassifier:
     """Classifica tipo de toque usando ML supervisionado"""
     
-    def __init__(self):
+    def __init__(self, db: DatabaseManager = None):
         self.model = None
         self.scaler = StandardScaler()
-        self.db = DatabaseManager()
+        # Versão do modelo salvo/carregado (None enquanto não salvo)
+        self.version = None
+        # Maior session_aggregates.id já usado no treino (None = sem treino com dados reais)
+        self.watermark = None
+        self._db = db
+        self._features = None
+        
+        # Treino incremental
+        self.extra_trees = int(os.getenv('TRAIN_EXTRA_TREES', 20))
+        self.max_trees = int(os.getenv('TRAIN_MAX_TREES', 300))
+    
+    @property
+    def db(self) -> DatabaseManager:
+        """Banco aberto só quando necessário (predição não usa o banco)"""
+        if self._db is None:
+            self._db = DatabaseManager()
+        return self._db
+    
+    @property
+    def features(self) -> TouchFeatureStore:
+        """Feature store dos toques (mesmas features no treino e na predição)"""
+        if self._features is None:
+            self._features = TouchFeatureStore(self.db)
+        return self._features
     
     def prepare_training_data(self) -> pd.DataFrame:
         """
-        Prepara dados de treinamento a partir do banco
-        Extrai features relevantes para classificação
+        Prepara dados de treinamento a partir do feature store
+        Antes de ler, materializa as sessões agregadas que ainda não estão lá
         """
         try:
-            query = """
-                SELECT 
-                    se.duration,
-                    se.touch_type,
-                    se.value,
-                    s.duration_seconds as session_duration,
-                    sa.total_touches,
-                    sa.avg_light_level,
-                    EXTRACT(EPOCH FROM (se.timestamp - s.started_at)) as time_in_session
-                FROM sensor_events se
-                JOIN sessions s ON se.session_id = s.session_id
-                LEFT JOIN session_aggregates sa ON s.session_id = sa.session_id
-                WHERE se.event_type = 'touch'
-                AND se.value = 1
-                AND se.duration IS NOT NULL
-                AND se.touch_type IN ('short', 'long')
-            """
-            
-            results = self.db.execute_query(query)
+            # Só agregados confirmados: a marca d'água não passa de agregados ainda em gravação
+            mark = self.features.refresh()
+            results = self.features.training_data(upto_aggregate_id=mark)
             
             if not results:
                 logger.warning("Nenhum dado de treinamento encontrado. Gerando dados sintéticos...")
@@ -109,21 +205,22 @@ class TouchClassifier:
     def extract_features(self, df: pd.DataFrame) -> tuple:
         """Extrai features e target do DataFrame"""
         # Features
-        feature_cols = ['duration', 'session_duration', 'total_touches', 
-                       'avg_light_level', 'time_in_session']
-        
-        X = df[feature_cols].copy()
+        X = df[FEATURE_COLUMNS].copy()
         
         # Target (classificação binária: short=0, long=1)
         y = (df['touch_type'] == 'long').astype(int)
         
         return X, y
     
-    def train(self, test_size: float = 0.2, random_state: int = 42):
-        """Treina o modelo de classificação"""
+    def train(self, test_size: float = 0.2, random_state: int = 42, df: pd.DataFrame = None):
+        """
+        Treina o modelo de classificação
+        df: dados já preparados (padrão: prepare_training_data())
+        """
         logger.info("Preparando dados de treinamento...")
         
-        df = self.prepare_training_data()
+        if df is None:
+            df = self.prepare_training_data()
         
         if df.empty:
             raise ValueError("Não há dados suficientes para treinamento")
@@ -161,6 +258,10 @@ class TouchClassifier:
         logger.info("\nRelatório de Classificação:")
         logger.info(classification_report(y_test, y_pred, target_names=['short', 'long']))
         
+        # Marca d'água para o treino incremental (dados sintéticos não têm aggregate_id)
+        real_ids = df['aggregate_id'].dropna() if 'aggregate_id' in df.columns else pd.Series(dtype=float)
+        self.watermark = int(real_ids.max()) if not real_ids.empty else 0
+        
         return {
             'accuracy': accuracy,
             'train_size': len(X_train),
@@ -168,6 +269,137 @@ class TouchClassifier:
             'classification_report': classification_report(y_test, y_pred, output_dict=True)
         }
     
+    def prepare_incremental_data(self, watermark: int) -> pd.DataFrame:
+        """
+        Toques das sessões agregadas depois da marca d'água (sem dados sintéticos)
+        Lê do feature store só as linhas com aggregate_id > watermark
+        """
+        mark = self.features.refresh()
+        results = self.features.training_data(after_aggregate_id=watermark, upto_aggregate_id=mark)
+        if not results:
+            return pd.DataFrame()
+        return pd.DataFrame(results).dropna()
+    
+    def train_incremental(self, model_path: str = DEFAULT_MODEL_PATH,
+                          test_size: float = 0.2, random_state: int = 42) -> Dict:
+        """
+        Atualiza o modelo só com os toques novos desde o último treino
+        Acrescenta extra_trees árvores (warm start) treinadas com os toques novos mais
+        a amostra do histórico (reservatório) e descarta as mais antigas acima de max_trees;
+        o scaler do último treino completo é mantido (as árvores antigas dependem dele)
+        Sem modelo, marca d'água ou reservatório anteriores faz um treino completo
+        Grava uma versão nova do modelo com as métricas (save_version)
+        """
+        reservoir_path = os.path.splitext(model_path)[0] + '.reservoir.npz'
+        if self.model is None and os.path.exists(model_path):
+            self.load_model(model_path)
+        
+        if self.model is None or self.watermark is None or not os.path.exists(reservoir_path):
+            logger.info("Sem estado de treino incremental: executando treino completo")
+            df = self.prepare_training_data()
+            results = self.train(test_size, random_state, df=df)
+            
+            reservoir = TouchReservoir(seed=random_state)
+            if 'aggregate_id' in df.columns:
+                X_real, y_real = self.extract_features(df[df['aggregate_id'].notna()])
+                reservoir.add(X_real, y_real)
+            results.update(mode='full', new_samples=len(df))
+        else:
+            reservoir = TouchReservoir.load(reservoir_path)
+            new_df = self.prepare_incremental_data(self.watermark)
+            if new_df.empty:
+                logger.info("Nenhum toque novo desde o último treino")
+                return {'mode': 'incremental', 'new_samples': 0,
+                        'version': self.version, 'watermark': self.watermark}
+            
+            X_new, y_new = self.extract_features(new_df)
+            X_new = X_new.to_numpy(dtype=np.float64)
+            y_new = y_new.to_numpy(dtype=np.int8)
+            
+            # Avaliação só com toques novos separados antes do treino: o reservatório
+            # já foi usado pelas árvores existentes e inflaria a acurácia
+            if len(y_new) >= 2:
+                new_counts = np.bincount(y_new, minlength=2)
+                X_fit, X_test, y_fit, y_test = train_test_split(
+                    X_new, y_new, test_size=test_size, random_state=random_state,
+                    stratify=y_new if new_counts.min() >= 2 else None
+                )
+            else:
+                X_fit, X_test, y_fit, y_test = X_new, X_new[:0], y_new, y_new[:0]
+            
+            # Toques novos + histórico amostrado: o custo depende do lote novo, não da tabela
+            X_train = np.vstack([X_fit, reservoir.X])
+            y_train = np.concatenate([y_fit, reservoir.y])
+            if (np.bincount(y_train, minlength=2) == 0).any():
+                logger.warning("Toques novos sem as duas classes: modelo mantido")
+                return {'mode': 'incremental', 'new_samples': len(y_new),
+                        'version': self.version, 'watermark': self.watermark}
+            
+            X_train_scaled = self.scaler.transform(pd.DataFrame(X_train, columns=FEATURE_COLUMNS))
+            
+            logger.info(f"Treino incremental: {len(y_new)} toques novos, {len(reservoir)} do histórico")
+            self.model.warm_start = True
+            self.model.n_estimators = len(self.model.estimators_) + self.extra_trees
+            # Semente nova a cada rodada (árvores descartadas não repetem sementes)
+            self.model.random_state = (random_state + int(new_df['aggregate_id'].max())) % (2 ** 31)
+            self.model.fit(X_train_scaled, y_train)
+            self.model.warm_start = False
+            
+            if len(self.model.estimators_) > self.max_trees:
+                self.model.estimators_ = self.model.estimators_[-self.max_trees:]
+                self.model.n_estimators = self.max_trees
+            
+            results = {
+                'mode': 'incremental',
+                'new_samples': len(y_new),
+                'train_size': len(X_train),
+                'test_size': len(X_test)
+            }
+            if len(y_test):
+                X_test_scaled = self.scaler.transform(pd.DataFrame(X_test, columns=FEATURE_COLUMNS))
+                y_pred = self.model.predict(X_test_scaled)
+                accuracy = accuracy_score(y_test, y_pred)
+                logger.info(f"Acurácia do modelo (toques novos): {accuracy:.2%}")
+                results['accuracy'] = accuracy
+                results['classification_report'] = classification_report(y_test, y_pred, output_dict=True)
+            else:
+                logger.info("Toques novos insuficientes para avaliação")
+            
+            # Todos os toques novos entram no histórico (inclusive os de teste)
+            reservoir.add(X_new, y_new)
+            self.watermark = int(new_df['aggregate_id'].max())
+        
+        results['version'] = self.save_version(model_path, results)
+        reservoir.save(reservoir_path)
+        results['watermark'] = self.watermark
+        return results
+    
+    def save_version(self, model_path: str = DEFAULT_MODEL_PATH, metrics: Dict = None) -> str:
+        """
+        Grava o modelo como versão nova em versions/ (pkl + json de métricas)
+        e atualiza model_path, o arquivo lido pelo dashboard e pelo servidor de modelo
+        """
+        if self.model is None:
+            raise ValueError("Modelo não foi treinado")
+        
+        version = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        versions_dir = os.path.join(os.path.dirname(model_path), 'versions')
+        name = os.path.splitext(os.path.basename(model_path))[0]
+        
+        self.save_model(os.path.join(versions_dir, f"{name}-{version}.pkl"), version=version)
+        metadata = {
+            'version': version,
+            'trained_at': datetime.now().isoformat(),
+            'watermark': self.watermark,
+            'n_estimators': len(self.model.estimators_),
+            **(metrics or {})
+        }
+        with open(os.path.join(versions_dir, f"{name}-{version}.json"), 'w') as f:
+            json.dump(metadata, f, indent=2, default=str)
+        
+        self.save_model(model_path, version=version)
+        return version
+    
     def predict(self, duration: float, session_duration: float = None, 
                 total_touches: int = None, avg_light: float = None,
                 time_in_session: float = None) -> Dict:
@@ -175,43 +407,127 @@ class TouchClassifier:
         if self.model is None:
             raise ValueError("Modelo não foi treinado. Execute train() primeiro.")
         
-        # Valores padrão se não fornecidos
-        session_duration = session_duration or 60.0
-        total_touches = total_touches or 1
-        avg_light = avg_light or 512.0
-        time_in_session = time_in_session or 0.0
+        # Valores padrão só para features não informadas (0 é um valor válido)
+        features = resolve_features({
+            'duration': duration,
+            'session_duration': session_duration,
+            'total_touches': total_touches,
+            'avg_light_level': avg_light,
+            'time_in_session': time_in_session
+        })
+        result = self.predict_batch(np.array([[features[c] for c in FEATURE_COLUMNS]])).iloc[0]
         
-        # Prepara features
-        features = np.array([[duration, session_duration, total_touches, 
-                            avg_light, time_in_session]])
+        return {
+            'predicted_type': result['predicted_type'],
+            'probability_short': round(result['probability_short'], 3),
+            'probability_long': round(result['probability_long'], 3),
+            'confidence': round(result['confidence'], 3)
+        }
+    
+    def _feature_matrix(self, touches: Union[pd.DataFrame, np.ndarray]) -> pd.DataFrame:
+        """
+        Matriz de features (n x 5) a partir de DataFrame, array estruturado
+        ou array 2D já na ordem de FEATURE_COLUMNS
+        """
+        if isinstance(touches, np.ndarray) and touches.dtype.names is None:
+            matrix = np.asarray(touches, dtype=np.float64)
+            if matrix.ndim != 2 or matrix.shape[1] != len(FEATURE_COLUMNS):
+                raise ValueError(f"Array deve ter formato (n, {len(FEATURE_COLUMNS)})")
+            return pd.DataFrame(matrix, columns=FEATURE_COLUMNS)
         
-        # Normaliza
-        features_scaled = self.scaler.transform(features)
+        df = pd.DataFrame(touches)
+        if 'duration' not in df.columns:
+            raise ValueError("Coluna obrigatória ausente: duration")
         
-        # Prediz
-        prediction = self.model.predict(features_scaled)[0]
-        probabilities = self.model.predict_proba(features_scaled)[0]
+        # Mesma regra de resolve_features, vetorizada: só nulos recebem o padrão
+        features = {}
+        for column in FEATURE_COLUMNS:
+            values = df[column] if column in df.columns else np.nan
+            values = pd.Series(values, index=df.index, dtype=np.float64)
+            if column in FEATURE_DEFAULTS:
+                values = values.fillna(FEATURE_DEFAULTS[column])
+            features[column] = values
+        return pd.DataFrame(features, index=df.index)
+    
+    def predict_batch(self, touches: Union[pd.DataFrame, np.ndarray]) -> pd.DataFrame:
+        """
+        Prediz o tipo de vários toques de uma vez
+        Aceita DataFrame ou array estruturado com as colunas de FEATURE_COLUMNS
+        (features ausentes ou nulas recebem FEATURE_DEFAULTS) ou array 2D na mesma ordem
+        Normaliza uma vez e percorre a floresta uma vez (predict_proba); o rótulo sai das probabilidades
+        Retorna DataFrame com predicted_type, probability_short, probability_long e confidence
+        """
+        if self.model is None:
+            raise ValueError("Modelo não foi treinado. Execute train() primeiro.")
         
-        return {
-            'predicted_type': 'long' if prediction == 1 else 'short',
-            'probability_short': round(probabilities[0], 3),
-            'probability_long': round(probabilities[1], 3),
-            'confidence': round(max(probabilities), 3)
-        }
+        features = self._feature_matrix(touches)
+        if features.empty:
+            return pd.DataFrame({
+                'predicted_type': pd.Categorical([], categories=TOUCH_LABELS),
+                'probability_short': np.empty(0),
+                'probability_long': np.empty(0),
+                'confidence': np.empty(0)
+            })
+        
+        probabilities = self.model.predict_proba(self.scaler.transform(features))
+        
+        # Mesma regra de model.predict: classe de maior probabilidade (empate fica com a primeira)
+        classes = self.model.classes_
+        labels = classes[np.argmax(probabilities, axis=1)]
+        short_column = int(np.flatnonzero(classes == 0)[0])
+        long_column = int(np.flatnonzero(classes == 1)[0])
+        
+        return pd.DataFrame({
+            'predicted_type': pd.Categorical.from_codes(labels.astype(np.int8), TOUCH_LABELS),
+            'probability_short': probabilities[:, short_column],
+            'probability_long': probabilities[:, long_column],
+            'confidence': probabilities.max(axis=1)
+        }, index=features.index)
     
-    def save_model(self, filepath: str = 'models/touch_classifier.pkl'):
-        """Salva modelo treinado"""
+    def predict_events(self, event_ids) -> pd.DataFrame:
+        """
+        Prediz o tipo de toques já gravados, com as features do feature store
+        Resultado indexado por event_id; toques ainda não materializados ficam de fora
+        """
+        return self.predict_batch(self.features.features_for_events(event_ids))
+    
+    def save_model(self, filepath: str = 'models/touch_classifier.pkl', version: str = None):
+        """
+        Salva modelo treinado
+        Grava em arquivo temporário e troca de uma vez: quem lê o arquivo
+        (ex.: servidor de modelo) nunca vê um pickle pela metade
+        """
         if self.model is None:
             raise ValueError("Modelo não foi treinado")
         
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
         
+        self.version = version or datetime.now().strftime('%Y%m%d%H%M%S%f')
+        tmp_path = f"{filepath}.tmp"
         joblib.dump({
             'model': self.model,
-            'scaler': self.scaler
-        }, filepath)
+            'scaler': self.scaler,
+            'version': self.version,
+            'watermark': self.watermark
+        }, tmp_path)
+        os.replace(tmp_path, filepath)
+        
+        logger.info(f"Modelo salvo em {filepath} (versão {self.version})")
+    
+    def export_compiled(self, filepath: str = 'models/touch_classifier.npz') -> CompiledForest:
+        """
+        Exporta scaler e floresta para arrays NumPy (ver compiled_forest)
+        O arquivo gerado é avaliado sem scikit-learn
+        """
+        if self.model is None:
+            raise ValueError("Modelo não foi treinado")
+        
+        compiled = compile_forest(self.model, self.scaler, FEATURE_COLUMNS,
+                                  defaults=FEATURE_DEFAULTS, version=self.version)
+        compiled.save(filepath)
         
-        logger.info(f"Modelo salvo em {filepath}")
+        logger.info(f"Modelo compilado salvo em {filepath}")
+        return compiled
     
     def load_model(self, filepath: str = 'models/touch_classifier.pkl'):
         """Carrega modelo salvo"""
@@ -221,13 +537,33 @@ class TouchClassifier:
         loaded = joblib.load(filepath)
         self.model = loaded['model']
         self.scaler = loaded['scaler']
+        self.watermark = loaded.get('watermark')
+        # Modelos antigos não têm versão: usa a data de modificação do arquivo
+        self.version = loaded.get('version') or datetime.fromtimestamp(
+            os.path.getmtime(filepath)).strftime('%Y%m%d%H%M%S%f')
         
         logger.info(f"Modelo carregado de {filepath}")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Treino do classificador de toques')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Atualiza o modelo salvo só com os toques novos desde o último treino')
+    args = parser.parse_args()
+    
     classifier = TouchClassifier()
     
+    if args.incremental:
+        print("=== Treino Incremental do Modelo de Classificação ===\n")
+        results = classifier.train_incremental(DEFAULT_MODEL_PATH)
+        print(f"Modo: {results['mode']}")
+        print(f"Toques novos: {results['new_samples']}")
+        if 'accuracy' in results:
+            print(f"Acurácia: {results['accuracy']:.2%}")
+        print(f"Versão: {results['version']}")
+        classifier.db.close()
+        sys.exit(0)
+    
     print("=== Treinamento do Modelo de Classificação ===\n")
     
     # Treina modelo
@@ -252,7 +588,7 @@ if __name__ == "__main__":
         print(f"Confiança: {prediction['confidence']:.1%}")
     
     # Salva modelo
-    classifier.save_model('src/ml/models/touch_classifier.pkl')
+    classifier.save_model(DEFAULT_MODEL_PATH)
     
     classifier.db.close()
 
@@ -0,0 +1,256 @@
+# Gerador vetorizado de carga sintética (NumPy)
+
+import io
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# Códigos das colunas categóricas
+EVENT_TYPES = np.array(['touch', 'presence', 'ldr'])
+TOUCH_TYPES = np.array(['none', 'short', 'long'])
+EVENT_TOUCH, EVENT_PRESENCE, EVENT_LDR = 0, 1, 2
+NO_TOUCH_TYPE = -1
+
+SENSOR_EVENT_COLUMNS = ['session_id', 'totem_id', 'event_type', 'value',
+                        'duration', 'touch_type', 'timestamp']
+SESSION_COLUMNS = ['session_id', 'totem_id', 'started_at', 'ended_at',
+                   'duration_seconds', 'total_interactions']
+AGGREGATE_COLUMNS = ['session_id', 'totem_id', 'total_touches', 'short_touches',
+                     'long_touches', 'avg_presence_time', 'avg_light_level',
+                     'session_duration', 'interaction_score']
+
+
+class BulkSensorGenerator:
+    """
+    Gera eventos de N totens x M sessões de uma vez, em arrays colunares
+    Usa as mesmas probabilidades do SensorSimulator:
+    60% presença por segundo, 30% toque quando há presença,
+    toque de 0.1-2.0s (longo se > 1.0s) e LDR 600-1023 de dia / 100-400 à noite
+    """
+
+    def __init__(self, seed: int = None):
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+
+    def _session_ids(self, n: int) -> np.ndarray:
+        # UUIDs derivados do gerador para que a mesma seed gere os mesmos ids
+        raw = self.rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+        return np.array([str(uuid.UUID(bytes=row.tobytes(), version=4)) for row in raw], dtype=object)
+
+    def generate(self,
+                 totem_ids: List[str],
+                 sessions_per_totem: int,
+                 start: datetime,
+                 end: datetime,
+                 duration_seconds: Union[int, Tuple[int, int]] = 60) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        Gera um lote colunar
+        Sessões começam em instantes uniformes entre start e end
+        duration_seconds pode ser fixo ou um intervalo (min, max)
+        Retorna {'sessions': {...}, 'events': {...}, 'aggregates': {...}}
+        """
+        totem_ids = np.asarray(totem_ids, dtype=object)
+        n_sessions = len(totem_ids) * sessions_per_totem
+        rng = self.rng
+
+        # Sessões ---------------------------------------------------------
+        session_totem = np.repeat(np.arange(len(totem_ids)), sessions_per_totem)
+        span = max(int((end - start).total_seconds()), 1)
+        start_s = np.datetime64(start.replace(microsecond=0), 's')
+        started_at = start_s + rng.integers(0, span, n_sessions).astype('timedelta64[s]')
+
+        if isinstance(duration_seconds, tuple):
+            lengths = rng.integers(duration_seconds[0], duration_seconds[1] + 1, n_sessions)
+        else:
+            lengths = np.full(n_sessions, int(duration_seconds))
+
+        # Segundos (um por sessão x segundo) ------------------------------
+        total_seconds = int(lengths.sum())
+        second_session = np.repeat(np.arange(n_sessions), lengths)
+        session_offsets = np.cumsum(lengths) - lengths
+        second_in_session = np.arange(total_seconds) - np.repeat(session_offsets, lengths)
+        second_time = started_at[second_session] + second_in_session.astype('timedelta64[s]')
+
+        presence = rng.random(total_seconds) < 0.6
+        touch = presence & (rng.random(total_seconds) < 0.3)
+        touch_duration = np.where(touch, rng.uniform(0.1, 2.0, total_seconds), 0.0)
+        hours = (second_time.astype('datetime64[h]') - second_time.astype('datetime64[D]')).astype(int)
+        is_day = (hours >= 8) & (hours <= 18)
+        ldr = np.where(is_day,
+                       rng.integers(600, 1024, total_seconds),
+                       rng.integers(100, 401, total_seconds))
+
+        # Eventos por segundo: presença, [toque se houve presença], LDR
+        per_second = 2 + presence.astype(np.int64)
+        n_events = int(per_second.sum())
+        first = np.cumsum(per_second) - per_second
+        touch_pos = first[presence] + 1
+        ldr_pos = first + 1 + presence
+
+        event_second = np.empty(n_events, dtype=np.int64)
+        event_second[first] = np.arange(total_seconds)
+        event_second[touch_pos] = np.flatnonzero(presence)
+        event_second[ldr_pos] = np.arange(total_seconds)
+
+        event_type = np.empty(n_events, dtype=np.int8)
+        event_type[first] = EVENT_PRESENCE
+        event_type[touch_pos] = EVENT_TOUCH
+        event_type[ldr_pos] = EVENT_LDR
+
+        value = np.empty(n_events, dtype=np.int16)
+        value[first] = presence
+        value[touch_pos] = touch[presence]
+        value[ldr_pos] = ldr
+
+        duration = np.full(n_events, np.nan, dtype=np.float32)
+        duration[touch_pos] = np.round(touch_duration[presence], 2)
+
+        touch_type = np.full(n_events, NO_TOUCH_TYPE, dtype=np.int8)
+        touch_type[touch_pos] = np.where(
+            touch[presence],
+            np.where(touch_duration[presence] > 1.0, 2, 1),
+            0
+        )
+
+        event_session = second_session[event_second]
+
+        # Agregações por sessão (mesma regra do SessionAggregator) -------
+        t_short = np.bincount(second_session, weights=touch & (touch_duration <= 1.0), minlength=n_sessions)
+        t_long = np.bincount(second_session, weights=touch & (touch_duration > 1.0), minlength=n_sessions)
+        t_total = np.bincount(second_session, weights=touch, minlength=n_sessions)
+        t_dur = np.bincount(second_session, weights=np.round(touch_duration, 2), minlength=n_sessions)
+        p_count = np.bincount(second_session, weights=presence, minlength=n_sessions)
+        l_sum = np.bincount(second_session, weights=ldr, minlength=n_sessions)
+        avg_light = np.divide(l_sum, lengths, out=np.zeros(n_sessions), where=lengths > 0)
+        score = np.minimum(
+            np.minimum(t_total * 10, 50) + np.minimum(t_dur * 5, 30) + t_long * 5,
+            100
+        )
+
+        session_ids = self._session_ids(n_sessions)
+        session_totem_ids = totem_ids[session_totem]
+
+        return {
+            'sessions': {
+                'session_id': session_ids,
+                'totem_id': session_totem_ids,
+                'started_at': started_at,
+                'ended_at': started_at + lengths.astype('timedelta64[s]'),
+                'duration_seconds': lengths.astype(np.float64),
+                'total_interactions': t_total.astype(np.int32)
+            },
+            'events': {
+                'session_index': event_session,
+                'totem_index': session_totem[event_session],
+                'timestamp': second_time[event_second],
+                'event_type': event_type,
+                'value': value,
+                'duration': duration,
+                'touch_type': touch_type
+            },
+            'aggregates': {
+                'session_id': session_ids,
+                'totem_id': session_totem_ids,
+                'total_touches': t_total.astype(np.int32),
+                'short_touches': t_short.astype(np.int32),
+                'long_touches': t_long.astype(np.int32),
+                'avg_presence_time': p_count,
+                'avg_light_level': np.round(avg_light, 2),
+                'session_duration': np.round(t_dur, 2),
+                'interaction_score': np.round(score, 2)
+            },
+            'totem_ids': totem_ids
+        }
+
+    def iter_batches(self,
+                     totem_ids: List[str],
+                     sessions_per_totem: int,
+                     start: datetime,
+                     end: datetime,
+                     duration_seconds: Union[int, Tuple[int, int]] = 60,
+                     sessions_per_batch: int = 2000) -> Iterator[Dict[str, Dict[str, np.ndarray]]]:
+        """
+        Gera o mesmo volume de generate() em lotes de tamanho limitado
+        Permite alimentar um carregador em massa sem manter tudo em memória
+        """
+        per_batch = max(sessions_per_batch // max(len(totem_ids), 1), 1)
+        remaining = sessions_per_totem
+        while remaining > 0:
+            count = min(per_batch, remaining)
+            yield self.generate(totem_ids, count, start, end, duration_seconds)
+            remaining -= count
+
+    @staticmethod
+    def events_dataframe(batch: Dict) -> pd.DataFrame:
+        """Converte os eventos do lote para o formato da tabela sensor_events"""
+        events = batch['events']
+        touch_type = events['touch_type']
+        touch_labels = np.where(touch_type >= 0, TOUCH_TYPES[np.maximum(touch_type, 0)], None)
+
+        return pd.DataFrame({
+            'session_id': batch['sessions']['session_id'][events['session_index']],
+            'totem_id': batch['totem_ids'][events['totem_index']],
+            'event_type': EVENT_TYPES[events['event_type']],
+            'value': events['value'],
+            'duration': events['duration'],
+            'touch_type': touch_labels,
+            'timestamp': events['timestamp']
+        }, columns=SENSOR_EVENT_COLUMNS)
+
+    @staticmethod
+    def load_batch(batch: Dict, db, conn=None) -> int:
+        """
+        Grava o lote (totens, sessões, eventos e agregações) com COPY FROM STDIN
+        Tudo em uma transação; retorna o número de eventos gravados
+        """
+        events_df = BulkSensorGenerator.events_dataframe(batch)
+        sessions_df = pd.DataFrame(batch['sessions'], columns=SESSION_COLUMNS)
+        aggregates_df = pd.DataFrame(batch['aggregates'], columns=AGGREGATE_COLUMNS)
+
+        def copy(table: str, df: pd.DataFrame, target_conn):
+            buffer = io.StringIO()
+            df.to_csv(buffer, index=False, header=False, float_format='%.2f')
+            buffer.seek(0)
+            db.copy_csv(table, list(df.columns), buffer, conn=target_conn)
+
+        def load(target_conn):
+            with target_conn.cursor() as cursor:
+                cursor.executemany(
+                    """
+                    INSERT INTO totems (totem_id, location, status)
+                    VALUES (%s, 'FIAP - Campus', 'active')
+                    ON CONFLICT (totem_id) DO NOTHING
+                    """,
+                    [(t,) for t in batch['totem_ids']]
+                )
+            copy('sessions', sessions_df, target_conn)
+            copy('sensor_events', events_df, target_conn)
+            copy('session_aggregates', aggregates_df, target_conn)
+
+        if conn is not None:
+            load(conn)
+        else:
+            with db.connection() as own_conn:
+                load(own_conn)
+                own_conn.commit()
+
+        return len(events_df)
+
+
+if __name__ == "__main__":
+    import time
+
+    generator = BulkSensorGenerator(seed=42)
+    totems = [f"TOTEM-{i:03d}" for i in range(1, 101)]
+    end = datetime.now()
+
+    t0 = time.perf_counter()
+    batch = generator.generate(totems, 300, end - timedelta(days=30), end)
+    elapsed = time.perf_counter() - t0
+
+    print(f"Sessões: {len(batch['sessions']['session_id']):,}")
+    print(f"Eventos: {len(batch['events']['value']):,}")
+    print(f"Tempo: {elapsed:.2f}s")
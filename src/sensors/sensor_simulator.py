@@ -4,7 +4,7 @@ import random
 import time
 import json
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Callable, Dict, Iterator, List, Optional
 import uuid
 
 
@@ -97,9 +97,8 @@ class SensorSimulator:
         
         return events
     
-    def simulate_interaction_cycle(self, duration_seconds: int = 60, fast_mode: bool = True) -> List[Dict]:
-        all_events = []
-        
+    def iter_interaction_cycle(self, duration_seconds: int = 60, fast_mode: bool = True) -> Iterator[Dict]:
+        """Gera os eventos da sessão um a um, sem acumulá-los (não encerra a sessão)"""
         if not self.is_active or self.session_id is None:
             self.start_session()
         
@@ -108,18 +107,24 @@ class SensorSimulator:
             
             for second in range(duration_seconds):
                 event_time = base_time.replace(microsecond=0) + timedelta(seconds=second)
-                events = self.generate_all_sensors()
-                
-                for event in events:
+                for event in self.generate_all_sensors():
                     event['timestamp'] = event_time.isoformat()
-                
-                all_events.extend(events)
+                    yield event
         else:
             start_time = time.time()
             while time.time() - start_time < duration_seconds:
-                events = self.generate_all_sensors()
-                all_events.extend(events)
+                yield from self.generate_all_sensors()
                 time.sleep(1)
+    
+    def simulate_interaction_cycle(self, duration_seconds: int = 60, fast_mode: bool = True,
+                                   on_event: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        # on_event recebe cada evento assim que gerado (ex.: SessionAggregator.update)
+        all_events = []
+        
+        for event in self.iter_interaction_cycle(duration_seconds, fast_mode):
+            if on_event:
+                on_event(event)
+            all_events.append(event)
         
         session_end = self.end_session()
         all_events.append({
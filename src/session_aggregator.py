@@ -0,0 +1,72 @@
+# Agregação incremental de sessão
+
+from typing import Dict, Iterable
+
+
+class SessionAggregator:
+    """
+    Mantém as agregações de uma sessão em estado O(1)
+    Recebe um evento por vez (simulador, coletor ou endpoint de ingestão)
+    e gera a linha de session_aggregates a qualquer momento
+    """
+
+    def __init__(self, session_id: str, totem_id: str):
+        self.session_id = session_id
+        self.totem_id = totem_id
+
+        self.total_touches = 0
+        self.short_touches = 0
+        self.long_touches = 0
+        self.touch_duration_sum = 0.0
+        self.presence_count = 0
+        self.ldr_count = 0
+        self.ldr_sum = 0
+        self.events_seen = 0
+
+    def update(self, event: Dict):
+        """Atualiza o estado com um evento"""
+        event_type = event.get('event_type')
+        value = event.get('value')
+        self.events_seen += 1
+
+        if event_type == 'touch' and value == 1:
+            self.total_touches += 1
+            touch_type = event.get('touch_type')
+            if touch_type == 'short':
+                self.short_touches += 1
+            elif touch_type == 'long':
+                self.long_touches += 1
+            self.touch_duration_sum += event.get('duration') or 0
+        elif event_type == 'presence' and value == 1:
+            self.presence_count += 1
+        elif event_type == 'ldr':
+            self.ldr_count += 1
+            self.ldr_sum += value or 0
+
+    def update_many(self, events: Iterable[Dict]):
+        for event in events:
+            self.update(event)
+
+    @property
+    def interaction_score(self) -> float:
+        """Score de 0-100 (mesma fórmula usada pelo coletor)"""
+        base_score = min(self.total_touches * 10, 50)
+        duration_score = min(self.touch_duration_sum * 5, 30)
+        type_score = self.long_touches * 5
+        return min(base_score + duration_score + type_score, 100)
+
+    def snapshot(self) -> Dict:
+        """Linha provisória (ou final) de session_aggregates"""
+        avg_light = self.ldr_sum / self.ldr_count if self.ldr_count else 0
+
+        return {
+            'session_id': self.session_id,
+            'totem_id': self.totem_id,
+            'total_touches': self.total_touches,
+            'short_touches': self.short_touches,
+            'long_touches': self.long_touches,
+            'avg_presence_time': round(self.presence_count, 2),
+            'avg_light_level': round(avg_light, 2),
+            'session_duration': round(self.touch_duration_sum, 2),
+            'interaction_score': round(self.interaction_score, 2)
+        }